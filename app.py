@@ -151,4 +151,10 @@ async def get_productivity_insights():
     return await ai_service.get_productivity_insights()
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # Development: python app.py --reload; production: a preforked worker pool
+    import sys
+    if "--reload" in sys.argv:
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        from neurocrypt.ai_productivity.server import serve
+        serve("app:app", host="0.0.0.0", port=8000)
@@ -0,0 +1,89 @@
+"""
+Time `editor()` sessions on large files.
+
+Each case runs a real (non-interactive) editor command on a tempfile:
+
+* `quit`: exits without touching the file
+* `resave`: saves the file again with the same contents
+* `append`: adds a line at the end
+
+    python benchmark.py --size-mb 100 --repeat 3
+"""
+
+import argparse
+import functools
+import os
+import statistics
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import runs
+
+import editor
+
+EDITORS = {
+    'quit': 'true',
+    'resave': 'sh -c \'cp "$0" "$0.new" && mv "$0.new" "$0"\'',
+    'append': 'sh -c \'echo more >> "$0"\'',
+}
+
+
+def before(text: str, command: str) -> str:
+    """`editor()` as it was: write, edit, then always read the file back"""
+    fd, fname = tempfile.mkstemp()
+    os.close(fd)
+    path = Path(fname)
+    try:
+        path.write_text(text)
+        runs.call('{} "{}"'.format(command, path.resolve()))
+        return path.read_text()
+    finally:
+        path.unlink()
+
+
+def after(text: str, command: str, **kwargs: t.Any) -> t.Any:
+    result = editor.editor(text=text, editor=command, **kwargs)
+    if not isinstance(result, str):
+        result.close()
+    return result
+
+
+def timed(repeat: int, run: t.Callable[[], t.Any]) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    line = 'x' * 79 + '\n'
+    text = line * (args.size_mb * 1024 * 1024 // len(line))
+    variants: t.Dict[str, t.Dict[str, t.Any]] = {
+        'text': {},
+        'tmpfs': {'tmpfs': True},
+        'mmap': {'view': 'mmap'},
+        'stream': {'view': 'stream'},
+    }
+
+    print(f'{len(text) / 1e6:.0f} MB, median of {args.repeat}, seconds')
+    print(f'{"editor":<8} {"before":>8}' + ''.join(f'{v:>8}' for v in variants))
+    for name, command in EDITORS.items():
+        row = [timed(args.repeat, functools.partial(before, text, command))]
+        for kwargs in variants.values():
+            row.append(
+                timed(args.repeat, functools.partial(after, text, command, **kwargs))
+            )
+        print(f'{name:<8}' + ''.join(f'{seconds:>8.3f}' for seconds in row))
+
+
+if __name__ == '__main__':
+    main()
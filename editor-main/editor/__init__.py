@@ -41,8 +41,28 @@ If a filename is provided, then that file gets edited.
 
     # You can edit an existing file too, and select your own editor.
     comments2 = editor.editor(filename=FILE, editor='emacs -nw')
+
+### Example 3: Large files
+
+If the user quits without changing the file, `text` itself is returned.
+Checking the file's inode, size and modification time is enough to find
+that out, so an untouched file is never read back.
+
+For large results, `view='mmap'` returns a read-only memory map of the
+edited file, and `view='stream'` returns it opened as a text file.
+`tmpfs=True` puts the tempfile in `/dev/shm`, if that exists, so it never
+touches the disk.
+
+    export = editor.editor(text=BIG_EXPORT)
+    if export is BIG_EXPORT:
+        print('No changes')
+
+    with editor.editor(text=BIG_EXPORT, view='stream', tmpfs=True) as fp:
+        for line in fp:
+            ...
 """
 
+import mmap
 import os
 import platform
 import tempfile
@@ -57,15 +77,59 @@ __all__ = 'editor', 'default_editor'
 
 DEFAULT_EDITOR = 'vim'
 EDITORS = {'Windows': 'notepad'}
+TMPFS = '/dev/shm'
+
+# How far a freshly written file's mtime is set back, so that a write by the
+# editor always changes it, even on filesystems with coarse timestamps
+BACKDATE_NS = 10 * 10**9
+
+
+@t.overload
+def editor(
+    text: t.Optional[str] = None,
+    filename: t.Union[None, Path, str] = None,
+    editor: t.Optional[str] = None,
+    *,
+    view: None = None,
+    tmpfs: bool = False,
+    **kwargs: t.Any,
+) -> str: ...
+
+
+@t.overload
+def editor(
+    text: t.Optional[str] = None,
+    filename: t.Union[None, Path, str] = None,
+    editor: t.Optional[str] = None,
+    *,
+    view: t.Literal['mmap'],
+    tmpfs: bool = False,
+    **kwargs: t.Any,
+) -> t.Union[mmap.mmap, bytes]: ...
+
+
+@t.overload
+def editor(
+    text: t.Optional[str] = None,
+    filename: t.Union[None, Path, str] = None,
+    editor: t.Optional[str] = None,
+    *,
+    view: t.Literal['stream'],
+    tmpfs: bool = False,
+    **kwargs: t.Any,
+) -> t.TextIO: ...
 
 
-@xmod.xmod(mutable=True)  # type: ignore[misc]
+@xmod.xmod(mutable=True)  # type: ignore[untyped-decorator]
 def editor(
     text: t.Optional[str] = None,
     filename: t.Union[None, Path, str] = None,
     editor: t.Optional[str] = None,
+    *,
+    view: t.Optional[str] = None,
+    tmpfs: bool = False,
     **kwargs: t.Any,
-) -> str:
+) -> t.Union[str, mmap.mmap, bytes, t.TextIO]:
     """
     Open a text editor, block while the user edits, then return the results
 
@@ -73,6 +137,9 @@ def editor(
 
       text: A string which is written to the file before the editor is opened.
           If `None`, the file is left unchanged.
+          If the file ends up with the same contents, `text` itself is
+          returned. If its inode, size and modification time are unchanged,
+          it isn't even read back.
 
       filename: The name of the file to edit.
           If `None`, a temporary file is used.
@@ -80,32 +147,74 @@ def editor(
       editor: A string containing the command used to invoke the text editor.
          If `None`, use `editor.default_editor()`.
 
+      view: If `'mmap'`, return a read-only `mmap.mmap` of the file (or `b''`
+          if it is empty). If `'stream'`, return the file opened for reading
+          as text. Either way, the caller closes the result.
+          A tempfile is still deleted, except on Windows.
+
+      tmpfs: If true, create the tempfile in `/dev/shm` if it exists.
+
       kwargs: Arguments passed on to `subprocess.call()`"""
+    if view not in (None, 'mmap', 'stream'):
+        raise ValueError("view must be None, 'mmap' or 'stream'")
+
     editor = editor or default_editor()
     is_temp = not filename
     if filename is not None:
         fname = filename
     else:
-        fd, fname = tempfile.mkstemp()
+        tmpdir = TMPFS if tmpfs and os.path.isdir(TMPFS) else None
+        fd, fname = tempfile.mkstemp(dir=tmpdir)
         os.close(fd)
 
     try:
         path = Path(fname)
-        if text is not None:
-            path.write_text(text)
+        before = None if text is None else _write(path, text)
 
         cmd = '{} "{}"'.format(editor, path.resolve())
         runs.call(cmd, **kwargs)
-        return path.read_text()
+
+        if view == 'mmap':
+            return _map(path)
+        if view == 'stream':
+            return path.open()
+        if text is None or before is None:
+            return path.read_text()
+        if _stamp(path) == before:
+            return text
+
+        # Saved again, maybe without changes
+        result = path.read_text()
+        return text if result == text else result
 
     finally:
-        if is_temp:
+        # Windows can't delete a file that is still open
+        if is_temp and not (view and platform.system() == 'Windows'):
             try:
                 path.unlink()
             except Exception:
                 traceback.print_exc()
 
 
+def _write(path: Path, text: str) -> t.Tuple[int, int, int]:
+    path.write_text(text)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - BACKDATE_NS))
+    return _stamp(path)
+
+
+def _stamp(path: Path) -> t.Tuple[int, int, int]:
+    stat = path.stat()
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _map(path: Path) -> t.Union[mmap.mmap, bytes]:
+    with path.open('rb') as fp:
+        if not os.fstat(fp.fileno()).st_size:
+            return b''  # an empty file can't be mapped
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 def default_editor() -> str:
     """
     Return the default text editor.
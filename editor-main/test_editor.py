@@ -1,3 +1,5 @@
+import os
+import typing as t
 import unittest
 from pathlib import Path
 from unittest import mock
@@ -48,6 +50,77 @@ class TestEditor(unittest.TestCase):
         assert actual == expected
         call.assert_called_once()
 
+    def test_unchanged_is_not_read(self, call):
+        text = 'unchanged\n' * 1000
+        with mock.patch('editor.Path.read_text', autospec=True) as read_text:
+            actual = editor(text)
+        assert actual is text
+        read_text.assert_not_called()
+
+    def test_saved_without_changes(self, call):
+        call.side_effect = _edit(lambda s: s)
+        text = 'same\n'
+        assert editor(text) is text
+
+    def test_changed_same_size(self, call):
+        call.side_effect = _edit(lambda s: s.upper())
+        actual = editor('roses')
+        expected = 'ROSES'
+        assert actual == expected
+
+    def test_changed_in_place_same_size(self, call):
+        call.side_effect = _edit(lambda s: s.upper(), in_place=True)
+        actual = editor('roses')
+        expected = 'ROSES'
+        assert actual == expected
+
+    def test_mmap(self, call):
+        call.side_effect = _edit(lambda s: s + ' edited')
+        result = editor(TEST_CONTENT, view='mmap')
+        try:
+            assert result[:] == (TEST_CONTENT + ' edited').encode()
+        finally:
+            result.close()
+
+        call.side_effect = None
+        assert editor(view='mmap') == b''
+
+    def test_stream(self, call):
+        with editor(TEST_CONTENT, view='stream') as fp:
+            assert list(fp) == TEST_CONTENT.splitlines(keepends=True)
+
+    def test_bad_view(self, call):
+        with self.assertRaises(ValueError):
+            editor('X', view='list')  # type: ignore[call-overload]
+        call.assert_not_called()
+
+    @unittest.skipUnless(os.path.isdir(editor.TMPFS), 'no tmpfs')
+    def test_tmpfs(self, call):
+        assert editor('X', tmpfs=True) == 'X'
+        (cmd,), _ = call.call_args
+        assert '"{}/'.format(editor.TMPFS) in cmd
+
+
+def _edit(
+    change: t.Callable[[str], str], in_place: bool = False
+) -> t.Callable[..., None]:
+    """A stand-in editor that saves a changed copy, replacing the file"""
+
+    def call(cmd: str, **kwargs: t.Any) -> None:
+        path = Path(cmd.split('"')[1])
+        if in_place:
+            with path.open('r+b') as fp:
+                data = change(fp.read().decode()).encode()
+                fp.seek(0)
+                fp.write(data)
+            return
+
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(change(path.read_bytes().decode()).encode())
+        tmp.replace(path)
+
+    return call
+
 
 def main():
     print(editor.editor())
@@ -1,13 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+import asyncio
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv
-from .services.db_service import DatabaseService
+from .services.db_service import EXPORT_TABLES, DatabaseService, init_db, load_tenant_placements, router
 from .services.ai_service import AIService
-from .utils import generate_uuid, format_datetime, handle_error
-from datetime import datetime
+from .services.analytics import AnalyticsSnapshot
+from .services.change_feed import change_feed
+from .services.jobs import jobs
+from .services.late_results import late_results
+from .services.markets import RESOLUTIONS, market_feed, ohlcv
+from .services import ranking
+from .services.reminders import reminders
+from .services.ingest import ingestor
+from .services.shards import current_tenant
+from .services.worker_bus import worker_bus
+from .etag import NotModified, not_modified_handler, collection_etag, row_etag
+from .idempotency import IdempotencyMiddleware, idempotency_keys
+from .ratelimit import RateLimitMiddleware, rate_limiter
+from .telemetry import TelemetryMiddleware, render_prometheus
+from .tenants import TenantMiddleware
+from .warehouse import stream_parquet
+from .config import settings
+from .utils import generate_uuid, handle_error
+from datetime import datetime, timedelta
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +38,13 @@ app = FastAPI(
     version="0.1.0"
 )
 
+# Innermost so 429s still carry CORS headers and show up in request telemetry
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+# Outside the limiter: replaying a stored response never costs a token
+app.add_middleware(IdempotencyMiddleware, keys=idempotency_keys, client_key=rate_limiter.client_key)
+# Everything below runs as the request's tenant
+app.add_middleware(TenantMiddleware, header=settings.TENANT_HEADER)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -25,11 +52,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Retry-After", "Idempotent-Replayed"],
 )
+app.add_middleware(TelemetryMiddleware)
+app.add_exception_handler(NotModified, not_modified_handler)
 
 # Initialize services
 db_service = DatabaseService()
 ai_service = AIService()
+# One snapshot per tenant, built on its first analytics request, for the
+# ANALYTICS_MAX_TENANTS most recently used tenants
+analytics_snapshots: "OrderedDict[str, AnalyticsSnapshot]" = OrderedDict()
+
+def tenant_analytics() -> AnalyticsSnapshot:
+    tenant = current_tenant.get()
+    snapshot = analytics_snapshots.get(tenant)
+    if snapshot is None:
+        snapshot = analytics_snapshots[tenant] = AnalyticsSnapshot(db_service, settings.ANALYTICS_REFRESH_INTERVAL)
+        while len(analytics_snapshots) > settings.ANALYTICS_MAX_TENANTS:
+            analytics_snapshots.popitem(last=False)
+    analytics_snapshots.move_to_end(tenant)
+    return snapshot
+
+jobs.add("verify_goal_rollups", settings.GOAL_ROLLUP_VERIFY_INTERVAL, db_service.verify_goal_rollups)
+jobs.add(
+    "refresh_rank_scores", settings.RANK_SWEEP_INTERVAL,
+    lambda: db_service.refresh_rank_scores(timedelta(days=settings.RANK_SWEEP_HORIZON_DAYS)),
+)
+jobs.add("rescore_all_todos", settings.RANK_FULL_SWEEP_INTERVAL, db_service.refresh_rank_scores)
+jobs.add(
+    "compact_tombstones", settings.SYNC_COMPACTION_INTERVAL,
+    lambda: db_service.compact_tombstones(timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)),
+)
+# Tenant moves are announced on the worker bus; this catches processes that missed one
+jobs.add("load_tenant_placements", settings.TENANT_PLACEMENT_REFRESH_INTERVAL, load_tenant_placements)
+
+@app.on_event("startup")
+async def startup_event():
+    await init_db()
+    await rate_limiter.start()
+    await idempotency_keys.start()
+    worker_bus.start()
+    change_feed.start()
+    jobs.start()
+    if settings.ENABLE_REMINDERS:
+        reminders.start(db_service.iter_deadlines)
+    ingestor.start(db_service)
+    market_feed.start(db_service)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ingestor.stop()
+    await market_feed.stop()
+    await ai_service.stop()
+    await reminders.stop()
+    await jobs.stop()
+    await change_feed.stop()
+    worker_bus.stop()
+    await idempotency_keys.stop()
+    await rate_limiter.stop()
+    await router.dispose()
 
 # Models
 class TodoItem(BaseModel):
@@ -37,9 +119,10 @@ class TodoItem(BaseModel):
     title: str
     description: Optional[str] = None
     priority: Optional[int] = 1
-    due_date: Optional[str] = None
+    due_date: Optional[datetime] = None
     completed: bool = False
-    created_at: Optional[str] = None
+    goal_id: Optional[str] = None
+    created_at: Optional[datetime] = None
     ai_suggestions: Optional[List[str]] = Field(default_factory=list, description="AI-generated suggestions for the todo")
 
 class JournalEntry(BaseModel):
@@ -47,17 +130,19 @@ class JournalEntry(BaseModel):
     content: str
     mood: Optional[str] = None
     tags: List[str] = []
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
     ai_analysis: Optional[Dict[str, Any]] = Field(default_factory=dict, description="AI analysis of the journal entry")
 
 class Goal(BaseModel):
     id: Optional[str] = None
     title: str
     description: Optional[str] = None
-    target_date: Optional[str] = None
-    progress: float = 0.0
+    target_date: Optional[datetime] = None
+    progress: float = Field(0.0, description="Percent complete; derived from linked todos once there are any")
     status: str = "active"
-    created_at: Optional[str] = None
+    todo_count: int = 0
+    completed_count: int = 0
+    created_at: Optional[datetime] = None
     ai_suggestions: Optional[Dict[str, Any]] = Field(default_factory=dict, description="AI-generated suggestions for the goal")
 
 # Routes
@@ -69,17 +154,25 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # Todo endpoints
 @app.post("/todos/", response_model=TodoItem)
 async def create_todo(todo: TodoItem):
     try:
+        todo_id = generate_uuid()
+
         # Generate AI suggestions
-        suggestions = await ai_service.generate_todo_suggestions(todo.title, todo.description)
+        suggestions = await ai_service.generate_todo_suggestions(
+            todo.title, todo.description, result_key=("todos", todo_id)
+        )
         
         # Prepare todo data
         todo_data = todo.dict(exclude={'ai_suggestions'})
-        todo_data["id"] = generate_uuid()
-        todo_data["created_at"] = format_datetime(datetime.utcnow())
+        todo_data["id"] = todo_id
+        todo_data["created_at"] = datetime.utcnow()
         
         # Create todo in database
         created_todo = await db_service.create_todo(todo_data)
@@ -92,25 +185,51 @@ async def create_todo(todo: TodoItem):
     except Exception as e:
         raise handle_error(e)
 
-@app.get("/todos/", response_model=List[TodoItem])
-async def get_todos():
+@app.get("/todos/", response_model=List[TodoItem], dependencies=[Depends(collection_etag(db_service, "todos"))])
+async def get_todos(
+    response: Response,
+    sort: str = Query("created", regex="^(created|smart)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """``sort=smart`` pages by rank score; pass ``X-Next-Cursor`` back as ``cursor`` for the next page."""
     try:
-        todos = await db_service.get_todos()
+        if sort == "smart":
+            after = ranking.decode_cursor(cursor) if cursor else None
+            todos = await db_service.get_todos_ranked(limit, after)
+            if len(todos) == limit:
+                response.headers["X-Next-Cursor"] = ranking.encode_cursor(todos[-1].rank_score, todos[-1].id)
+        else:
+            todos = await db_service.get_todos(limit=limit)
         return [TodoItem(**todo.__dict__) for todo in todos]
     except Exception as e:
         raise handle_error(e)
 
+@app.get("/todos/{todo_id}", response_model=TodoItem, dependencies=[Depends(row_etag(db_service, "todos", "todo_id"))])
+async def get_todo(todo_id: str):
+    todo = await db_service.get_todo(todo_id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    return TodoItem(**todo.__dict__)
+
+@app.get("/todos/{todo_id}/suggestions")
+async def get_late_todo_suggestions(todo_id: str):
+    """LLM suggestions that arrived after the create response was served from the local analyzer."""
+    return _late_result("todos", todo_id)
+
 # Journal endpoints
 @app.post("/journal/", response_model=JournalEntry)
 async def create_journal_entry(entry: JournalEntry):
     try:
+        entry_id = generate_uuid()
+
         # Analyze journal entry with AI
-        analysis = await ai_service.analyze_journal_entry(entry.content)
+        analysis = await ai_service.analyze_journal_entry(entry.content, result_key=("journal_entries", entry_id))
         
         # Prepare entry data
         entry_data = entry.dict(exclude={'ai_analysis'})
-        entry_data["id"] = generate_uuid()
-        entry_data["created_at"] = format_datetime(datetime.utcnow())
+        entry_data["id"] = entry_id
+        entry_data["created_at"] = datetime.utcnow()
         
         # Create journal entry in database
         created_entry = await db_service.create_journal_entry(entry_data)
@@ -123,7 +242,7 @@ async def create_journal_entry(entry: JournalEntry):
     except Exception as e:
         raise handle_error(e)
 
-@app.get("/journal/", response_model=List[JournalEntry])
+@app.get("/journal/", response_model=List[JournalEntry], dependencies=[Depends(collection_etag(db_service, "journal_entries"))])
 async def get_journal_entries():
     try:
         entries = await db_service.get_journal_entries()
@@ -131,6 +250,24 @@ async def get_journal_entries():
     except Exception as e:
         raise handle_error(e)
 
+@app.get("/journal/{entry_id}", response_model=JournalEntry, dependencies=[Depends(row_etag(db_service, "journal_entries", "entry_id"))])
+async def get_journal_entry(entry_id: str):
+    entry = await db_service.get_journal_entry(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Journal entry not found")
+    return JournalEntry(**entry.__dict__)
+
+@app.get("/journal/{entry_id}/analysis")
+async def get_late_journal_analysis(entry_id: str):
+    """LLM analysis that arrived after the create response was served from the local analyzer."""
+    return _late_result("journal_entries", entry_id)
+
+def _late_result(entity: str, entity_id: str) -> dict:
+    item = late_results.get(entity, entity_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="No late AI result recorded")
+    return item
+
 # Goal endpoints
 @app.post("/goals/", response_model=Goal)
 async def create_goal(goal: Goal):
@@ -139,9 +276,9 @@ async def create_goal(goal: Goal):
         suggestions = await ai_service.suggest_goal_improvements(goal.title, goal.description)
         
         # Prepare goal data
-        goal_data = goal.dict(exclude={'ai_suggestions'})
+        goal_data = goal.dict(exclude={'ai_suggestions', 'todo_count', 'completed_count'})
         goal_data["id"] = generate_uuid()
-        goal_data["created_at"] = format_datetime(datetime.utcnow())
+        goal_data["created_at"] = datetime.utcnow()
         
         # Create goal in database
         created_goal = await db_service.create_goal(goal_data)
@@ -154,7 +291,7 @@ async def create_goal(goal: Goal):
     except Exception as e:
         raise handle_error(e)
 
-@app.get("/goals/", response_model=List[Goal])
+@app.get("/goals/", response_model=List[Goal], dependencies=[Depends(collection_etag(db_service, "goals"))])
 async def get_goals():
     try:
         goals = await db_service.get_goals()
@@ -162,6 +299,147 @@ async def get_goals():
     except Exception as e:
         raise handle_error(e)
 
+@app.get("/goals/{goal_id}", response_model=Goal, dependencies=[Depends(row_etag(db_service, "goals", "goal_id"))])
+async def get_goal(goal_id: str):
+    goal = await db_service.get_goal(goal_id)
+    if goal is None:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    return Goal(**goal.__dict__)
+
+@app.get("/goals/{goal_id}/todos", response_model=List[TodoItem])
+async def get_goal_todos(goal_id: str, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    if await db_service.get_row_version("goals", goal_id) is None:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    todos = await db_service.get_goal_todos(goal_id, skip, limit)
+    return [TodoItem(**todo.__dict__) for todo in todos]
+
+# Analytics
+@app.get("/analytics/todos/completion")
+async def todo_completion(period: str = "week"):
+    try:
+        analytics = tenant_analytics()
+        await analytics.refresh()
+        return analytics.todo_completion(period)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/analytics/journal/moods")
+async def mood_distribution(period: str = "week"):
+    try:
+        analytics = tenant_analytics()
+        await analytics.refresh()
+        return analytics.mood_distribution(period)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/analytics/goals/velocity")
+async def goal_velocity():
+    try:
+        analytics = tenant_analytics()
+        await analytics.refresh()
+        return analytics.goal_velocity()
+    except Exception as e:
+        raise handle_error(e)
+
+# Market data
+@app.get("/markets/{symbol}/ohlcv")
+async def get_ohlcv(
+    symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+    resolution: str = "auto", limit: int = Query(500, ge=1, le=5000),
+):
+    """OHLCV candles; ``resolution=auto`` picks the finest of 1m/1h/1d that fits ``start``..``end`` in ``limit``."""
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"resolution must be auto or one of {', '.join(RESOLUTIONS)}")
+    try:
+        return await ohlcv(db_service, symbol, start, end, resolution, limit)
+    except Exception as e:
+        raise handle_error(e)
+
+# Bulk export
+@app.get("/export/{table}.parquet")
+async def export_parquet(table: str, since: Optional[datetime] = None):
+    """Stream a table as Parquet, one row group at a time; ``since`` limits it to rows changed at or after then."""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    return StreamingResponse(
+        stream_parquet(db_service, table, since),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{table}.parquet"'},
+    )
+
+# Delta sync
+@app.get("/sync")
+async def sync(since: int = Query(0, ge=0), limit: int = Query(500, ge=1)):
+    """Rows changed and deleted after sequence ``since``; pass ``next_since`` back to fetch the next page."""
+    if since and since < await db_service.get_tombstone_floor():
+        # Deletes the client hasn't seen may already have been pruned
+        raise HTTPException(status_code=410, detail="Sync position too old; fetch a full snapshot with since=0")
+    try:
+        return await db_service.get_changes_since(since, min(limit, settings.SYNC_MAX_PAGE))
+    except Exception as e:
+        raise handle_error(e)
+
+# Change feed endpoints
+def _parse_entities(entities: Optional[str]) -> Optional[List[str]]:
+    return [entity.strip() for entity in entities.split(",") if entity.strip()] if entities else None
+
+@app.websocket("/changes/ws")
+async def changes_websocket(websocket: WebSocket, entities: Optional[str] = None):
+    try:
+        subscription = change_feed.subscribe(_parse_entities(entities))
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    # Reading alongside the feed notices a client that left while its entities were quiet
+    receiver = asyncio.ensure_future(websocket.receive())
+    getter = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    return
+                receiver = asyncio.ensure_future(websocket.receive())  # clients have nothing to say
+            if getter in done:
+                message = getter.result()
+                if message is None:
+                    # Fell too far behind: the client should reconnect and resync
+                    await websocket.close(code=1013)
+                    return
+                await websocket.send_text(message)
+                getter = asyncio.ensure_future(subscription.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        change_feed.unsubscribe(subscription)
+
+@app.get("/changes/sse")
+async def changes_sse(entities: Optional[str] = None):
+    try:
+        subscription = change_feed.subscribe(_parse_entities(entities))
+    except ValueError as e:
+        raise handle_error(e)
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), settings.CHANGE_FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    yield "event: error\ndata: slow consumer disconnected\n\n"
+                    return
+                yield f"data: {message}\n\n"
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    from .server import serve
+    serve("neurocrypt.ai_productivity.app:app", host="0.0.0.0", port=8000)
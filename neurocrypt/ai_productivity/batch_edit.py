@@ -0,0 +1,286 @@
+"""
+Edit many todos or journal entries in one editor session.
+
+    python -m neurocrypt.ai_productivity.batch_edit todos --open --limit 500
+    python -m neurocrypt.ai_productivity.batch_edit journal --editor "code --wait"
+
+The entries are rendered as one document, one block per entry, and opened with
+the bundled ``editor`` package. A block starts with an ``@@ <id> v<version>``
+line, followed by ``field: value`` lines and the free-text field last, indented
+by four spaces::
+
+    @@ 0b6e3c1e-... v3
+    title: Renew passport
+    priority: 2
+    due_date: 2024-06-01 09:00:00
+    completed: no
+    goal_id:
+    description:
+        Photos first.
+
+After the editor exits, each block is hashed and compared with the hash of the
+block as rendered, so unchanged entries are skipped without being parsed. Only
+the fields that differ in a changed block are sent, all in one
+``DatabaseService.bulk_update`` transaction. That transaction skips any entry
+whose version moved on while the editor was open. Removing a block leaves its
+entry as it was. If a block doesn't parse or links a goal that doesn't exist,
+the editor reopens with the errors listed at the top and nothing is written.
+Saving an empty document cancels the whole edit.
+"""
+import argparse
+import asyncio
+import hashlib
+import re
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from .services.db_service import DatabaseService, init_db
+
+COLLECTIONS = {"todos": "todos", "journal": "journal_entries"}
+
+# Editable fields in document order; the "text" field is always last
+FIELDS = {
+    "todos": (
+        ("title", "required"), ("priority", "int"), ("due_date", "datetime"), ("completed", "bool"),
+        ("goal_id", "optional"), ("description", "text"),
+    ),
+    "journal_entries": (("mood", "optional"), ("tags", "list"), ("content", "text")),
+}
+REQUIRED_TEXT = {"journal_entries"}
+
+INDENT = "    "
+HEADER = re.compile(r"^@@ (\S+) v(\d+)[ \t]*$", re.MULTILINE)
+TRUE, FALSE = ("yes", "y", "true", "1", "x", "done"), ("no", "n", "false", "0", "")
+
+PREAMBLE = """\
+# Editing {count} {collection}. Change any field, then save and quit.
+# Leave the '@@' lines alone. Deleting an entry's block leaves it unchanged;
+# saving an empty file cancels the edit. Lines starting with '#' outside the
+# indented text are ignored.
+"""
+
+# id -> (version, block digest, block text as rendered)
+Originals = Dict[str, Tuple[int, str, str]]
+
+def _digest(block: str) -> str:
+    return hashlib.blake2b(block.strip().encode(), digest_size=16).hexdigest()
+
+def _format(kind: str, value) -> str:
+    if value is None:
+        return ""
+    if kind == "bool":
+        return "yes" if value else "no"
+    if kind == "datetime":
+        return value.isoformat(sep=" ")
+    if kind == "list":
+        return ", ".join(value)
+    return str(value)
+
+def _parse(kind: str, name: str, raw: str):
+    if kind == "required":
+        if not raw:
+            raise ValueError(f"{name} can't be empty")
+        return raw
+    if kind == "optional":
+        return raw or None
+    if kind == "int":
+        try:
+            return int(raw) if raw else None
+        except ValueError:
+            raise ValueError(f"{name} must be a whole number, not {raw!r}")
+    if kind == "datetime":
+        try:
+            return datetime.fromisoformat(raw) if raw else None
+        except ValueError:
+            raise ValueError(f"{name} must look like 2024-06-01 or 2024-06-01 09:00, not {raw!r}")
+    if kind == "bool":
+        if raw.lower() in TRUE:
+            return True
+        if raw.lower() in FALSE:
+            return False
+        raise ValueError(f"{name} must be yes or no, not {raw!r}")
+    if kind == "list":
+        return [item.strip() for item in raw.split(",") if item.strip()]
+    raise AssertionError(kind)
+
+def render_entry(collection: str, row) -> str:
+    """One entry's block, header line included."""
+    lines = [f"@@ {row['id']} v{row['version']}"]
+    for name, kind in FIELDS[collection]:
+        if kind == "text":
+            lines.append(f"{name}:")
+            lines.extend((INDENT + line).rstrip() for line in (row[name] or "").splitlines())
+        else:
+            lines.append(f"{name}: {_format(kind, row[name])}".rstrip())
+    return "\n".join(lines) + "\n"
+
+def render_document(collection: str, rows) -> Tuple[str, Originals]:
+    """The document to edit, and what each block looked like for ``diff_document``."""
+    blocks, originals = [], {}
+    for row in rows:
+        block = render_entry(collection, row)
+        blocks.append(block)
+        originals[row["id"]] = (row["version"], _digest(block), block)
+    preamble = PREAMBLE.format(count=len(blocks), collection=collection.replace("_", " "))
+    return preamble + "\n" + "\n".join(blocks), originals
+
+def parse_block(collection: str, body: str) -> dict:
+    """The fields present in a block (without its header line); raises ValueError."""
+    kinds = dict(FIELDS[collection])
+    text_name = FIELDS[collection][-1][0]
+    fields, text = {}, None
+    for line in body.splitlines():
+        if text is not None:
+            text.append(line[len(INDENT):] if line.startswith(INDENT) else line.lstrip())
+            continue
+        if not line.strip() or line.startswith("#"):
+            continue
+        name, colon, value = line.partition(":")
+        name, value = name.strip(), value.strip()
+        if not colon or name not in kinds:
+            raise ValueError(f"unexpected line {line.strip()!r}")
+        if name == text_name:
+            text = [value] if value else []
+        else:
+            fields[name] = _parse(kinds[name], name, value)
+    if text is not None:
+        while text and not text[-1].strip():
+            text.pop()
+        content = "\n".join(text)
+        if not content and collection in REQUIRED_TEXT:
+            raise ValueError(f"{text_name} can't be empty")
+        fields[text_name] = content or None
+    return fields
+
+def diff_document(collection: str, text: str, originals: Originals) -> Tuple[Dict[str, dict], List[str]]:
+    """Changed fields per entry id, and one message per block that didn't parse."""
+    changes: Dict[str, dict] = {}
+    errors: List[str] = []
+    headers = list(HEADER.finditer(text))
+    seen = set()
+    for index, header in enumerate(headers):
+        entry_id = header.group(1)
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+        block = text[header.start():end]
+        original = originals.get(entry_id)
+        if original is None:
+            errors.append(f"{entry_id}: not one of the entries being edited (new entries can't be added here)")
+            continue
+        if entry_id in seen:
+            errors.append(f"{entry_id}: appears more than once")
+            continue
+        seen.add(entry_id)
+        if int(header.group(2)) != original[0]:
+            errors.append(f"{entry_id}: the version on the '@@' line was changed")
+            continue
+        if _digest(block) == original[1]:
+            continue
+        try:
+            edited = parse_block(collection, block[header.end() - header.start():])
+        except ValueError as e:
+            errors.append(f"{entry_id}: {e}")
+            continue
+        before = parse_block(collection, original[2].split("\n", 1)[1])
+        changed = {name: value for name, value in edited.items() if before.get(name) != value}
+        if changed:
+            changes[entry_id] = changed
+    return changes, errors
+
+def open_in_editor(text: str, command: Optional[str] = None) -> str:
+    import editor  # the bundled editor-main package
+
+    return editor.editor(text=text, editor=command)
+
+async def load_rows(
+    db_service: DatabaseService, collection: str, limit: Optional[int] = None, open_only: bool = False,
+) -> List[dict]:
+    """Entries oldest first; with ``open_only``, todos that aren't completed."""
+    rows: List[dict] = []
+    batches = db_service.iter_rows(collection, batch_size=min(limit or 5000, 5000))
+    try:
+        async for batch in batches:
+            rows.extend(dict(row) for row in batch if not (open_only and row.get("completed")))
+            if limit is not None and len(rows) >= limit:
+                del rows[limit:]
+                break
+    finally:
+        await batches.aclose()
+    return rows
+
+async def missing_goals(db_service: DatabaseService, changes: Dict[str, dict]) -> List[str]:
+    """One message per entry linked to a goal that doesn't exist."""
+    goal_ids = {fields["goal_id"] for fields in changes.values() if fields.get("goal_id")}
+    missing = {goal_id for goal_id in goal_ids if await db_service.get_goal(goal_id) is None}
+    return [
+        f"{entry_id}: goal {fields['goal_id']} does not exist"
+        for entry_id, fields in changes.items() if fields.get("goal_id") in missing
+    ]
+
+async def batch_edit(
+    db_service: DatabaseService, collection: str, rows: List[dict],
+    edit: Callable[[str], str] = open_in_editor,
+) -> dict:
+    """Run the editor over ``rows`` and write back what changed; returns counts for the report."""
+    document, originals = render_document(collection, rows)
+    stats = {"entries": len(rows), "changed": 0, "updated": 0, "conflicts": [], "cancelled": False}
+    while True:
+        document = edit(document)
+        if not document.strip():
+            stats["cancelled"] = True
+            return stats
+        start = time.perf_counter()
+        changes, errors = diff_document(collection, document, originals)
+        stats["diff_seconds"] = time.perf_counter() - start
+        if not errors and collection == "todos":
+            errors = await missing_goals(db_service, changes)
+        if not errors:
+            try:
+                await _write(db_service, collection, changes, originals, stats)
+                return stats
+            except ValueError as e:
+                # A goal deleted since the check; nothing was written
+                errors = [str(e)]
+        first = HEADER.search(document)
+        notes = "".join(f"# ERROR {error}\n" for error in errors)
+        document = notes + PREAMBLE.format(count=len(rows), collection=collection.replace("_", " ")) + "\n" + (
+            document[first.start():] if first else ""
+        )
+
+async def _write(
+    db_service: DatabaseService, collection: str, changes: Dict[str, dict], originals: Originals, stats: dict,
+) -> None:
+    stats["changed"] = len(changes)
+    if changes:
+        versions = {entry_id: originals[entry_id][0] for entry_id in changes}
+        updated, stats["conflicts"] = await db_service.bulk_update(collection, changes, versions)
+        stats["updated"] = len(updated)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("collection", choices=sorted(COLLECTIONS))
+    parser.add_argument("--limit", type=int, help="Edit at most this many entries, oldest first")
+    parser.add_argument("--open", action="store_true", help="Todos only: skip completed ones")
+    parser.add_argument("--editor", help="Editor command; defaults to $VISUAL, then $EDITOR")
+    args = parser.parse_args()
+    collection = COLLECTIONS[args.collection]
+
+    async def run():
+        await init_db()
+        db_service = DatabaseService()
+        rows = await load_rows(db_service, collection, args.limit, args.open and collection == "todos")
+        if not rows:
+            return None
+        return await batch_edit(db_service, collection, rows, lambda text: open_in_editor(text, args.editor))
+
+    stats = asyncio.run(run())
+    if stats is None:
+        print(f"No {args.collection} to edit")
+    elif stats["cancelled"]:
+        print("Empty document; nothing was changed")
+    else:
+        print(f"{stats['entries']} entries, {stats['changed']} changed, {stats['updated']} updated")
+        for entry_id in stats["conflicts"]:
+            print(f"  skipped {entry_id}: changed or deleted while the editor was open")
+
+if __name__ == "__main__":
+    main()
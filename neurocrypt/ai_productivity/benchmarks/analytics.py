@@ -0,0 +1,187 @@
+"""
+Analytics snapshot versus the ORM path: memory per row and query latency.
+
+Seeds a throwaway SQLite database, then answers the ``/analytics/*`` questions
+both from the columnar snapshot and by loading ORM rows and looping over them:
+
+    python -m neurocrypt.ai_productivity.benchmarks.analytics --rows 200000 --output analytics.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from .common import print_table, summarize, write_results
+
+MOODS = ["happy", "focused", "tired", "anxious", "calm", None]
+
+async def seed(db, rows: int, rng: random.Random) -> None:
+    start = datetime.utcnow() - timedelta(days=365)
+    seq = 0
+
+    def next_seq():
+        nonlocal seq
+        seq += 1
+        return seq
+
+    def when():
+        return start + timedelta(seconds=rng.randrange(365 * 86400))
+
+    async with db.engine.begin() as conn:
+        for offset in range(0, rows, 10000):
+            batch = range(offset, min(rows, offset + 10000))
+            await conn.execute(db.Goal.__table__.insert(), [
+                {"id": f"goal-{i}", "title": f"Goal {i}", "created_at": when(), "version": 1, "seq": next_seq(),
+                 "target_date": when() + timedelta(days=180), "progress": rng.uniform(0, 100),
+                 "status": rng.choice(["active", "active", "completed"]), "todo_count": 0, "completed_count": 0}
+                for i in batch if i % 20 == 0
+            ])
+            await conn.execute(db.Todo.__table__.insert(), [
+                {"id": f"todo-{i}", "title": f"Todo {i}", "created_at": when(), "version": 1, "seq": next_seq(),
+                 "completed": rng.random() < 0.6, "priority": rng.randrange(5)}
+                for i in batch
+            ])
+            await conn.execute(db.JournalEntry.__table__.insert(), [
+                {"id": f"entry-{i}", "content": "Benchmark entry", "created_at": when(), "version": 1,
+                 "seq": next_seq(), "mood": rng.choice(MOODS)}
+                for i in batch
+            ])
+        await conn.execute(db.SyncCounter.__table__.update().values(value=seq).where(db.SyncCounter.name == db.SEQUENCE))
+
+def _week(value: datetime) -> str:
+    return (value - timedelta(days=value.weekday())).date().isoformat()
+
+async def orm_completion(db):
+    async with db.async_session() as session:
+        todos = (await session.execute(db.select(db.Todo))).scalars().all()
+    totals, done = Counter(), Counter()
+    for todo in todos:
+        week = _week(todo.created_at)
+        totals[week] += 1
+        done[week] += bool(todo.completed)
+    return [{"period": w, "created": totals[w], "completed": done[w], "completion_rate": done[w] / totals[w]}
+            for w in sorted(totals)]
+
+async def orm_moods(db):
+    async with db.async_session() as session:
+        entries = (await session.execute(db.select(db.JournalEntry))).scalars().all()
+    moods = defaultdict(Counter)
+    for entry in entries:
+        moods[_week(entry.created_at)][entry.mood or "unknown"] += 1
+    return [{"period": w, "moods": dict(moods[w])} for w in sorted(moods)]
+
+async def orm_velocity(db):
+    async with db.async_session() as session:
+        goals = (await session.execute(db.select(db.Goal).where(db.Goal.status == "active"))).scalars().all()
+    now, result = datetime.utcnow(), []
+    for goal in goals:
+        elapsed = (now - goal.created_at).total_seconds() / 86400
+        velocity = goal.progress / elapsed if elapsed > 0 else 0.0
+        days_left = (100 - goal.progress) / velocity if velocity > 0 else None
+        result.append({"id": goal.id, "velocity_per_day": velocity, "projected_days_left": days_left})
+    return result
+
+async def _timed(results: dict, name: str, fn, iterations: int) -> None:
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    results[name] = summarize(samples, time.perf_counter() - start)
+
+async def _retained_bytes(fn) -> tuple:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = await fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, after - before
+
+async def run(rows: int, iterations: int, updates: int, seed_value: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from ..services import db_service as db
+    from ..services.analytics import AnalyticsSnapshot
+
+    await db.init_db()
+    await seed(db, rows, random.Random(seed_value))
+    service = db.DatabaseService()
+    total_rows = rows * 2 + rows // 20
+    results = {}
+
+    async def build():
+        snapshot = AnalyticsSnapshot(service)
+        await snapshot.refresh(force=True)
+        return snapshot
+
+    # Timed without tracemalloc, which slows allocation-heavy code severalfold
+    start = time.perf_counter()
+    snapshot = await build()
+    results["snapshot_build"] = {**summarize([(time.perf_counter() - start) * 1000]), "rows": total_rows}
+    _, snapshot_bytes = await _retained_bytes(build)
+
+    async def load_orm():
+        async with db.async_session() as session:
+            return [
+                (await session.execute(db.select(model))).scalars().all()
+                for model in (db.Todo, db.JournalEntry, db.Goal)
+            ]
+
+    orm_rows, orm_bytes = await _retained_bytes(load_orm)
+    del orm_rows
+    results["memory_per_row"] = {
+        **summarize([]),
+        "snapshot_array_bytes": snapshot.nbytes / total_rows,
+        "snapshot_bytes": snapshot_bytes / total_rows,
+        "orm_bytes": orm_bytes / total_rows,
+    }
+
+    def vectorized(query):
+        async def call():
+            await snapshot.refresh()
+            return getattr(snapshot, query)()
+        return call
+
+    await _timed(results, "snapshot:todo_completion", vectorized("todo_completion"), iterations)
+    await _timed(results, "snapshot:mood_distribution", vectorized("mood_distribution"), iterations)
+    await _timed(results, "snapshot:goal_velocity", vectorized("goal_velocity"), iterations)
+    orm_iterations = max(1, iterations // 10)
+    await _timed(results, "orm:todo_completion", lambda: orm_completion(db), orm_iterations)
+    await _timed(results, "orm:mood_distribution", lambda: orm_moods(db), orm_iterations)
+    await _timed(results, "orm:goal_velocity", lambda: orm_velocity(db), orm_iterations)
+
+    for i in range(updates):
+        await service.update_todo(f"todo-{i}", {"completed": True})
+    start = time.perf_counter()
+    await snapshot.refresh(force=True)
+    results["incremental_refresh"] = {**summarize([(time.perf_counter() - start) * 1000]), "changed_rows": updates}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="Todos and journal entries each (goals: rows/20)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=1000, help="Todo writes before the incremental refresh")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="analytics_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        results = asyncio.run(run(args.rows, args.iterations, args.updates, args.seed))
+
+    print_table({case: r for case, r in results.items() if case != "memory_per_row"})
+    memory = results["memory_per_row"]
+    print(
+        f"memory per row: snapshot arrays {memory['snapshot_array_bytes']:.1f} B, "
+        f"snapshot incl. id index {memory['snapshot_bytes']:.1f} B, ORM objects {memory['orm_bytes']:.1f} B"
+    )
+    write_results(args.output, "analytics", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Shared helpers for the benchmark scripts: percentiles, JSON reports, subprocess servers."""
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, math.ceil(q / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
+
+def summarize(samples_ms: List[float], elapsed_s: Optional[float] = None, errors: int = 0) -> Dict[str, float]:
+    """Latency percentiles and throughput for one benchmark case."""
+    ordered = sorted(samples_ms)
+    summary = {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+        "max_ms": ordered[-1] if ordered else 0.0,
+    }
+    if elapsed_s:
+        summary["throughput_rps"] = len(ordered) / elapsed_s
+    return summary
+
+def write_results(path: str, benchmark: str, config: dict, results: Dict[str, dict]) -> dict:
+    """Write a results document that ``compare.py`` understands."""
+    report = {
+        "benchmark": benchmark,
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return report
+
+def print_table(results: Dict[str, dict]) -> None:
+    print(f"{'case':<40} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>10} {'errors':>7}")
+    for case, r in results.items():
+        print(
+            f"{case:<40} {r['count']:>8} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+            f"{r.get('throughput_rps', 0):>10.1f} {r['errors']:>7}"
+        )
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+def spawn(args: List[str], port: int, env: Optional[dict] = None) -> subprocess.Popen:
+    """Start ``python <args>`` and wait until it accepts connections on ``port``."""
+    process = subprocess.Popen([sys.executable, *args], env={**os.environ, **(env or {})})
+    try:
+        wait_for_port(port)
+    except TimeoutError:
+        process.kill()
+        raise
+    return process
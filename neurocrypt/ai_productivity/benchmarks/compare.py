@@ -0,0 +1,52 @@
+"""
+Compare a benchmark results file against a baseline and fail on regressions.
+
+    python -m neurocrypt.ai_productivity.benchmarks.compare baseline.json current.json --tolerance 0.2
+
+Latency percentiles may grow, and throughput may shrink, by at most
+``tolerance`` (a fraction) before a case counts as a regression.
+"""
+import argparse
+import json
+import sys
+from typing import List
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+def find_regressions(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for case, base in baseline["results"].items():
+        now = current["results"].get(case)
+        if now is None:
+            regressions.append(f"{case}: missing from current results")
+            continue
+        for key in LATENCY_KEYS:
+            if base[key] and now[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{case}: {key} {base[key]:.3f} -> {now[key]:.3f}")
+        if base.get("throughput_rps") and now.get("throughput_rps", 0) < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{case}: throughput_rps {base['throughput_rps']:.1f} -> {now.get('throughput_rps', 0):.1f}")
+        if now["errors"] > base["errors"]:
+            regressions.append(f"{case}: errors {base['errors']} -> {now['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = find_regressions(baseline, current, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} across {len(baseline['results'])} cases")
+
+if __name__ == "__main__":
+    main()
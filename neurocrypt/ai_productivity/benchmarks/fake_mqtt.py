@@ -0,0 +1,239 @@
+"""
+A local MQTT 3.1.1 broker for tests and benchmarks.
+
+Implements the parts of the protocol the ingestion service relies on:
+
+- CONNECT with clean or persistent sessions (a second connection with the
+  same client id takes the session over)
+- SUBSCRIBE/UNSUBSCRIBE with ``+`` and ``#`` wildcards
+- PUBLISH at QoS 0 and 1, PUBACK, PINGREQ and DISCONNECT
+
+Like Mosquitto, each subscriber has at most ``max_inflight`` unacknowledged
+QoS 1 messages; the rest wait in its queue. A persistent session keeps its
+unacknowledged and queued messages while disconnected and gets them
+(unacknowledged ones flagged DUP) when it reconnects:
+
+    python -m neurocrypt.ai_productivity.benchmarks.fake_mqtt --port 1883
+
+There is no authentication, and no retained messages, wills or QoS 2.
+"""
+import argparse
+import asyncio
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+Message = Tuple[str, bytes]
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts, topic_parts = topic_filter.split("/"), topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or (part != "+" and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+def encode_string(value: str) -> bytes:
+    data = value.encode()
+    return len(data).to_bytes(2, "big") + data
+
+def decode_string(data: bytes, offset: int) -> Tuple[str, int]:
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+def packet(first: int, body: bytes = b"") -> bytes:
+    length, encoded = len(body), bytearray()
+    while True:
+        digit, length = length % 128, length // 128
+        encoded.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes([first]) + bytes(encoded) + body
+
+def publish_packet(topic: str, payload: bytes, qos: int = 0, packet_id: int = 0, dup: bool = False) -> bytes:
+    body = encode_string(topic) + (packet_id.to_bytes(2, "big") if qos else b"") + payload
+    return packet(PUBLISH << 4 | dup << 3 | qos << 1, body)
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    first = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+    while True:
+        digit = (await reader.readexactly(1))[0]
+        length += (digit & 0x7F) * multiplier
+        if digit < 0x80:
+            break
+        multiplier *= 128
+    return first, await reader.readexactly(length)
+
+class Session:
+    def __init__(self, client_id: str, clean: bool):
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions: Dict[str, int] = {}
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.inflight: "OrderedDict[int, Message]" = OrderedDict()
+        self.queued: Deque[Message] = deque()
+        self._next_id = 0
+
+    def next_id(self) -> int:
+        while True:
+            self._next_id = self._next_id % 65535 + 1
+            if self._next_id not in self.inflight:
+                return self._next_id
+
+class FakeBroker:
+    def __init__(self, max_inflight: int = 20, max_queued: int = 1_000_000):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.sessions: Dict[str, Session] = {}
+        self.published = 0
+        self.delivered = 0
+        self.redelivered = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Listen on ``port`` (0 picks a free one) and return the port."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        for session in self.sessions.values():
+            if session.writer is not None:
+                session.writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def drop(self, client_id: str) -> None:
+        """Cut a client's connection without a DISCONNECT, like a network failure."""
+        session = self.sessions.get(client_id)
+        if session is not None and session.writer is not None:
+            session.writer.transport.abort()
+
+    def publish(self, topic: str, payload: bytes, qos: int = 1) -> None:
+        """Route a message to every matching subscription, as if a client had published it."""
+        self.published += 1
+        for session in list(self.sessions.values()):
+            granted = [
+                sub_qos for topic_filter, sub_qos in session.subscriptions.items()
+                if topic_matches(topic_filter, topic)
+            ]
+            if granted:
+                self._deliver(session, (topic, payload), min(qos, max(granted)))
+
+    def _deliver(self, session: Session, message: Message, qos: int) -> None:
+        if qos == 0:
+            if session.writer is not None:
+                session.writer.write(publish_packet(*message))
+                self.delivered += 1
+            return
+        if session.writer is None or len(session.inflight) >= self.max_inflight:
+            if len(session.queued) >= self.max_queued:
+                session.queued.popleft()
+            session.queued.append(message)
+            return
+        self._send(session, message)
+
+    def _send(self, session: Session, message: Message, packet_id: Optional[int] = None) -> None:
+        dup = packet_id is not None
+        packet_id = packet_id or session.next_id()
+        session.inflight[packet_id] = message
+        session.writer.write(publish_packet(*message, qos=1, packet_id=packet_id, dup=dup))
+        self.delivered += 1
+        self.redelivered += dup
+
+    def _fill_window(self, session: Session) -> None:
+        while session.writer is not None and session.queued and len(session.inflight) < self.max_inflight:
+            self._send(session, session.queued.popleft())
+
+    def _connect(self, body: bytes, writer: asyncio.StreamWriter) -> Session:
+        _, offset = decode_string(body, 0)  # protocol name
+        flags = body[offset + 1]
+        client_id, _ = decode_string(body, offset + 4)
+        clean = bool(flags & 0x02)
+        session = self.sessions.get(client_id)
+        if session is not None and session.writer is not None:
+            session.writer.transport.abort()  # session takeover
+            session.writer = None
+        present = session is not None and not clean
+        if not present:
+            session = Session(client_id, clean)
+            self.sessions[client_id] = session
+        session.clean = clean
+        session.writer = writer
+        writer.write(packet(CONNACK << 4, bytes([int(present), 0])))
+        for packet_id, message in list(session.inflight.items()):
+            self._send(session, message, packet_id)
+        self._fill_window(session)
+        return session
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = None
+        try:
+            first, body = await read_packet(reader)
+            if first >> 4 != CONNECT:
+                return
+            session = self._connect(body, writer)
+            while True:
+                first, body = await read_packet(reader)
+                kind = first >> 4
+                if kind == PUBLISH:
+                    qos = (first >> 1) & 0x03
+                    topic, offset = decode_string(body, 0)
+                    if qos:
+                        packet_id, offset = body[offset:offset + 2], offset + 2
+                    self.publish(topic, body[offset:], qos)
+                    if qos:
+                        writer.write(packet(PUBACK << 4, packet_id))
+                elif kind == PUBACK:
+                    session.inflight.pop(int.from_bytes(body[:2], "big"), None)
+                    self._fill_window(session)
+                elif kind == SUBSCRIBE:
+                    offset, granted = 2, bytearray()
+                    while offset < len(body):
+                        topic_filter, offset = decode_string(body, offset)
+                        session.subscriptions[topic_filter] = min(body[offset], 1)
+                        granted.append(min(body[offset], 1))
+                        offset += 1
+                    writer.write(packet(SUBACK << 4, body[:2] + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = decode_string(body, offset)
+                        session.subscriptions.pop(topic_filter, None)
+                    writer.write(packet(UNSUBACK << 4, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP << 4))
+                elif kind == DISCONNECT:
+                    return
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session is not None and session.writer is writer:
+                session.writer = None
+                if session.clean:
+                    del self.sessions[session.client_id]
+            writer.close()
+
+async def serve(host: str, port: int, max_inflight: int) -> None:
+    broker = FakeBroker(max_inflight)
+    await broker.start(host, port)
+    print(f"Fake MQTT broker listening on {host}:{port}")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--max-inflight", type=int, default=20, help="Unacknowledged QoS 1 messages per subscriber")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.max_inflight))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+A local OpenAI-compatible server for benchmarks and offline tests.
+
+Serves ``POST /v1/chat/completions`` with a configurable latency distribution
+and error injection, so AI-backed routes can be measured without the real API:
+
+    python -m neurocrypt.ai_productivity.benchmarks.fake_openai --port 8099 --latency-ms 800 --error-rate 0.05
+
+``--model-latency gpt-4=1200,gpt-3.5-turbo=250`` sets a base latency per model,
+and ``--ms-per-token`` adds generation time for each completion token, of which
+a reply has ``--completion-tokens`` unless the request's ``max_tokens`` is lower.
+
+Point the app at it with ``OPENAI_API_BASE=http://127.0.0.1:8099/v1``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+JOURNAL_ANALYSIS = {
+    "mood": "positive",
+    "themes": ["work", "learning"],
+    "action_items": ["Plan tomorrow"],
+    "emotional_patterns": ["steady"],
+}
+
+def parse_model_latency(spec: str) -> Dict[str, float]:
+    """``"model=ms,..."`` to ``{model: ms}``."""
+    pairs = (item.split("=", 1) for item in filter(None, (part.strip() for part in spec.split(","))))
+    return {model.strip(): float(ms) for model, ms in pairs}
+
+def create_app(
+    latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+    model_latency: Optional[Dict[str, float]] = None, ms_per_token: float = 0.0, completion_tokens: int = 0,
+) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    rng = random.Random(seed)
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model", "gpt-4")
+        generated = min(completion_tokens, body.get("max_tokens") or completion_tokens)
+        base = (model_latency or {}).get(model, latency_ms)
+        delay = max(0.0, base + rng.uniform(-jitter_ms, jitter_ms) + ms_per_token * generated) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        if rng.random() < error_rate:
+            status = rng.choice((429, 500))
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error", "code": status}},
+                status_code=status,
+            )
+
+        prompt = " ".join(message["content"] for message in body["messages"])
+        if "JSON" in prompt:
+            content = json.dumps(JOURNAL_ANALYSIS)
+        else:
+            content = "1. Break it into subtasks\n2. Set a deadline\n3. Ask a teammate for review"
+        prompt_tokens = len(prompt) // 4
+        generated = generated or len(content) // 4
+        return {
+            "id": f"chatcmpl-fake-{app.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": generated,
+                "total_tokens": prompt_tokens + generated,
+            },
+        }
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-latency", default="", help="Per-model base latency, e.g. gpt-4=1200,gpt-3.5-turbo=250")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Generation time per completion token")
+    parser.add_argument("--completion-tokens", type=int, default=0, help="Reply length before max_tokens applies")
+    args = parser.parse_args()
+    app = create_app(
+        args.latency_ms, args.jitter_ms, args.error_rate, args.seed,
+        parse_model_latency(args.model_latency), args.ms_per_token, args.completion_tokens,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+MQTT ingestion throughput with and without group commit.
+
+Publishes device events through the local stand-in broker (fake_mqtt.py) to
+an ``Ingestor`` writing to a throwaway SQLite database, once per batch size.
+Batch size 1 is a commit per message. A share of the messages can be sent
+twice to exercise the duplicate check:
+
+    python -m neurocrypt.ai_productivity.benchmarks.ingest --messages 50000 --batch-sizes 1,100,500 --output ingest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from .common import print_table, summarize, write_results
+from .fake_mqtt import FakeBroker
+
+class _TimedDatabase:
+    """Times each group commit of the wrapped ``DatabaseService``."""
+
+    def __init__(self, db_service):
+        self.db_service = db_service
+        self.samples = []
+
+    async def insert_new(self, rows):
+        start = time.perf_counter()
+        try:
+            return await self.db_service.insert_new(rows)
+        finally:
+            self.samples.append((time.perf_counter() - start) * 1000)
+
+async def bench(messages: int, batch_size: int, duplicates: float, seed: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from ..services.db_service import DatabaseService, init_db
+    from ..services.ingest import Ingestor, parse_routes
+
+    await init_db()
+    broker = FakeBroker()
+    port = await broker.start()
+    db = _TimedDatabase(DatabaseService())
+    ingestor = Ingestor(
+        parse_routes("bench/+/events=journal"), f"mqtt://127.0.0.1:{port}", client_id=f"bench-{batch_size}",
+        batch_size=batch_size,
+    )
+    ingestor.start(db)
+    await asyncio.wait_for(ingestor.subscribed.wait(), 10)
+
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(messages):
+        key = rng.randrange(i) if i and rng.random() < duplicates else i
+        payloads.append(json.dumps({"id": f"{batch_size}-{key}", "message": f"Reading {key}", "device": "bench"}).encode())
+    start = time.perf_counter()
+    for payload in payloads:
+        broker.publish("bench/sensor/events", payload)
+        await asyncio.sleep(0)
+    while ingestor.stats["inserted"] + ingestor.stats["duplicates"] + ingestor.stats["rejected"] < messages:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await ingestor.stop()
+    await broker.stop()
+
+    # The samples are per commit; throughput is per message
+    result = summarize(db.samples, errors=ingestor.stats["rejected"])
+    result["throughput_rps"] = messages / elapsed
+    result.update({key: ingestor.stats[key] for key in ("inserted", "duplicates", "batches", "stalls")})
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--batch-sizes", default="1,100,500", help="Comma-separated; 1 commits every message")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Share of messages sent again")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="ingest_results.json")
+    args = parser.parse_args()
+
+    results = {}
+    # One database for all cases (the engine is created on first import); ids are prefixed per case
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+            results[f"batch_size:{batch_size}"] = asyncio.run(
+                bench(args.messages, batch_size, args.duplicates, args.seed)
+            )
+
+    print_table(results)
+    for case, result in results.items():
+        print(
+            f"{case:<40} {result['throughput_rps']:10.0f} msgs/s, {result['batches']} commits, "
+            f"{result['duplicates']} duplicates skipped, {result['stalls']} buffer stalls"
+        )
+    write_results(args.output, "ingest", vars(args), results)
+
+if __name__ == "__main__":
+    main()
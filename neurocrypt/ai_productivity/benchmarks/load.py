@@ -0,0 +1,163 @@
+"""
+Open-loop asyncio load generator for the FastAPI app.
+
+By default the app and a fake OpenAI server are started as subprocesses on a
+throwaway SQLite database with rate limiting off (``--rate-limit`` keeps the
+configured limits); pass ``--url`` to drive an already running deployment.
+Requests are issued on a fixed schedule and latency is measured from the time a
+request was *due*, so a stalled server cannot hide its queueing delay.
+
+    python -m neurocrypt.ai_productivity.benchmarks.load --rps 200 --duration 30 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+import httpx
+from .common import free_port, print_table, spawn, summarize, write_results
+
+# (name, weight); names double as result keys
+SCENARIOS = [
+    ("GET /todos/", 40),
+    ("GET /todos/{id}", 20),
+    ("POST /todos/", 10),
+    ("GET /journal/", 15),
+    ("POST /journal/", 5),
+    ("GET /goals/", 10),
+]
+
+def uvicorn_command(port: int) -> List[str]:
+    return ["-m", "uvicorn", "neurocrypt.ai_productivity.app:app", "--port", str(port), "--log-level", "warning"]
+
+@contextmanager
+def local_stack(
+    ai_latency_ms: float = 0.0,
+    ai_error_rate: float = 0.0,
+    app_command: Callable[[int], List[str]] = uvicorn_command,
+    env: Optional[dict] = None,
+) -> Iterator[str]:
+    """Start the fake OpenAI server and the app on a scratch database; yield the app's base URL.
+
+    Rate limiting is off unless ``env`` sets ``RATE_LIMIT_BACKEND``, so the app is
+    measured rather than the limiter.
+    """
+    ai_port, app_port = free_port(), free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            processes.append(spawn([
+                "-m", "neurocrypt.ai_productivity.benchmarks.fake_openai", "--port", str(ai_port),
+                "--latency-ms", str(ai_latency_ms), "--error-rate", str(ai_error_rate),
+            ], ai_port))
+            processes.append(spawn(app_command(app_port), app_port, env={
+                "DATABASE_URL": f"sqlite+aiosqlite:///{tmp}/load.db",
+                "SQL_ECHO": "false",
+                "OPENAI_API_KEY": "sk-benchmark",
+                "OPENAI_API_BASE": f"http://127.0.0.1:{ai_port}/v1",
+                "RATE_LIMIT_BACKEND": "none",
+                **(env or {}),
+            }))
+            yield f"http://127.0.0.1:{app_port}"
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=30)
+
+def _request(client: httpx.AsyncClient, scenario: str, todo_ids: List[str], rng: random.Random):
+    if scenario == "GET /todos/{id}":
+        return client.get(f"/todos/{rng.choice(todo_ids)}")
+    method, path = scenario.split(" ", 1)
+    if method == "GET":
+        return client.get(path)
+    if path == "/todos/":
+        return client.post(path, json={"title": f"Load todo {rng.random():.6f}", "priority": rng.randint(1, 5)})
+    return client.post(path, json={"content": "Load test journal entry about a productive day.", "tags": ["load"]})
+
+async def run_load(
+    base_url: str, rps: float, duration: float, max_in_flight: int = 1000,
+    scenarios=SCENARIOS, seed: int = 0, seed_todos: int = 20,
+) -> Dict[str, dict]:
+    """Drive ``base_url`` at ``rps`` for ``duration`` seconds; return per-scenario summaries."""
+    rng = random.Random(seed)
+    names = [name for name, _ in scenarios]
+    weights = [weight for _, weight in scenarios]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    in_flight = asyncio.Semaphore(max_in_flight)
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        todo_ids = []
+        for i in range(seed_todos):
+            response = await client.post("/todos/", json={"title": f"Seed todo {i}"})
+            response.raise_for_status()
+            todo_ids.append(response.json()["id"])
+
+        async def fire(scenario: str, due: float) -> None:
+            try:
+                response = await _request(client, scenario, todo_ids, rng)
+                if response.status_code >= 400:
+                    errors[scenario] += 1
+                    return
+            except httpx.HTTPError:
+                errors[scenario] += 1
+                return
+            finally:
+                in_flight.release()
+            samples[scenario].append((time.perf_counter() - due) * 1000)
+
+        tasks = []
+        start = time.perf_counter()
+        total = int(rps * duration)
+        for i in range(total):
+            due = start + i / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            scenario = rng.choices(names, weights)[0]
+            if in_flight.locked():
+                # Over the in-flight cap: count as shed rather than silently slowing the schedule
+                errors[scenario] += 1
+                continue
+            await in_flight.acquire()
+            tasks.append(asyncio.ensure_future(fire(scenario, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    results = {name: summarize(samples[name], elapsed, errors[name]) for name in names}
+    everything = [sample for name in names for sample in samples[name]]
+    results["all"] = summarize(everything, elapsed, sum(errors.values()))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--url", help="Target an already running app instead of starting one")
+    parser.add_argument("--rps", type=float, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--ai-latency-ms", type=float, default=50)
+    parser.add_argument("--ai-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the app's configured rate limits on")
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args()
+
+    async def drive(url):
+        return await run_load(url, args.rps, args.duration, args.max_in_flight, seed=args.seed)
+
+    if args.url:
+        results = asyncio.run(drive(args.url))
+    else:
+        env = {"RATE_LIMIT_BACKEND": os.environ.get("RATE_LIMIT_BACKEND", "auto")} if args.rate_limit else None
+        with local_stack(args.ai_latency_ms, args.ai_error_rate, env=env) as url:
+            results = asyncio.run(drive(url))
+
+    print_table(results)
+    write_results(args.output, "load", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Market tick ingestion and OHLCV query benchmark.
+
+Writes a recorded tick file (a random walk per symbol), replays it into a
+throwaway SQLite database through ``MarketFeed`` and reports ticks/sec, then
+times ``GET /markets/{symbol}/ohlcv``-style range reads against the rollups
+and, for comparison, the same candles computed from the raw ticks:
+
+    python -m neurocrypt.ai_productivity.benchmarks.markets --ticks 1000000 --symbols 10 --output markets.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from .common import print_table, summarize, write_results
+
+START_MS = 1_700_000_000_000
+
+def write_recording(path: str, ticks: int, symbols: int, interval_ms: int, seed: int) -> None:
+    rng = random.Random(seed)
+    prices = [100.0 * (i + 1) for i in range(symbols)]
+    with open(path, "w") as f:
+        f.write("ts,symbol,price,size\n")
+        for i in range(ticks):
+            index = rng.randrange(symbols)
+            prices[index] *= 1 + rng.gauss(0, 0.0005)
+            f.write(f"{START_MS + i * interval_ms},SYM{index},{prices[index]:.4f},{rng.random():.4f}\n")
+
+async def bench_ingest(path: str, batch_size: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from ..services.db_service import DatabaseService, init_db
+    from ..services.markets import MarketFeed, load_source
+
+    await init_db()
+    db = DatabaseService()
+    samples = []
+
+    class TimedDatabase:
+        get_tick_high_water = db.get_tick_high_water
+
+        async def append_ticks(self, ticks, candles):
+            start = time.perf_counter()
+            await db.append_ticks(ticks, candles)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    feed = MarketFeed(load_source(path, batch_size=batch_size))
+    start = time.perf_counter()
+    feed.start(TimedDatabase())
+    await feed.done.wait()
+    elapsed = time.perf_counter() - start
+    await feed.stop()
+    # The samples are per batch; throughput is per tick
+    result = summarize(samples)
+    result["throughput_rps"] = feed.ticks / elapsed
+    result["ticks"] = feed.ticks
+    return result
+
+async def bench_queries(span_ms: int, queries: int, seed: int) -> dict:
+    from sqlalchemy import func, select
+    from ..services.db_service import DatabaseService, Tick, async_session
+    from ..services.markets import RESOLUTIONS, ohlcv
+
+    db = DatabaseService()
+    rng = random.Random(seed)
+    results = {}
+    for name, points in (("1m", 60), ("1m", 500), ("1h", 500), ("1d", 30)):
+        window = RESOLUTIONS[name] * 1000 * points
+        if window > span_ms and name != "1d":
+            continue
+        samples = []
+        for _ in range(queries):
+            start_ms = START_MS + rng.randrange(max(1, span_ms - window))
+            start = time.perf_counter()
+            await ohlcv(db, "SYM0", datetime.utcfromtimestamp(start_ms / 1000), resolution=name, limit=points,
+                        end=datetime.utcfromtimestamp((start_ms + window) / 1000))
+            samples.append((time.perf_counter() - start) * 1000)
+        results[f"rollup:{name}x{points}"] = summarize(samples)
+
+        # The same candles aggregated from the raw ticks on every request
+        bucket = Tick.ts - Tick.ts % (RESOLUTIONS[name] * 1000)
+        samples = []
+        for _ in range(max(1, queries // 10)):
+            start_ms = START_MS + rng.randrange(max(1, span_ms - window))
+            start = time.perf_counter()
+            async with async_session() as session:
+                await session.execute(
+                    select(bucket, func.min(Tick.price), func.max(Tick.price), func.sum(Tick.size), func.count())
+                    .where(Tick.symbol == "SYM0", Tick.ts >= start_ms, Tick.ts < start_ms + window)
+                    .group_by(bucket)
+                )
+            samples.append((time.perf_counter() - start) * 1000)
+        results[f"raw_ticks:{name}x{points}"] = summarize(samples)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--ticks", type=int, default=1_000_000)
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--interval-ms", type=int, default=50, help="Recorded time between consecutive ticks")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200, help="Range reads per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="markets_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        recording = os.path.join(tmp, "ticks.csv")
+        write_recording(recording, args.ticks, args.symbols, args.interval_ms, args.seed)
+
+        async def run():
+            results = {"ingest:replay": await bench_ingest(recording, args.batch_size)}
+            results.update(await bench_queries(args.ticks * args.interval_ms, args.queries, args.seed))
+            return results
+
+        results = asyncio.run(run())
+
+    print_table(results)
+    print(f"ingest: {results['ingest:replay']['throughput_rps']:.0f} ticks/s")
+    write_results(args.output, "markets", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Micro-benchmarks for every DatabaseService method, the response serialization path
+and the local analyzer that answers AI requests over their latency budget.
+
+Runs against a throwaway SQLite database, never the on-disk ``neurocrypt.db``:
+
+    python -m neurocrypt.ai_productivity.benchmarks.micro --iterations 500 --output micro.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from .common import print_table, summarize, write_results
+
+ENTITIES = {
+    "todo": lambda i: {
+        "id": f"todo-{i}", "title": f"Todo {i}", "description": "Benchmark todo",
+        "priority": i % 5, "due_date": datetime.utcnow() + timedelta(days=i % 30),
+    },
+    "journal_entry": lambda i: {
+        "id": f"entry-{i}", "content": "Benchmark journal entry. " * 20, "mood": "focused", "tags": ["bench"],
+    },
+    "goal": lambda i: {
+        "id": f"goal-{i}", "title": f"Goal {i}", "description": "Benchmark goal",
+        "target_date": datetime.utcnow() + timedelta(days=90),
+    },
+}
+
+PLURALS = {"todo": "todos", "journal_entry": "journal_entries", "goal": "goals"}
+
+async def _bench(results: dict, name: str, fn, calls) -> None:
+    samples = []
+    start = time.perf_counter()
+    for args in calls:
+        t = time.perf_counter()
+        await fn(*args)
+        samples.append((time.perf_counter() - t) * 1000)
+    results[name] = summarize(samples, time.perf_counter() - start)
+
+async def run(iterations: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from fastapi.encoders import jsonable_encoder
+    from .. import app as app_module
+    from ..services import db_service as db
+    from ..services import local_analyzer
+
+    await db.init_db()
+    service = db.DatabaseService()
+    results = {}
+    ids = range(iterations)
+
+    for entity, factory in ENTITIES.items():
+        plural = PLURALS[entity]
+        await _bench(results, f"create_{entity}", getattr(service, f"create_{entity}"), [(factory(i),) for i in ids])
+        await _bench(results, f"get_{plural}", getattr(service, f"get_{plural}"), [(0, 100)] * iterations)
+        await _bench(results, f"get_{entity}", getattr(service, f"get_{entity}"), [(factory(i)["id"],) for i in ids])
+        await _bench(
+            results, f"get_row_version[{plural}]", service.get_row_version,
+            [(plural, factory(i)["id"]) for i in ids],
+        )
+        await _bench(
+            results, f"update_{entity}", getattr(service, f"update_{entity}"),
+            [(factory(i)["id"], {"description": f"updated {i}"}) for i in ids],
+        )
+
+    # Serialization: ORM rows -> response models -> JSON, as the list routes do
+    serializers = {"todos": app_module.TodoItem, "journal_entries": app_module.JournalEntry, "goals": app_module.Goal}
+    for plural, model in serializers.items():
+        rows = await getattr(service, f"get_{plural}")(0, 100)
+
+        async def serialize(rows=rows, model=model):
+            json.dumps(jsonable_encoder([model(**row.__dict__) for row in rows]))
+
+        await _bench(results, f"serialize_100_{plural}", serialize, [()] * iterations)
+
+    # Local fallback analysis: one entry at a time and as a vectorized batch of 100
+    entries = [ENTITIES["journal_entry"](i)["content"] + " Need to call Sam about the deadline." for i in range(100)]
+
+    async def analyze(text):
+        local_analyzer.analyze_journal_entry(text)
+
+    async def analyze_batch():
+        local_analyzer.analyze_journal_batch(entries)
+
+    async def suggest(title):
+        local_analyzer.suggest_subtasks(title, "Write the docs and email the team")
+
+    await _bench(results, "local_analyze_journal_entry", analyze, [(entries[i % 100],) for i in ids])
+    await _bench(results, "local_analyze_journal_batch_100", analyze_batch, [()] * iterations)
+    await _bench(results, "local_suggest_subtasks", suggest, [(f"Fix bug {i} and review PR",) for i in ids])
+
+    for entity in ENTITIES:
+        await _bench(
+            results, f"delete_{entity}", getattr(service, f"delete_{entity}"),
+            [(ENTITIES[entity](i)["id"],) for i in ids],
+        )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", default="micro_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        results = asyncio.run(run(args.iterations))
+
+    print_table(results)
+    write_results(args.output, "micro", vars(args), results)
+
+if __name__ == "__main__":
+    main()
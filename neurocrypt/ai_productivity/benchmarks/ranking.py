@@ -0,0 +1,118 @@
+"""
+Smart todo ordering: keyset pages off the rank index versus sorting in Python.
+
+Seeds a throwaway SQLite database with scored todos, then times the first and a
+deep ``sort=smart`` page, the same deep page with OFFSET, scoring and sorting
+every open todo per request, the write path, and the rescoring sweeps:
+
+    python -m neurocrypt.ai_productivity.benchmarks.ranking --todos 1000000 --output ranking.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from .common import print_table, summarize, write_results
+
+async def seed(db, ranking, todos: int, rng: random.Random) -> None:
+    now = datetime.utcnow()
+    async with db.engine.begin() as conn:
+        for offset in range(0, todos, 10000):
+            rows = []
+            for i in range(offset, min(todos, offset + 10000)):
+                row = {
+                    "id": f"todo-{i:07d}", "title": f"Todo {i}", "version": 1, "seq": i + 1,
+                    "created_at": now - timedelta(seconds=rng.randrange(365 * 86400)),
+                    "due_date": now + timedelta(hours=rng.uniform(-24 * 60, 24 * 60)) if rng.random() < 0.5 else None,
+                    "completed": rng.random() < 0.6, "priority": rng.randrange(1, 6), "goal_id": None,
+                }
+                row["rank_score"] = ranking.score(SimpleNamespace(**row), now)
+                rows.append(row)
+            await conn.execute(db.Todo.__table__.insert(), rows)
+        await conn.execute(
+            db.SyncCounter.__table__.update().values(value=todos).where(db.SyncCounter.name == db.SEQUENCE)
+        )
+
+async def python_sorted_page(db, ranking, limit: int) -> list:
+    """What ``sort=smart`` costs without the persisted score: score every open todo per request."""
+    columns = [getattr(db.Todo, name) for name in ranking.SCORE_COLUMNS]
+    async with db.async_session() as session:
+        rows = (await session.execute(db.select(db.Todo.id, *columns).where(db.Todo.completed.isnot(True)))).all()
+    now = datetime.utcnow()
+    return sorted(rows, key=lambda row: (ranking.score(row, now), row.id), reverse=True)[:limit]
+
+async def offset_page(db, offset: int, limit: int) -> list:
+    async with db.async_session() as session:
+        result = await session.execute(
+            db.select(db.Todo).where(db.Todo.rank_score.isnot(None))
+            .order_by(db.Todo.rank_score.desc(), db.Todo.id.desc()).offset(offset).limit(limit)
+        )
+        return result.scalars().all()
+
+async def _timed(results: dict, name: str, fn, iterations: int, **extra) -> None:
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    results[name] = {**summarize(samples, time.perf_counter() - start), **extra}
+
+async def run(todos: int, page_size: int, iterations: int, writes: int, seed_value: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from ..services import db_service as db
+    from ..services import ranking
+
+    await db.init_db()
+    rng = random.Random(seed_value)
+    start = time.perf_counter()
+    await seed(db, ranking, todos, rng)
+    print(f"seeded {todos} todos in {time.perf_counter() - start:.1f}s")
+    service = db.DatabaseService()
+    results = {}
+
+    depth = todos // 2
+    middle = (await offset_page(db, depth - 1, 1))[0]
+    after = (middle.rank_score, middle.id)
+    await _timed(results, "keyset:first_page", lambda: service.get_todos_ranked(page_size), iterations)
+    await _timed(results, "keyset:deep_page", lambda: service.get_todos_ranked(page_size, after), iterations, depth=depth)
+    slow_iterations = max(1, iterations // 20)
+    await _timed(results, "offset:deep_page", lambda: offset_page(db, depth, page_size), slow_iterations, depth=depth)
+    await _timed(results, "python_sort:first_page", lambda: python_sorted_page(db, ranking, page_size), slow_iterations)
+
+    ids = [f"todo-{rng.randrange(todos):07d}" for _ in range(writes)]
+
+    async def update():
+        await service.update_todo(ids.pop(), {"priority": rng.randrange(1, 6)})
+
+    await _timed(results, "write:update_todo", update, writes)
+
+    for name, horizon in (("sweep:horizon", timedelta(days=14)), ("sweep:full", None)):
+        start = time.perf_counter()
+        changed = await service.refresh_rank_scores(horizon, batch_size=5000)
+        results[name] = {**summarize([(time.perf_counter() - start) * 1000]), "rescored_rows": changed}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--todos", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=500, help="Todo updates timed on the write path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="ranking_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        results = asyncio.run(run(args.todos, args.page_size, args.iterations, args.writes, args.seed))
+
+    print_table(results)
+    write_results(args.output, "ranking", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Rate limiter overhead per request.
+
+Drives the ASGI middleware in-process around a no-op app, so the difference
+from calling the app directly is the limiter's own cost. Cases cover one hot
+client, many distinct clients, rejected requests and, with a reachable Redis,
+the Lua-script backend:
+
+    python -m neurocrypt.ai_productivity.benchmarks.ratelimit --requests 200000 --output ratelimit.json
+"""
+import argparse
+import asyncio
+import time
+from .common import print_table, summarize, write_results
+
+BATCH = 1000
+
+async def _noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def _receive():
+    return {"type": "http.request", "body": b""}
+
+async def _send(message):
+    pass
+
+def _scope(path: str, method: str, api_key: str) -> dict:
+    return {
+        "type": "http", "method": method, "path": path, "client": ("10.0.0.1", 50000),
+        "headers": [
+            (b"host", b"api.local"), (b"user-agent", b"bench"), (b"accept", b"application/json"),
+            (b"x-api-key", api_key.encode()),
+        ],
+    }
+
+async def _per_request_us(app, scopes: list) -> list:
+    """Mean microseconds per request for each batch of ``BATCH`` requests."""
+    samples = []
+    for offset in range(0, len(scopes), BATCH):
+        batch = scopes[offset:offset + BATCH]
+        start = time.perf_counter()
+        for scope in batch:
+            await app(scope, _receive, _send)
+        samples.append((time.perf_counter() - start) * 1e6 / len(batch))
+    return samples
+
+def _case(samples_us: list, elapsed: float, requests: int, baseline_us: float = 0.0) -> dict:
+    # summarize() works in ms; these samples are per-request means in microseconds
+    result = summarize([sample / 1000 for sample in samples_us])
+    result["throughput_rps"] = requests / elapsed
+    mean_us = sum(samples_us) / len(samples_us)
+    result["mean_us"] = mean_us
+    result["overhead_us"] = mean_us - baseline_us
+    return result
+
+async def run(requests: int, clients: int, redis_url: str) -> dict:
+    from ..ratelimit import RateLimitMiddleware, RateLimiter
+
+    unlimited = {"crud": (1e9, 10 ** 9), "ai": (1e9, 10 ** 9)}
+    routes = "POST /todos/,POST /journal/,POST /goals/,/ai/*"
+    api_keys = ",".join(f"client-{i}" for i in range(clients))
+    results = {}
+
+    async def timed(name, app, scopes, baseline_us=0.0):
+        await _per_request_us(app, scopes[:BATCH])  # warm up
+        start = time.perf_counter()
+        samples = await _per_request_us(app, scopes)
+        results[name] = _case(samples, time.perf_counter() - start, len(scopes), baseline_us)
+        return results[name]["mean_us"]
+
+    hot = [_scope("/todos/abc", "GET", "client-0")] * requests
+    many = [_scope("/todos/abc", "GET", f"client-{i % clients}") for i in range(requests)]
+    baseline = await timed("baseline:no_limiter", _noop_app, hot)
+    results["baseline:no_limiter"]["overhead_us"] = 0.0
+
+    local = RateLimiter(unlimited, routes, "/health", backend="local", api_keys=api_keys)
+    await timed("local:one_client", RateLimitMiddleware(_noop_app, local), hot, baseline)
+    await timed(f"local:{clients}_clients", RateLimitMiddleware(_noop_app, local), many, baseline)
+
+    exhausted = RateLimiter({"crud": (1e-9, 1), "ai": (1e-9, 1)}, routes, "/health", backend="local")
+    await timed("local:rejected_429", RateLimitMiddleware(_noop_app, exhausted), hot, baseline)
+
+    shared = RateLimiter(unlimited, routes, "/health", backend="redis", redis_url=redis_url, api_keys=api_keys)
+    try:
+        await shared.start()
+    except Exception as e:
+        print(f"skipping Redis cases: {e}")
+    else:
+        subset = many[: min(requests, 20 * BATCH)]
+        await timed("redis:lua_script", RateLimitMiddleware(_noop_app, shared), subset, baseline)
+        await shared.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=10_000, help="Distinct API keys in the many-clients case")
+    parser.add_argument("--redis-url", default="redis://localhost:6379")
+    parser.add_argument("--output", default="ratelimit_results.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests, args.clients, args.redis_url))
+    print_table(results)
+    for case, result in results.items():
+        print(f"{case:<40} {result['mean_us']:8.2f} us/request, overhead {result['overhead_us']:6.2f} us")
+    write_results(args.output, "ratelimit", vars(args), results)
+
+if __name__ == "__main__":
+    main()
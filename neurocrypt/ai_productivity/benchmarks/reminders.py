@@ -0,0 +1,151 @@
+"""
+Reminder engine benchmark: heap maintenance at 1M scheduled items, restart
+recovery from the indexed date columns, and firing lateness through a local
+stand-in webhook receiver.
+
+    python -m neurocrypt.ai_productivity.benchmarks.reminders --items 1000000 --output reminders.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from .common import print_table, summarize, write_results
+
+def bench_heap(items: int, ops: int, seed: int) -> dict:
+    from ..services.reminders import ReminderHeap
+
+    rng = random.Random(seed)
+    now = time.time()
+    heap = ReminderHeap()
+    results = {}
+
+    start = time.perf_counter()
+    heap.load(((("todos", f"todo-{i}"), now + rng.uniform(60, 86400 * 30)) for i in range(items)))
+    results["load_heapify"] = summarize([(time.perf_counter() - start) * 1000])
+
+    for name, op in (
+        ("reschedule", lambda i: heap.push(("todos", f"todo-{i}"), now + rng.uniform(60, 86400 * 30))),
+        ("schedule_new", lambda i: heap.push(("goals", f"goal-{i}"), now + rng.uniform(60, 86400 * 30))),
+        ("cancel", lambda i: heap.discard(("todos", f"todo-{i}"))),
+    ):
+        keys = [rng.randrange(items) for _ in range(ops)]
+        samples = []
+        start = time.perf_counter()
+        for i in keys:
+            t = time.perf_counter()
+            op(i)
+            samples.append((time.perf_counter() - t) * 1000)
+        results[name] = summarize(samples, time.perf_counter() - start)
+
+    # Drain the earliest reminders in fire-sized batches
+    samples, drained = [], 0
+    horizon = now + 86400
+    start = time.perf_counter()
+    while drained < ops:
+        t = time.perf_counter()
+        batch = heap.pop_due(horizon)
+        samples.append((time.perf_counter() - t) * 1000)
+        if not batch:
+            break
+        drained += len(batch)
+    results["pop_due_batch"] = summarize(samples, time.perf_counter() - start)
+    results["pop_due_batch"]["items"] = drained
+    return results
+
+async def bench_recovery(rows: int) -> dict:
+    # Imported late so DATABASE_URL points at the throwaway database first
+    from ..services import db_service as db
+    from ..services.reminders import ReminderEngine
+
+    await db.init_db()
+    due = datetime.utcnow() + timedelta(days=1)
+    async with db.engine.begin() as conn:
+        for offset in range(0, rows, 10000):
+            await conn.execute(db.Todo.__table__.insert(), [
+                {"id": f"todo-{i}", "title": f"Todo {i}", "completed": False, "version": 1,
+                 "due_date": due + timedelta(seconds=i)}
+                for i in range(offset, min(rows, offset + 10000))
+            ])
+    engine = ReminderEngine(sinks=[])
+    start = time.perf_counter()
+    await engine._load(db.DatabaseService().iter_deadlines)
+    elapsed = time.perf_counter() - start
+    assert len(engine.heap) == rows
+    return {"recovery": {**summarize([elapsed * 1000]), "items": rows, "throughput_rps": rows / elapsed}}
+
+async def _receive_webhooks(received: list):
+    async def handle(reader, writer):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(
+                int(line.split(b":", 1)[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")
+            )
+            arrived = time.time()
+            body = json.loads(await reader.readexactly(length))
+            received.extend((arrived, reminder) for reminder in body["reminders"])
+            writer.write(b"HTTP/1.1 204 No Content\r\ncontent-length: 0\r\n\r\n")
+            await writer.drain()
+
+    async def safe_handle(reader, writer):
+        try:
+            await handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    return await asyncio.start_server(safe_handle, "127.0.0.1", 0)
+
+async def bench_firing(count: int, spread: float) -> dict:
+    from ..services.reminders import ReminderEngine, to_timestamp
+
+    received = []
+    server = await _receive_webhooks(received)
+    port = server.sockets[0].getsockname()[1]
+    engine = ReminderEngine(sinks=["webhook"], webhook_url=f"http://127.0.0.1:{port}/reminders")
+
+    async def nothing(after):
+        return
+        yield
+
+    engine.start(nothing)
+    await asyncio.sleep(0.05)
+    base = datetime.utcnow() + timedelta(seconds=0.5)
+    for i in range(count):
+        engine.observe("todos", "create", {
+            "id": f"todo-{i}", "completed": False, "due_date": base + timedelta(seconds=spread * i / count),
+        })
+    deadline = time.time() + spread + 10
+    while len(received) < count and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    await engine.stop()
+    server.close()
+
+    lateness = [(arrived - to_timestamp(reminder["due_at"])) * 1000 for arrived, reminder in received]
+    return {"fire_lateness": summarize(lateness, errors=count - len(received))}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=1_000_000, help="Reminders held in the heap")
+    parser.add_argument("--ops", type=int, default=100_000, help="Reschedule/cancel operations per case")
+    parser.add_argument("--recovery-rows", type=int, default=100_000, help="Todos loaded back from the database")
+    parser.add_argument("--fire", type=int, default=10_000, help="Reminders fired through the stand-in webhook")
+    parser.add_argument("--spread", type=float, default=2.0, help="Seconds over which the fired reminders fall due")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="reminders_results.json")
+    args = parser.parse_args()
+
+    results = bench_heap(args.items, args.ops, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/bench.db"
+        os.environ["SQL_ECHO"] = "false"
+        results.update(asyncio.run(bench_recovery(args.recovery_rows)))
+    results.update(asyncio.run(bench_firing(args.fire, args.spread)))
+
+    print_table(results)
+    write_results(args.output, "reminders", vars(args), results)
+
+if __name__ == "__main__":
+    main()
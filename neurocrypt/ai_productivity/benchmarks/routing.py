@@ -0,0 +1,142 @@
+"""
+Model routing benchmark: LLM call latency and tokens with and without routing.
+
+Starts the fake OpenAI server with a slow default model, a quick fast model and
+per-token generation time, then sends each AIService operation's prompt through
+``AIService._chat`` in two modes:
+
+- ``default``: every call goes to ``DEFAULT_AI_MODEL`` with ``MAX_TOKENS``.
+- ``routed``: calls follow ``AI_TASK_ROUTES``, prompt size and the latency SLO.
+
+Prompts are built from oversized inputs, so they are also fitted to
+``AI_PROMPT_TOKEN_BUDGET``. A last pair of cases times building a prompt with a
+fresh ``PromptTemplate`` per call against the precompiled ``Prompt``:
+
+    python -m neurocrypt.ai_productivity.benchmarks.routing --calls 40 --output routing.json
+"""
+import argparse
+import asyncio
+import os
+import time
+from .common import free_port, print_table, spawn, summarize, write_results
+
+DESCRIPTION = "Refactor the release checklist and review the open pull requests with the team. " * 20
+ENTRY = "Today I shipped the importer, argued with the build, then went for a long walk to clear my head. " * 200
+
+def operations(ai_service):
+    """(operation, prompt) pairs matching what AIService sends."""
+    todos = [{"title": f"Todo {i}", "description": DESCRIPTION[:200], "completed": i % 3 == 0} for i in range(200)]
+    return [
+        ("todo_suggestions", ai_service.TODO_SUGGESTIONS.messages(title="Prepare the release", description=DESCRIPTION)),
+        ("journal_analysis", ai_service.JOURNAL_ANALYSIS.messages(content=ENTRY)),
+        ("journal_analysis_chunk", ai_service.JOURNAL_CHUNK_ANALYSIS.messages(part=1, parts=3, content=ENTRY[:1000])),
+        ("goal_improvements", ai_service.GOAL_IMPROVEMENTS.messages(title="Run a marathon", description=DESCRIPTION)),
+        ("productivity_insights", ai_service.PRODUCTIVITY_INSIGHTS.messages(
+            todos=todos, journal_entries=[{"content": ENTRY[:500]}] * 20, goals=[{"title": "Ship v2"}],
+        )),
+    ]
+
+async def run_mode(service, prompts, calls: int, concurrency: int) -> dict:
+    results = {}
+    for operation, messages in prompts:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await service._chat(operation, messages)
+                except Exception as e:
+                    errors.append(repr(e))
+                    return
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(calls)))
+        results[operation] = summarize(latencies, time.perf_counter() - start, len(errors))
+    return results
+
+def prompt_build(ai_service, iterations: int) -> dict:
+    from langchain.prompts import PromptTemplate
+
+    prompt = ai_service.TODO_SUGGESTIONS
+    template = prompt.template.template
+    cases = {
+        "fresh_template": lambda: [
+            {"role": "system", "content": prompt.system},
+            {"role": "user", "content": PromptTemplate(
+                input_variables=["title", "description"], template=template,
+            ).format(title="Prepare the release", description="Short description")},
+        ],
+        "precompiled": lambda: prompt.messages(title="Prepare the release", description="Short description"),
+    }
+    results = {}
+    for name, build in cases.items():
+        samples = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            began = time.perf_counter()
+            build()
+            samples.append((time.perf_counter() - began) * 1000)
+        results[f"prompt:{name}"] = summarize(samples, time.perf_counter() - start)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=40, help="Calls per operation and mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--default-latency-ms", type=float, default=1200.0)
+    parser.add_argument("--fast-latency-ms", type=float, default=250.0)
+    parser.add_argument("--ms-per-token", type=float, default=0.5)
+    parser.add_argument("--completion-tokens", type=int, default=1000, help="Reply length before max_tokens applies")
+    parser.add_argument("--prompt-iterations", type=int, default=20_000)
+    parser.add_argument("--output", default="routing_results.json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ["AI_LATENCY_BUDGET"] = "0"  # time the calls themselves, not the local fallback
+    # Imported late so settings pick up the environment above
+    from ..config import settings
+    from ..services import ai_service
+    from ..services.model_router import ModelRouter, parse_routes
+
+    port = free_port()
+    server = spawn([
+        "-m", "neurocrypt.ai_productivity.benchmarks.fake_openai", "--port", str(port),
+        "--model-latency", f"{settings.DEFAULT_AI_MODEL}={args.default_latency_ms},"
+                           f"{settings.AI_FAST_MODEL}={args.fast_latency_ms}",
+        "--ms-per-token", str(args.ms_per_token), "--completion-tokens", str(args.completion_tokens),
+    ], port)
+    try:
+        import openai
+        openai.api_base = f"http://127.0.0.1:{port}/v1"
+        service = ai_service.AIService()
+        prompts = operations(ai_service)
+        models = {"fast": settings.AI_FAST_MODEL, "default": settings.DEFAULT_AI_MODEL}
+        modes = {
+            "default": ModelRouter(models, {}, settings.MAX_TOKENS, settings.AI_FAST_MAX_PROMPT_TOKENS),
+            "routed": ModelRouter(
+                models, parse_routes(settings.AI_TASK_ROUTES), settings.MAX_TOKENS,
+                settings.AI_FAST_MAX_PROMPT_TOKENS, settings.AI_ROUTE_LATENCY_SLO,
+            ),
+        }
+        results = {}
+        for mode, router in modes.items():
+            ai_service.model_router = router
+            cases = asyncio.run(run_mode(service, prompts, args.calls, args.concurrency))
+            results.update((f"{mode}:{operation}", summary) for operation, summary in cases.items())
+        prompt_tokens = {operation: ai_service.count_message_tokens(messages) for operation, messages in prompts}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    results.update(prompt_build(ai_service, args.prompt_iterations))
+    print_table(results)
+    for operation, tokens in prompt_tokens.items():
+        results[f"routed:{operation}"]["prompt_tokens"] = tokens
+        print(f"{operation}: {tokens} prompt tokens (budget {settings.AI_PROMPT_TOKEN_BUDGET})")
+    write_results(args.output, "routing", vars(args), results)
+
+if __name__ == "__main__":
+    main()
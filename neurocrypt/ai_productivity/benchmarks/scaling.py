@@ -0,0 +1,76 @@
+"""
+Throughput scaling of the CRUD endpoints from 1 to N worker processes.
+
+Starts the production launcher (``server.py``) with 1, 2, 4, ... workers and
+drives each configuration at a fixed offered load from several generator
+processes, so the load generator is not the bottleneck:
+
+    python -m neurocrypt.ai_productivity.benchmarks.scaling --max-workers 8 --rps 4000 --output scaling.json
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+from .common import write_results
+from .load import local_stack, run_load
+
+CRUD_SCENARIOS = [
+    ("GET /todos/", 50),
+    ("GET /todos/{id}", 40),
+    ("POST /todos/", 10),
+]
+
+def _generate(args) -> dict:
+    url, rps, duration, seed = args
+    return asyncio.run(run_load(url, rps, duration, scenarios=CRUD_SCENARIOS, seed=seed))["all"]
+
+def measure(workers: int, rps: float, duration: float, generators: int) -> dict:
+    def command(port):
+        return [
+            "-m", "neurocrypt.ai_productivity.server", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ]
+
+    with local_stack(app_command=command) as url:
+        with multiprocessing.get_context("spawn").Pool(generators) as pool:
+            parts = pool.map(_generate, [(url, rps / generators, duration, seed) for seed in range(generators)])
+
+    # Per-generator percentiles can't be merged exactly; report the worst one
+    return {
+        "workers": workers,
+        "count": sum(part["count"] for part in parts),
+        "errors": sum(part["errors"] for part in parts),
+        "throughput_rps": sum(part.get("throughput_rps", 0) for part in parts),
+        "p50_ms": max(part["p50_ms"] for part in parts),
+        "p95_ms": max(part["p95_ms"] for part in parts),
+        "p99_ms": max(part["p99_ms"] for part in parts),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--rps", type=float, default=2000, help="Offered load for every configuration")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--generators", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--output", default="scaling_results.json")
+    args = parser.parse_args()
+
+    counts, n = [], 1
+    while n < args.max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(args.max_workers)
+
+    results = {}
+    for workers in counts:
+        results[f"workers={workers}"] = measure(workers, args.rps, args.duration, args.generators)
+
+    base = results["workers=1"]["throughput_rps"] or 1
+    print(f"{'workers':>8} {'rps':>10} {'speedup':>8} {'p99 ms':>9} {'errors':>7}")
+    for r in results.values():
+        r["speedup"] = r["throughput_rps"] / base
+        print(f"{r['workers']:>8} {r['throughput_rps']:>10.1f} {r['speedup']:>7.2f}x {r['p99_ms']:>9.2f} {r['errors']:>7}")
+    write_results(args.output, "scaling", vars(args), results)
+
+if __name__ == "__main__":
+    main()
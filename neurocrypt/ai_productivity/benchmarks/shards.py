@@ -0,0 +1,149 @@
+"""
+Tenant isolation benchmark: small-tenant latency while a large tenant writes hard.
+
+Seeds a large tenant and several small ones in throwaway SQLite databases, then
+runs the large tenant's bulk write load while the small tenants list and create
+todos, timing each small-tenant operation. Three cases:
+
+- ``shared``: every tenant on the default shard.
+- ``moving``: the large tenant is moved to its own shard with ``move_tenant``
+  while its load keeps running.
+- ``separate``: the large tenant on its own shard.
+
+    python -m neurocrypt.ai_productivity.benchmarks.shards --seconds 10 --output shards.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from .common import print_table, summarize, write_results
+
+BIG = "big-tenant"
+
+async def seed(db, current_tenant, tenants, batch_size=1000):
+    for tenant, count in tenants:
+        token = current_tenant.set(tenant)
+        try:
+            for start in range(0, count, batch_size):
+                await db.insert_new({"todos": [
+                    {"id": f"{tenant}-{i}", "title": f"Todo {i}", "priority": i % 5}
+                    for i in range(start, min(count, start + batch_size))
+                ]})
+        finally:
+            current_tenant.reset(token)
+
+async def big_load(db, current_tenant, rows, batch_size, writer, writers, stop, batches, errors):
+    """Bulk updates of the large tenant's todos, back to back; each writer owns every ``writers``-th row."""
+    current_tenant.set(BIG)
+    rng = random.Random(writer)
+    while not stop.is_set():
+        ids = [f"{BIG}-{rng.randrange(writer, rows, writers)}" for _ in range(batch_size)]
+        start = time.perf_counter()
+        try:
+            await db.bulk_update("todos", {obj_id: {"priority": rng.randrange(5)} for obj_id in ids})
+        except Exception as e:  # SQLite gives up on a lock after its busy timeout
+            errors.append(repr(e))
+            continue
+        batches.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0)
+
+async def small_client(db, current_tenant, tenant, stop, reads, writes, errors):
+    current_tenant.set(tenant)
+    rng = random.Random(tenant)
+    while not stop.is_set():
+        write = rng.random() < 0.2
+        start = time.perf_counter()
+        try:
+            if write:
+                await db.create_todo({"id": str(uuid.uuid4()), "title": "Small tenant todo"})
+            else:
+                await db.get_todos(limit=50)
+        except Exception as e:
+            errors.append(repr(e))
+            continue
+        (writes if write else reads).append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(rng.uniform(0, 0.01))
+
+async def run_case(db, current_tenant, args, during=None) -> dict:
+    stop = asyncio.Event()
+    batches, reads, writes, big_errors, errors = [], [], [], [], []
+    tasks = [
+        asyncio.create_task(big_load(
+            db, current_tenant, args.big_rows, args.big_batch, writer, args.big_writers, stop, batches, big_errors,
+        ))
+        for writer in range(args.big_writers)
+    ]
+    tasks += [
+        asyncio.create_task(small_client(db, current_tenant, f"small-{i}", stop, reads, writes, errors))
+        for i in range(args.small_tenants)
+    ]
+    start = time.perf_counter()
+    extra = await during() if during is not None else None
+    await asyncio.sleep(max(0.0, args.seconds - (time.perf_counter() - start)))
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    results = {
+        "small_reads": summarize(reads, elapsed, len(errors)),
+        "small_writes": summarize(writes, elapsed),
+        "big_updates": summarize(batches, elapsed, len(big_errors)),
+    }
+    results["big_updates"]["rows_per_s"] = len(batches) * args.big_batch / elapsed
+    if extra is not None:
+        # Move stats ride along with the case they were taken in
+        results["big_updates"].update(
+            (f"move_{key}", value) for key, value in extra.items() if isinstance(value, (int, float))
+        )
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each case")
+    parser.add_argument("--big-rows", type=int, default=100_000)
+    parser.add_argument("--big-batch", type=int, default=500, help="Rows per bulk update of the large tenant")
+    parser.add_argument("--big-writers", type=int, default=2)
+    parser.add_argument("--small-tenants", type=int, default=8)
+    parser.add_argument("--small-rows", type=int, default=200)
+    parser.add_argument("--output", default="shards_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/default.db"
+        os.environ["DATABASE_SHARDS"] = f"big=sqlite+aiosqlite:///{tmp}/big.db"
+        os.environ["SQL_ECHO"] = "false"
+        os.environ["SLOW_QUERY_MS"] = "60000"  # lock waits are the point here, not worth a warning each
+        # Imported late so the engines point at the throwaway databases
+        from ..services.db_service import DatabaseService, init_db, router
+        from ..services.shards import current_tenant
+        from ..tenants import move_tenant
+
+        async def run():
+            await init_db()
+            db = DatabaseService()
+            await seed(db, current_tenant, [(BIG, args.big_rows)] + [
+                (f"small-{i}", args.small_rows) for i in range(args.small_tenants)
+            ])
+            cases = {"shared": await run_case(db, current_tenant, args)}
+            cases["moving"] = await run_case(
+                db, current_tenant, args, lambda: move_tenant(BIG, "big", batch_size=5000, grace=0),
+            )
+            cases["separate"] = await run_case(db, current_tenant, args)
+            await router.dispose()
+            return cases
+
+        cases = asyncio.run(run())
+
+    results = {f"{case}:{name}": summary for case, result in cases.items() for name, summary in result.items()}
+    print_table(results)
+    for case in cases:
+        print(f"{case}: large tenant {results[f'{case}:big_updates']['rows_per_s']:.0f} rows/s updated")
+    move = results["moving:big_updates"]
+    print(f"move: {move['move_copied']} rows in {move['move_passes']} passes, {move['move_seconds']:.2f}s, "
+          f"writes paused {move['move_write_pause_ms']:.0f} ms")
+    write_results(args.output, "shards", vars(args), results)
+
+if __name__ == "__main__":
+    main()
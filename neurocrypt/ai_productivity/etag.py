@@ -0,0 +1,70 @@
+"""Conditional GET support.
+
+Strong ETags are derived from version counters instead of response bodies,
+so a matching ``If-None-Match`` is answered with ``304 Not Modified`` before
+any rows are loaded or serialized:
+
+- list routes read only the tenant's change sequence number (a single counter
+  row), which every write moves in the database, so every worker process
+  hands out the same ETag for the same data.
+- item routes read only the row's ``version`` column.
+
+ETags are per tenant, and responses carry ``Vary`` on the tenant header so a
+shared cache never answers one tenant with another's body.
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from .config import settings
+from .services.db_service import DatabaseService
+from .services.shards import current_tenant
+
+class NotModified(Exception):
+    """Raised by the ETag dependencies to short-circuit a route with a 304."""
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+async def not_modified_handler(request: Request, exc: NotModified) -> Response:
+    return Response(status_code=304, headers={"ETag": exc.etag, "Vary": settings.TENANT_HEADER})
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an ``If-None-Match`` header against an ETag (RFC 7232)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def _check(request: Request, response: Response, etag: str) -> None:
+    response.headers["Vary"] = settings.TENANT_HEADER
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise NotModified(etag)
+    response.headers["ETag"] = etag
+
+def collection_etag(db_service: DatabaseService, collection: str):
+    """Dependency for list routes, keyed on the tenant's change sequence number, tenant and query string."""
+    async def dependency(request: Request, response: Response) -> None:
+        query = hashlib.sha1(f"{current_tenant.get()}\n{request.query_params}".encode()).hexdigest()[:12]
+        version = await db_service.get_collection_version(collection)
+        _check(request, response, f'"{collection}-{version}-{query}"')
+    return dependency
+
+def row_etag(db_service: DatabaseService, collection: str, path_param: str):
+    """Dependency for item routes, keyed on the tenant and the row's persisted version."""
+    async def dependency(request: Request, response: Response) -> None:
+        obj_id = request.path_params[path_param]
+        version = await db_service.get_row_version(collection, obj_id)
+        if version is None:
+            # Let the route itself produce the 404
+            return
+        tenant = hashlib.sha1(current_tenant.get().encode()).hexdigest()[:8]
+        _check(request, response, f'"{obj_id}-{version}-{tenant}"')
+    return dependency
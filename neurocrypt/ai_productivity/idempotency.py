@@ -0,0 +1,317 @@
+"""``Idempotency-Key`` support for the create endpoints.
+
+A POST to a configured route that carries an ``Idempotency-Key`` header is
+keyed by tenant, client, route and header value. The first request claims the
+key and runs normally. Its response is stored for ``IDEMPOTENCY_TTL`` seconds
+and replayed to later requests with the same key, marked with an
+``Idempotent-Replayed: true`` header.
+
+- A duplicate that arrives while the first request is still running waits for
+  it instead of executing again. After ``IDEMPOTENCY_WAIT_TIMEOUT`` it gets
+  ``409 Conflict``.
+- Reusing a key with a different request body is answered with ``422``.
+- 5xx and 429 responses are not stored. The key is released, so the next
+  retry executes again.
+- A claim expires after ``IDEMPOTENCY_LOCK_TTL``, so a worker dying mid-request
+  can't block its key forever.
+
+Two stores are available. ``MemoryIdempotencyStore`` keeps keys per worker
+process. ``RedisIdempotencyStore`` shares them across workers and hosts.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+import redis
+import redis.asyncio as aioredis
+from .config import settings
+from .services.shards import current_tenant
+
+logger = logging.getLogger(__name__)
+
+# Larger responses pass through but aren't stored
+MAX_STORED_BODY = 1024 * 1024
+
+class MemoryIdempotencyStore:
+    """Per-process store; in-flight duplicates wait on an event instead of polling."""
+
+    def __init__(self):
+        self._records: Dict[str, Tuple[float, dict]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._last_sweep = 0.0
+
+    async def begin(self, key: str, pending: dict, lock_ttl: float) -> Optional[dict]:
+        """Claim ``key`` with a pending record; returns None if claimed, else the existing record."""
+        now = time.monotonic()
+        if now - self._last_sweep > 60:
+            self._sweep(now)
+        existing = self._records.get(key)
+        if existing is not None and existing[0] > now:
+            return existing[1]
+        self._notify(key)  # wake anyone still waiting on an expired claim
+        self._records[key] = (now + lock_ttl, pending)
+        self._events[key] = asyncio.Event()
+        return None
+
+    async def complete(self, key: str, pending: dict, record: dict, ttl: float) -> None:
+        if self._owns(key, pending):
+            self._records[key] = (time.monotonic() + ttl, record)
+        self._notify(key)
+
+    async def release(self, key: str, pending: dict) -> None:
+        if self._owns(key, pending):
+            del self._records[key]
+        self._notify(key)
+
+    async def wait(self, key: str, timeout: float) -> None:
+        event = self._events.get(key)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self) -> None:
+        pass
+
+    def _owns(self, key: str, pending: dict) -> bool:
+        existing = self._records.get(key)
+        return existing is not None and existing[1] is pending
+
+    def _notify(self, key: str) -> None:
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _sweep(self, now: float) -> None:
+        self._last_sweep = now
+        for key in [key for key, (expires, _) in self._records.items() if expires <= now]:
+            del self._records[key]
+            self._notify(key)
+
+# KEYS[1]: record key; ARGV[1]: our pending value. Replace or delete the record only
+# while our claim is still the one stored, so a request whose claim expired and was
+# taken over can't clobber the new owner.
+COMPLETE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+end
+"""
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+class RedisIdempotencyStore:
+    """Shared store; claims are ``SET NX`` and duplicates poll the key."""
+
+    PREFIX = "neurocrypt:idempotency"
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, client):
+        self.client = client
+        self._complete = client.register_script(COMPLETE_LUA)
+        self._release = client.register_script(RELEASE_LUA)
+
+    @staticmethod
+    def _encode(record: dict) -> str:
+        if "body" not in record:
+            return json.dumps(record, sort_keys=True)
+        return json.dumps({**record, "body": base64.b64encode(record["body"]).decode()}, sort_keys=True)
+
+    @staticmethod
+    def _decode(raw: bytes) -> dict:
+        record = json.loads(raw)
+        if "body" in record:
+            record["body"] = base64.b64decode(record["body"])
+        return record
+
+    async def begin(self, key: str, pending: dict, lock_ttl: float) -> Optional[dict]:
+        name = f"{self.PREFIX}:{key}"
+        if await self.client.set(name, self._encode(pending), nx=True, px=int(lock_ttl * 1000)):
+            return None
+        raw = await self.client.get(name)
+        if raw is None:
+            return await self.begin(key, pending, lock_ttl)  # expired between the two calls
+        return self._decode(raw)
+
+    async def complete(self, key: str, pending: dict, record: dict, ttl: float) -> None:
+        await self._complete(
+            keys=[f"{self.PREFIX}:{key}"], args=[self._encode(pending), self._encode(record), int(ttl * 1000)],
+        )
+
+    async def release(self, key: str, pending: dict) -> None:
+        await self._release(keys=[f"{self.PREFIX}:{key}"], args=[self._encode(pending)])
+
+    async def wait(self, key: str, timeout: float) -> None:
+        # The owner may be another process, so there is nothing to wait on but the key itself
+        await asyncio.sleep(min(self.POLL_INTERVAL, timeout))
+
+    async def close(self) -> None:
+        await self.client.close()
+
+class IdempotencyKeys:
+    """Chooses the store and holds the policy shared by every request."""
+
+    def __init__(
+        self, routes: str, store: str = "auto", redis_url: Optional[str] = None,
+        ttl: float = 86400.0, lock_ttl: float = 120.0, wait_timeout: float = 60.0,
+    ):
+        self.routes = {route.strip() for route in routes.split(",") if route.strip()}
+        self.backend = store
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.store = MemoryIdempotencyStore()
+
+    async def start(self) -> None:
+        if self.backend not in ("auto", "redis") or not self.redis_url:
+            return
+        client = aioredis.from_url(self.redis_url, socket_connect_timeout=0.5, socket_timeout=2.0)
+        try:
+            await client.ping()
+        except redis.RedisError as e:
+            await client.close()
+            if self.backend == "redis":
+                raise
+            logger.info("Redis unavailable for idempotency keys (%s); using the per-process store", e)
+            return
+        self.store = RedisIdempotencyStore(client)
+
+    async def stop(self) -> None:
+        await self.store.close()
+        self.store = MemoryIdempotencyStore()
+
+    def applies(self, scope) -> bool:
+        return self.backend != "none" and scope["method"] == "POST" and scope["path"] in self.routes
+
+def _response(status: int, detail: str) -> Tuple[dict, dict]:
+    body = json.dumps({"detail": detail}).encode()
+    return (
+        {"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]},
+        {"type": "http.response.body", "body": body},
+    )
+
+class IdempotencyMiddleware:
+    """ASGI middleware storing and replaying responses per ``Idempotency-Key``."""
+
+    def __init__(self, app, keys: IdempotencyKeys, client_key: Callable[[dict], str]):
+        self.app = app
+        self.keys = keys
+        self.client_key = client_key
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.keys.applies(scope):
+            await self.app(scope, receive, send)
+            return
+        header = next((value for name, value in scope["headers"] if name == b"idempotency-key"), None)
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not 0 < len(header) <= 255:
+            for message in _response(400, "Idempotency-Key must be 1-255 characters"):
+                await send(message)
+            return
+
+        # The body is part of the fingerprint, so read it up front and replay it to the app
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(scope["path"].encode() + b"\0" + body).hexdigest()
+        # Tenants sharing an API key or address must not replay each other's responses
+        key = hashlib.sha256(
+            f"{current_tenant.get()}\0{self.client_key(scope)}\0{scope['path']}\0".encode() + header
+        ).hexdigest()
+
+        replayed = False
+
+        async def replay_body():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        store = self.keys.store
+        pending = {"state": "pending", "fingerprint": fingerprint, "token": uuid.uuid4().hex}
+        deadline = time.monotonic() + self.keys.wait_timeout
+        while True:
+            try:
+                record = await store.begin(key, pending, self.keys.lock_ttl)
+            except redis.RedisError as e:
+                logger.warning("Idempotency store unavailable (%s); handling request without it", e)
+                await self.app(scope, replay_body, send)
+                return
+            if record is None:
+                break
+            if record["fingerprint"] != fingerprint:
+                for message in _response(422, "Idempotency-Key was already used with a different request"):
+                    await send(message)
+                return
+            if record["state"] == "done":
+                await send({
+                    "type": "http.response.start", "status": record["status"],
+                    "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+                    + [(b"idempotent-replayed", b"true")],
+                })
+                await send({"type": "http.response.body", "body": record["body"]})
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                for message in _response(409, "A request with this Idempotency-Key is still in progress"):
+                    await send(message)
+                return
+            await store.wait(key, remaining)
+
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        record = None
+        try:
+            await self.app(scope, replay_body, capture)
+            content = b"".join(response["body"])
+            if response["status"] < 500 and response["status"] != 429 and len(content) <= MAX_STORED_BODY:
+                record = {
+                    "state": "done", "fingerprint": fingerprint, "status": response["status"],
+                    "headers": response["headers"], "body": content,
+                }
+        finally:
+            try:
+                if record is not None:
+                    await store.complete(key, pending, record, self.keys.ttl)
+                else:
+                    await store.release(key, pending)
+            except redis.RedisError as e:
+                # The claim expires after IDEMPOTENCY_LOCK_TTL
+                logger.warning("Could not finish idempotency key (%s)", e)
+
+idempotency_keys = IdempotencyKeys(
+    settings.IDEMPOTENCY_ROUTES,
+    settings.IDEMPOTENCY_STORE,
+    settings.REDIS_URL,
+    settings.IDEMPOTENCY_TTL,
+    settings.IDEMPOTENCY_LOCK_TTL,
+    settings.IDEMPOTENCY_WAIT_TIMEOUT,
+)
@@ -0,0 +1,220 @@
+"""Per-client rate limiting.
+
+Every HTTP request takes one token from a bucket keyed by the client and by
+route class. The client is its API key when that is one of the issued keys in
+``RATE_LIMIT_API_KEYS``, and its address otherwise, so made-up keys can't be
+rotated to get fresh buckets. There are two
+classes: ``ai`` for the routes that call the LLM, and ``crud`` for everything
+else. An empty bucket is answered with ``429 Too Many Requests`` and a
+``Retry-After`` header, before the request reaches the router.
+
+Buckets live in one of two places:
+
+- ``local``: a dict in this process. The limit applies per worker process.
+- ``redis``: a hash per client in Redis, updated atomically by a Lua script
+  on the Redis clock. The limit is shared by every worker and host. If Redis
+  errors, the request is checked against the local buckets instead.
+"""
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+import redis
+import redis.asyncio as aioredis
+from .config import settings
+from .telemetry import meter
+
+logger = logging.getLogger(__name__)
+
+rate_limited = meter.create_counter("http.rate_limited", description="Requests rejected by the rate limiter, by bucket")
+
+# KEYS[1]: bucket hash; ARGV: refill rate (tokens/s), burst. Returns the seconds to
+# wait as a string (Lua numbers are truncated to integers on the way out), "0" if admitted.
+TOKEN_BUCKET_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.min(math.ceil(burst / rate * 1000) + 1000, 86400000))
+return tostring(wait)
+"""
+
+REDIS_PREFIX = "neurocrypt:ratelimit"
+
+class TokenBuckets:
+    """In-process token buckets sharing one rate and burst size."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[str, List[float]] = {}
+
+    def take(self, key: str, now: float) -> float:
+        """Take a token; returns 0.0 if admitted, else the seconds until one is available."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            self._buckets[key] = [self.burst - 1.0, now]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def _prune(self, now: float) -> None:
+        # A full bucket is indistinguishable from a missing one
+        full = [key for key, (tokens, ts) in self._buckets.items() if tokens + (now - ts) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            # Still full of active clients: forget the oldest half (insertion order)
+            for key in list(self._buckets)[: self.max_keys // 2]:
+                del self._buckets[key]
+
+class RateLimiter:
+    """Route classification, client keys and the bucket backend."""
+
+    def __init__(
+        self, limits: Dict[str, Tuple[float, int]], ai_routes: str, exempt: str,
+        backend: str = "auto", redis_url: Optional[str] = None, trust_forwarded: bool = False,
+        api_keys: str = "",
+    ):
+        self.limits = limits
+        self.backend = backend
+        self.redis_url = redis_url
+        self.trust_forwarded = trust_forwarded
+        self.api_keys = frozenset(key.strip() for key in api_keys.split(",") if key.strip())
+        self.local = {bucket: TokenBuckets(rate, burst) for bucket, (rate, burst) in limits.items()}
+        self.exempt = {path.strip() for path in exempt.split(",") if path.strip()}
+        self._ai_exact, self._ai_prefixes = set(), []
+        for route in filter(None, (route.strip() for route in ai_routes.split(","))):
+            method, _, path = route.rpartition(" ")
+            method = method.strip().upper() or "*"
+            if path.endswith("*"):
+                self._ai_prefixes.append((method, path[:-1]))
+            else:
+                self._ai_exact.add((method, path))
+        self._redis = None
+        self._script = None
+
+    async def start(self) -> None:
+        if self.backend not in ("auto", "redis") or not self.redis_url or self._redis is not None:
+            return
+        client = aioredis.from_url(self.redis_url, socket_connect_timeout=0.5, socket_timeout=0.5)
+        try:
+            await client.ping()
+        except redis.RedisError as e:
+            await client.close()
+            if self.backend == "redis":
+                raise
+            logger.info("Redis unavailable for rate limiting (%s); using per-process buckets", e)
+            return
+        self._redis = client
+        self._script = client.register_script(TOKEN_BUCKET_LUA)
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+            self._script = None
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        """The bucket a request draws from, or None if it isn't limited."""
+        if self.backend == "none" or path in self.exempt or method == "OPTIONS":
+            return None
+        if (method, path) in self._ai_exact or ("*", path) in self._ai_exact:
+            return "ai"
+        for route_method, prefix in self._ai_prefixes:
+            if path.startswith(prefix) and route_method in ("*", method):
+                return "ai"
+        return "crud"
+
+    def client_key(self, scope) -> str:
+        forwarded = None
+        for name, value in scope["headers"]:
+            key = None
+            if name == b"x-api-key":
+                key = value.decode("latin-1")
+            elif name == b"authorization" and value[:7].lower() == b"bearer ":
+                key = value[7:].decode("latin-1")
+            elif name == b"x-forwarded-for" and self.trust_forwarded:
+                forwarded = value.decode("latin-1").split(",")[0].strip()
+            if key in self.api_keys:
+                return "key:" + key
+        if forwarded:
+            return "ip:" + forwarded
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def take(self, bucket: str, client: str) -> float:
+        """Seconds the client has to wait before this request would be admitted; 0.0 admits it."""
+        if self._script is not None:
+            rate, burst = self.limits[bucket]
+            # Hashed so API keys are never written to Redis
+            digest = hashlib.blake2b(client.encode(), digest_size=12).hexdigest()
+            try:
+                return float(await self._script(keys=[f"{REDIS_PREFIX}:{bucket}:{digest}"], args=[rate, burst]))
+            except redis.RedisError as e:
+                logger.warning("Redis rate limit check failed (%s); using per-process buckets", e)
+        return self.local[bucket].take(client, time.monotonic())
+
+class RateLimitMiddleware:
+    """ASGI middleware answering over-limit requests with ``429`` and ``Retry-After``."""
+
+    def __init__(self, app, limiter: "RateLimiter"):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        bucket = self.limiter.classify(scope["method"], scope["path"])
+        if bucket is not None:
+            wait = await self.limiter.take(bucket, self.limiter.client_key(scope))
+            if wait > 0:
+                rate_limited.add(1, {"bucket": bucket})
+                await send({
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"Rate limit exceeded"}'})
+                return
+        await self.app(scope, receive, send)
+
+rate_limiter = RateLimiter(
+    {
+        "crud": (settings.RATE_LIMIT_CRUD_RATE, settings.RATE_LIMIT_CRUD_BURST),
+        "ai": (settings.RATE_LIMIT_AI_RATE, settings.RATE_LIMIT_AI_BURST),
+    },
+    settings.RATE_LIMIT_AI_ROUTES,
+    settings.RATE_LIMIT_EXEMPT,
+    settings.RATE_LIMIT_BACKEND,
+    settings.REDIS_URL,
+    settings.RATE_LIMIT_TRUST_FORWARDED,
+    settings.RATE_LIMIT_API_KEYS,
+)
@@ -0,0 +1,177 @@
+"""
+Production launcher: a supervised pool of uvicorn worker processes.
+
+    python -m neurocrypt.ai_productivity.server --workers 4 --port 8000
+
+- The master binds the listening socket once and hands it to every worker
+  (prefork, gunicorn-style). With ``--reuse-port`` each worker binds its own
+  ``SO_REUSEPORT`` socket instead and the kernel balances new connections.
+- ``SIGHUP`` restarts workers one at a time: a replacement has finished its
+  startup before its predecessor is asked to drain and exit.
+- ``SIGTERM``/``SIGINT`` drain all workers, killing any still busy after
+  ``--graceful-timeout`` seconds. Workers that die are respawned.
+- Workers share a directory for the local worker bus, so in-process state is
+  kept in step across workers even without Redis.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import List, Optional
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_APP = "neurocrypt.ai_productivity.app:app"
+
+def bind_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that reports back once the app's startup handlers have run."""
+
+    def __init__(self, config: uvicorn.Config, ready=None):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.ready is not None:
+            self.ready.send(True)
+            self.ready.close()
+
+def run_worker(app: str, host: str, port: int, sock: Optional[socket.socket], log_level: str, ready) -> None:
+    # Leave the terminal's process group so a Ctrl-C reaches only the master,
+    # which then drains each worker with a single SIGTERM
+    os.setpgrp()
+    if sock is None:
+        sock = bind_socket(host, port, reuse_port=True)
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+    WorkerServer(config, ready).run(sockets=[sock])
+
+class Supervisor:
+    def __init__(
+        self, app: str, host: str, port: int, workers: int,
+        reuse_port: bool = False, graceful_timeout: float = 30.0, log_level: str = "info",
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.reuse_port = reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.context = multiprocessing.get_context("spawn")
+        self.sock = None if reuse_port else bind_socket(host, port)
+        self.workers: List[multiprocessing.Process] = []
+        self.should_exit = False
+        self.reload_requested = False
+
+    def spawn_worker(self, wait: bool = False) -> multiprocessing.Process:
+        """Start a worker; with ``wait``, block until its app startup has completed."""
+        ready_reader, ready_writer = self.context.Pipe(duplex=False) if wait else (None, None)
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.app, self.host, self.port, self.sock, self.log_level, ready_writer),
+            daemon=False,
+        )
+        process.start()
+        if wait:
+            ready_writer.close()
+            if not ready_reader.poll(timeout=self.graceful_timeout):
+                logger.warning("Worker %s did not finish startup within %ss", process.pid, self.graceful_timeout)
+            ready_reader.close()
+        return process
+
+    def stop_worker(self, process: multiprocessing.Process, signalled: bool = False) -> None:
+        # uvicorn treats a second SIGTERM as "exit now", so only ever send one
+        if process.is_alive() and not signalled:
+            os.kill(process.pid, signal.SIGTERM)
+        process.join(self.graceful_timeout)
+        if process.is_alive():
+            logger.warning("Worker %s still busy after %ss; killing it", process.pid, self.graceful_timeout)
+            process.kill()
+            process.join()
+
+    def rolling_restart(self) -> None:
+        logger.info("Rolling restart of %d workers", len(self.workers))
+        for index, old in enumerate(list(self.workers)):
+            self.workers[index] = self.spawn_worker(wait=True)
+            self.stop_worker(old)
+
+    def _handle_exit(self, signum, frame) -> None:
+        self.should_exit = True
+
+    def _handle_reload(self, signum, frame) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info("Starting %d workers on %s:%d", self.worker_count, self.host, self.port)
+        self.workers = [self.spawn_worker() for _ in range(self.worker_count)]
+        try:
+            while not self.should_exit:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.rolling_restart()
+                for index, process in enumerate(self.workers):
+                    if not process.is_alive() and not self.should_exit:
+                        logger.warning("Worker %s exited with %s; respawning", process.pid, process.exitcode)
+                        self.workers[index] = self.spawn_worker()
+                time.sleep(0.2)
+        finally:
+            for process in self.workers:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+            for process in self.workers:
+                self.stop_worker(process, signalled=True)
+            if self.sock is not None:
+                self.sock.close()
+
+def serve(
+    app: str = DEFAULT_APP, host: str = "0.0.0.0", port: int = 8000, workers: Optional[int] = None,
+    reuse_port: bool = False, graceful_timeout: float = 30.0, log_level: str = "info",
+) -> None:
+    """Run ``app`` on a pool of worker processes until SIGTERM/SIGINT."""
+    logging.basicConfig(level=log_level.upper(), format="%(asctime)s %(levelname)s [master] %(message)s")
+    workers = workers or int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    bus_dir = os.environ.get("WORKER_BUS_DIR")
+    owns_bus_dir = bus_dir is None
+    if owns_bus_dir:
+        bus_dir = tempfile.mkdtemp(prefix="neurocrypt-bus-")
+        # Inherited by the spawned workers before they import the app's settings
+        os.environ["WORKER_BUS_DIR"] = bus_dir
+    try:
+        Supervisor(app, host, port, workers, reuse_port, graceful_timeout, log_level).run()
+    finally:
+        if owns_bus_dir:
+            shutil.rmtree(bus_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--app", default=DEFAULT_APP, help="ASGI app import string")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, help="Defaults to $WEB_CONCURRENCY or the CPU count")
+    parser.add_argument("--reuse-port", action="store_true", help="Per-worker SO_REUSEPORT sockets")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.app, args.host, args.port, args.workers, args.reuse_port, args.graceful_timeout, args.log_level)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import functools
+import json
+import logging
+import textwrap
+import time
 import openai
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
@@ -7,9 +13,146 @@ from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 import os
 from dotenv import load_dotenv
+from ..config import settings
+from ..telemetry import llm_fallbacks, record_llm_call, tracer
+from . import local_analyzer
+from .late_results import late_results
+from .model_router import count_message_tokens, fit_values, model_router
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Transient OpenAI failures worth retrying
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+)
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [str(value).strip()] if str(value).strip() else []
+
+def merge_journal_analyses(analyses: List[Tuple[dict, int]]) -> dict:
+    """Combine per-chunk analyses weighted by chunk length.
+
+    The mood is the one covering the most text; themes, action items and
+    emotional patterns are concatenated in entry order without duplicates
+    (chunks overlap, so neighbours often repeat each other).
+    """
+    mood_weight: Dict[str, int] = {}
+    merged: Dict[str, List[str]] = {"themes": [], "action_items": [], "emotional_patterns": []}
+    seen: Dict[str, set] = {key: set() for key in merged}
+    for analysis, weight in analyses:
+        mood = str(analysis.get("mood") or "").strip().lower()
+        if mood:
+            mood_weight[mood] = mood_weight.get(mood, 0) + weight
+        for key, items in merged.items():
+            for item in _as_list(analysis.get(key)):
+                if item.lower() not in seen[key]:
+                    seen[key].add(item.lower())
+                    items.append(item)
+    mood = max(mood_weight, key=mood_weight.get) if mood_weight else "neutral"
+    return {"mood": mood, **merged}
+
+class Prompt:
+    """A system message and a user template, compiled once and fitted to the prompt token budget per call."""
+
+    def __init__(self, system: str, template: str):
+        self.system = system
+        self.template = PromptTemplate.from_template(textwrap.dedent(template).strip())
+        self._overhead: Optional[int] = None
+
+    def _messages(self, values: Dict[str, str]) -> List[dict]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.template.format(**values)},
+        ]
+
+    @property
+    def overhead(self) -> int:
+        """Prompt tokens of everything but the values."""
+        if self._overhead is None:
+            self._overhead = count_message_tokens(self._messages(dict.fromkeys(self.template.input_variables, "")))
+        return self._overhead
+
+    def messages(self, budget: Optional[int] = None, **values) -> List[dict]:
+        budget = settings.AI_PROMPT_TOKEN_BUDGET if budget is None else budget
+        values = {name: str(value) for name, value in values.items()}
+        return self._messages(fit_values(values, budget - self.overhead))
+
+TODO_SUGGESTIONS = Prompt("You are a productivity assistant.", """
+    Given this todo item:
+    Title: {title}
+    Description: {description}
+
+    Please provide 3 smart suggestions to enhance this todo item, considering:
+    1. Priority and urgency
+    2. Potential subtasks
+    3. Related resources or contacts
+
+    Format the response as a list of suggestions.
+""")
+
+JOURNAL_ANALYSIS = Prompt("You are an empathetic journal analyzer.", """
+    Analyze this journal entry and provide insights:
+    {content}
+
+    Please provide:
+    1. Overall mood
+    2. Key themes
+    3. Action items or follow-ups
+    4. Emotional patterns
+
+    Format the response as a JSON object.
+""")
+
+JOURNAL_CHUNK_ANALYSIS = Prompt("You are an empathetic journal analyzer.", """
+    Analyze part {part} of {parts} of this journal entry and provide insights:
+    {content}
+
+    Respond with a JSON object with these keys:
+    "mood": the overall mood of this part, one or two words
+    "themes": a list of key themes
+    "action_items": a list of action items or follow-ups
+    "emotional_patterns": a list of emotional patterns
+""")
+
+GOAL_IMPROVEMENTS = Prompt("You are a goal-setting expert.", """
+    Analyze this goal and provide improvement suggestions:
+    Title: {title}
+    Description: {description}
+
+    Please provide:
+    1. SMART criteria analysis
+    2. Potential milestones
+    3. Resource recommendations
+    4. Risk factors
+
+    Format the response as a JSON object.
+""")
+
+PRODUCTIVITY_INSIGHTS = Prompt("You are a productivity analyst.", """
+    Analyze this user's productivity data and provide insights:
+
+    Todos: {todos}
+    Journal Entries: {journal_entries}
+    Goals: {goals}
+
+    Please provide:
+    1. Productivity patterns
+    2. Areas for improvement
+    3. Achievement highlights
+    4. Recommended next steps
+
+    Format the response as a JSON object.
+""")
+
 class AIService:
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -22,117 +165,143 @@ class AIService:
             chunk_size=1000,
             chunk_overlap=200
         )
+        # LLM calls that outlived their latency budget, kept referenced until they finish
+        self._late_tasks: Set[asyncio.Task] = set()
 
-    async def generate_todo_suggestions(self, todo_title: str, todo_description: Optional[str] = None) -> List[str]:
-        """Generate AI-powered suggestions for a todo item."""
-        prompt = PromptTemplate(
-            input_variables=["title", "description"],
-            template="""Given this todo item:
-            Title: {title}
-            Description: {description}
-            
-            Please provide 3 smart suggestions to enhance this todo item, considering:
-            1. Priority and urgency
-            2. Potential subtasks
-            3. Related resources or contacts
-            
-            Format the response as a list of suggestions."""
-        )
+    async def _chat(self, operation: str, messages: List[dict]) -> str:
+        """Run a chat completion on the model routed to, with retries, recording a span and latency/token metrics."""
+        start = time.perf_counter()
+        route = model_router.route(operation, count_message_tokens(messages))
+        with tracer.start_as_current_span(f"llm.{operation}") as span:
+            span.set_attribute("llm.route.tier", route.tier)
+            span.set_attribute("llm.route.reason", route.reason)
+            span.set_attribute("llm.max_tokens", route.max_tokens)
+            retries = 0
+            usage = None
+            try:
+                while True:
+                    try:
+                        response = await openai.ChatCompletion.acreate(
+                            model=route.model, messages=messages, max_tokens=route.max_tokens,
+                            temperature=settings.TEMPERATURE,
+                        )
+                        break
+                    except RETRYABLE_ERRORS:
+                        if retries >= settings.AI_MAX_RETRIES:
+                            raise
+                        retries += 1
+                        await asyncio.sleep(0.5 * 2 ** retries)
+                usage = response.get("usage")
+                return response.choices[0].message.content
+            finally:
+                model_router.observe(route.model, time.perf_counter() - start)
+                record_llm_call(span, route.model, start, retries, usage, route=operation)
 
+    async def stop(self) -> None:
+        """Cancel LLM calls still running past their budget; their results would have nowhere to go."""
+        for task in list(self._late_tasks):
+            task.cancel()
+        await asyncio.gather(*self._late_tasks, return_exceptions=True)
+
+    async def _within_budget(
+        self, operation: str, call: Awaitable, fallback: Callable[[], Any],
+        result_key: Optional[Tuple[str, str]] = None,
+    ):
+        """Wait up to ``AI_LATENCY_BUDGET`` seconds for an LLM call, otherwise answer with ``fallback()``.
+
+        An overrunning call keeps going in the background; if it succeeds, its
+        result is recorded in ``late_results`` under ``result_key`` (an
+        ``(entity, id)`` pair). A failed call falls back too.
+        """
+        task = asyncio.ensure_future(call)
+        budget = settings.AI_LATENCY_BUDGET
         try:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a productivity assistant."},
-                    {"role": "user", "content": prompt.format(
-                        title=todo_title,
-                        description=todo_description or "No description provided"
-                    )}
-                ]
-            )
-            
-            content = response.choices[0].message.content
-            return [suggestion.strip() for suggestion in content.split("\n") if suggestion.strip()]
+            return await (asyncio.wait_for(asyncio.shield(task), budget) if budget > 0 else task)
+        except asyncio.TimeoutError:
+            llm_fallbacks.add(1, {"operation": operation, "reason": "timeout"})
+            self._late_tasks.add(task)
+            task.add_done_callback(functools.partial(self._record_late, operation, result_key))
+            return fallback()
         except Exception as e:
-            print(f"Error generating todo suggestions: {str(e)}")
-            return ["Unable to generate suggestions at this time."]
-
-    async def analyze_journal_entry(self, content: str) -> dict:
-        """Analyze a journal entry for insights and mood."""
-        prompt = PromptTemplate(
-            input_variables=["content"],
-            template="""Analyze this journal entry and provide insights:
-            {content}
-            
-            Please provide:
-            1. Overall mood
-            2. Key themes
-            3. Action items or follow-ups
-            4. Emotional patterns
-            
-            Format the response as a JSON object."""
+            logger.error("Error in %s: %s", operation, e)
+            llm_fallbacks.add(1, {"operation": operation, "reason": "error"})
+            return fallback()
+
+    def _record_late(self, operation: str, result_key: Optional[Tuple[str, str]], task: asyncio.Task) -> None:
+        self._late_tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning("Late %s failed: %s", operation, task.exception())
+        elif result_key is not None:
+            late_results.record(*result_key, operation, task.result())
+
+    async def generate_todo_suggestions(
+        self, todo_title: str, todo_description: Optional[str] = None,
+        result_key: Optional[Tuple[str, str]] = None,
+    ) -> List[str]:
+        """Generate AI-powered suggestions for a todo item, locally if the LLM is over budget."""
+        return await self._within_budget(
+            "todo_suggestions",
+            self._llm_todo_suggestions(todo_title, todo_description),
+            lambda: local_analyzer.suggest_subtasks(todo_title, todo_description),
+            result_key,
         )
 
-        try:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an empathetic journal analyzer."},
-                    {"role": "user", "content": prompt.format(content=content)}
-                ]
-            )
-            
-            content = response.choices[0].message.content
-            # In production, use proper JSON parsing
-            import json
-            try:
-                return json.loads(content)
-            except:
-                return {
-                    "mood": "neutral",
-                    "themes": ["Unable to analyze"],
-                    "action_items": [],
-                    "emotional_patterns": []
-                }
-        except Exception as e:
-            print(f"Error analyzing journal entry: {str(e)}")
-            return {
-                "mood": "neutral",
-                "themes": ["Error in analysis"],
-                "action_items": [],
-                "emotional_patterns": []
-            }
+    async def _llm_todo_suggestions(self, todo_title: str, todo_description: Optional[str]) -> List[str]:
+        content = await self._chat("todo_suggestions", TODO_SUGGESTIONS.messages(
+            title=todo_title,
+            description=todo_description or "No description provided",
+        ))
+        return [suggestion.strip() for suggestion in content.split("\n") if suggestion.strip()]
 
-    async def suggest_goal_improvements(self, goal_title: str, goal_description: Optional[str] = None) -> dict:
-        """Generate AI-powered suggestions for improving a goal."""
-        prompt = PromptTemplate(
-            input_variables=["title", "description"],
-            template="""Analyze this goal and provide improvement suggestions:
-            Title: {title}
-            Description: {description}
-            
-            Please provide:
-            1. SMART criteria analysis
-            2. Potential milestones
-            3. Resource recommendations
-            4. Risk factors
-            
-            Format the response as a JSON object."""
+    async def analyze_journal_entry(self, content: str, result_key: Optional[Tuple[str, str]] = None) -> dict:
+        """Analyze a journal entry for insights and mood, locally if the LLM is over budget."""
+        return await self._within_budget(
+            "journal_analysis",
+            self._llm_analyze_journal_entry(content),
+            lambda: local_analyzer.analyze_journal_entry(content),
+            result_key,
         )
 
+    async def _llm_analyze_journal_entry(self, content: str) -> dict:
+        if len(content) > settings.JOURNAL_CHUNK_THRESHOLD:
+            return await self._analyze_journal_chunks(content)
+
+        reply = await self._chat("journal_analysis", JOURNAL_ANALYSIS.messages(content=content))
+        # Unparseable replies raise and are answered by the local analyzer
+        return json.loads(reply)
+
+    async def _analyze_journal_chunks(self, content: str) -> dict:
+        """Analyze a long entry piecewise, a bounded number of chunks at a time, and merge the results."""
+        chunks = self.text_splitter.split_text(content)
+        semaphore = asyncio.BoundedSemaphore(settings.JOURNAL_CHUNK_CONCURRENCY)
+
+        async def analyze(index: int, chunk: str) -> Optional[dict]:
+            async with semaphore:
+                try:
+                    reply = await self._chat("journal_analysis_chunk", JOURNAL_CHUNK_ANALYSIS.messages(
+                        content=chunk, part=index + 1, parts=len(chunks),
+                    ))
+                    result = json.loads(reply)
+                    return result if isinstance(result, dict) else None
+                except Exception as e:
+                    logger.error("Error analyzing journal chunk %d/%d: %s", index + 1, len(chunks), e)
+                    return None
+
+        results = await asyncio.gather(*(analyze(index, chunk) for index, chunk in enumerate(chunks)))
+        analyzed = [(result, len(chunk)) for result, chunk in zip(results, chunks) if result is not None]
+        if not analyzed:
+            raise ValueError(f"None of the {len(chunks)} journal chunks could be analyzed")
+        return merge_journal_analyses(analyzed)
+
+    async def suggest_goal_improvements(self, goal_title: str, goal_description: Optional[str] = None) -> dict:
+        """Generate AI-powered suggestions for improving a goal."""
         try:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a goal-setting expert."},
-                    {"role": "user", "content": prompt.format(
-                        title=goal_title,
-                        description=goal_description or "No description provided"
-                    )}
-                ]
-            )
-            
-            content = response.choices[0].message.content
+            content = await self._chat("goal_improvements", GOAL_IMPROVEMENTS.messages(
+                title=goal_title,
+                description=goal_description or "No description provided",
+            ))
             # In production, use proper JSON parsing
             import json
             try:
@@ -145,7 +314,7 @@ class AIService:
                     "risks": []
                 }
         except Exception as e:
-            print(f"Error suggesting goal improvements: {str(e)}")
+            logger.error("Error suggesting goal improvements: %s", e)
             return {
                 "smart_criteria": "Error in analysis",
                 "milestones": [],
@@ -155,37 +324,12 @@ class AIService:
 
     async def get_productivity_insights(self, todos: List[dict], journal_entries: List[dict], goals: List[dict]) -> dict:
         """Generate comprehensive productivity insights based on user data."""
-        prompt = PromptTemplate(
-            input_variables=["todos", "journal_entries", "goals"],
-            template="""Analyze this user's productivity data and provide insights:
-            
-            Todos: {todos}
-            Journal Entries: {journal_entries}
-            Goals: {goals}
-            
-            Please provide:
-            1. Productivity patterns
-            2. Areas for improvement
-            3. Achievement highlights
-            4. Recommended next steps
-            
-            Format the response as a JSON object."""
-        )
-
         try:
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a productivity analyst."},
-                    {"role": "user", "content": prompt.format(
-                        todos=str(todos),
-                        journal_entries=str(journal_entries),
-                        goals=str(goals)
-                    )}
-                ]
-            )
-            
-            content = response.choices[0].message.content
+            content = await self._chat("productivity_insights", PRODUCTIVITY_INSIGHTS.messages(
+                todos=todos,
+                journal_entries=journal_entries,
+                goals=goals,
+            ))
             # In production, use proper JSON parsing
             import json
             try:
@@ -198,7 +342,7 @@ class AIService:
                     "next_steps": []
                 }
         except Exception as e:
-            print(f"Error getting productivity insights: {str(e)}")
+            logger.error("Error getting productivity insights: %s", e)
             return {
                 "patterns": ["Error in analysis"],
                 "improvements": [],
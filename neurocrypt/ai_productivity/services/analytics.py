@@ -0,0 +1,284 @@
+"""
+Columnar analytics snapshot of todos, journal entries and goals.
+
+Each entity is held as a set of typed numpy arrays (datetimes as
+``datetime64[s]``, flags as ``bool``, moods, statuses and goals as integer
+codes into a per-column category list, held in the narrowest integer type the
+category count allows) so analytics queries are vectorized group-bys instead
+of loops over ORM objects.
+
+The snapshot is built once with a column-only scan of each table and then
+refreshed incrementally from the delta-sync feed, starting at the change
+sequence it last saw: only rows written since then are re-read. A refresh runs at most every ``ANALYTICS_REFRESH_INTERVAL``
+seconds, so a burst of dashboard requests costs one refresh.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("day", "week", "month")
+
+# Rows per delta-sync page while refreshing
+REFRESH_PAGE = 5000
+
+# 1970-01-05, the first Monday after the epoch, in days
+_MONDAY = 4
+
+class Categories:
+    """String values as small integer codes; code 0 means missing."""
+
+    def __init__(self):
+        self.names: List[Optional[str]] = [None]
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.names)
+            self.names.append(value)
+        return code
+
+class ColumnTable:
+    """Typed column arrays with an id -> row index; deleted rows are masked and reclaimed on compaction."""
+
+    def __init__(self, dtypes: Dict[str, str], categories: tuple = (), capacity: int = 1024):
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        self.categories = {name: Categories() for name in categories}
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in self.dtypes.items()}
+        self.live = np.zeros(capacity, bool)
+        self.ids = np.empty(capacity, object)
+        self.index: Dict[str, int] = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def nbytes(self) -> int:
+        return self.live.nbytes + self.ids.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def upsert(self, obj_id: str, row: dict) -> None:
+        position = self.index.get(obj_id)
+        if position is None:
+            if self.size == len(self.live):
+                self._grow()
+            position = self.index[obj_id] = self.size
+            self.size += 1
+            self.live[position] = True
+            self.ids[position] = obj_id
+        for name, column in self.columns.items():
+            value = row.get(name)
+            if name in self.categories:
+                value = self.categories[name].code(value)
+                column = self._fit_codes(name)
+            elif value is None:
+                value = np.datetime64("NaT") if column.dtype.kind == "M" else 0
+            column[position] = value
+
+    def extend(self, rows: list) -> None:
+        """Append ``(id, *values)`` tuples for new ids, converting each column in one pass."""
+        if not rows:
+            return
+        start, end = self.size, self.size + len(rows)
+        while end > len(self.live):
+            self._grow()
+        columns = list(zip(*rows))
+        self.ids[start:end] = columns[0]
+        for (name, column), values in zip(self.columns.items(), columns[1:]):
+            if name in self.categories:
+                values = [self.categories[name].code(value) for value in values]
+                column = self._fit_codes(name)
+            elif column.dtype.kind == "M":
+                values = np.array(values, dtype="datetime64[us]")
+            else:
+                values = [0 if value is None else value for value in values]
+            column[start:end] = values
+        self.live[start:end] = True
+        self.index.update(zip(columns[0], range(start, end)))
+        self.size = end
+
+    def delete(self, obj_id: str) -> None:
+        position = self.index.pop(obj_id, None)
+        if position is not None:
+            self.live[position] = False
+            self.ids[position] = None
+            if self.size > 1024 and len(self.index) < self.size // 2:
+                self._compact()
+
+    def view(self) -> Dict[str, np.ndarray]:
+        """The live rows of every column, plus ``id`` (copies, safe to keep across refreshes)."""
+        mask = self.live[:self.size]
+        view = {name: column[:self.size][mask] for name, column in self.columns.items()}
+        view["id"] = self.ids[:self.size][mask]
+        return view
+
+    def _fit_codes(self, name: str) -> np.ndarray:
+        """A category column, widened first if its latest code doesn't fit its integer type."""
+        column = self.columns[name]
+        largest = len(self.categories[name].names) - 1
+        if largest > np.iinfo(column.dtype).max:
+            dtype = np.promote_types(column.dtype, np.min_scalar_type(-largest - 1))
+            column = self.columns[name] = column.astype(dtype)
+            self.dtypes[name] = dtype
+        return column
+
+    def _grow(self) -> None:
+        capacity = len(self.live) * 2
+        for name, column in self.columns.items():
+            self.columns[name] = np.resize(column, capacity)
+        self.ids = np.concatenate([self.ids, np.empty(capacity - len(self.ids), object)])
+        self.live = np.concatenate([self.live, np.zeros(capacity - len(self.live), bool)])
+
+    def _compact(self) -> None:
+        mask = self.live[:self.size]
+        old_positions = np.flatnonzero(mask)
+        for column in (*self.columns.values(), self.ids):
+            kept = column[:self.size][mask]
+            column[:len(kept)] = kept
+        self.ids[len(old_positions):] = None
+        new_position = {old: new for new, old in enumerate(old_positions.tolist())}
+        self.index = {obj_id: new_position[position] for obj_id, position in self.index.items()}
+        self.size = len(old_positions)
+        self.live[:] = False
+        self.live[:self.size] = True
+
+def bucket(dates: np.ndarray, period: str) -> np.ndarray:
+    """Start of the day/week (Monday)/month containing each date."""
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(PERIODS)}")
+    if period == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    days = dates.astype("datetime64[D]")
+    if period == "day":
+        return days
+    offsets = (days.astype(np.int64) - _MONDAY) % 7
+    return days - offsets.astype("timedelta64[D]")
+
+def _period_labels(periods: np.ndarray) -> List[str]:
+    return np.datetime_as_string(periods, unit="D").tolist()
+
+class AnalyticsSnapshot:
+    def __init__(self, db_service, refresh_interval: float = 1.0):
+        self.db_service = db_service
+        self.refresh_interval = refresh_interval
+        self.seq = 0
+        self.refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.tables = {
+            "todos": ColumnTable(
+                {"created_at": "datetime64[s]", "due_date": "datetime64[s]", "completed": "bool",
+                 "priority": "int8", "goal_id": "int8"},
+                categories=("goal_id",),
+            ),
+            "journal_entries": ColumnTable({"created_at": "datetime64[s]", "mood": "int8"}, categories=("mood",)),
+            "goals": ColumnTable(
+                {"created_at": "datetime64[s]", "target_date": "datetime64[s]", "progress": "float32",
+                 "status": "int8", "todo_count": "int32", "completed_count": "int32"},
+                categories=("status",),
+            ),
+        }
+        self.seq = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self.tables.values())
+
+    async def build(self) -> None:
+        """Load every table column-wise, without ORM objects, as of the current change sequence."""
+        self._reset()
+        position = await self.db_service.get_sync_position()
+        for collection, table in self.tables.items():
+            async for rows in self.db_service.iter_columns(collection, list(table.columns), position):
+                table.extend(rows)
+        # Rows written after ``position`` were skipped and come in on the next refresh
+        self.seq = position
+
+    async def refresh(self, force: bool = False) -> None:
+        """Apply every change since the last refresh, rebuilding if tombstones were compacted past it."""
+        if not force and time.monotonic() - self.refreshed_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self.refreshed_at < self.refresh_interval:
+                return
+            if self.seq and self.seq < await self.db_service.get_tombstone_floor():
+                logger.info("Analytics snapshot is older than the tombstone floor; rebuilding")
+                self.seq = 0
+            if not self.seq:
+                await self.build()
+            while True:
+                page = await self.db_service.get_changes_since(self.seq, REFRESH_PAGE)
+                for change in page["changes"]:
+                    table = self.tables[change["entity"]]
+                    if change["op"] == "delete":
+                        table.delete(change["data"]["id"])
+                    else:
+                        table.upsert(change["data"]["id"], change["data"])
+                self.seq = page["next_since"]
+                if not page["has_more"]:
+                    break
+            self.refreshed_at = time.monotonic()
+
+    def todo_completion(self, period: str = "week") -> List[dict]:
+        """Todos created per period and the share of them completed."""
+        todos = self.tables["todos"].view()
+        created = todos["created_at"]
+        known = ~np.isnat(created)
+        periods, inverse = np.unique(bucket(created[known], period), return_inverse=True)
+        totals = np.bincount(inverse, minlength=len(periods))
+        completed = np.bincount(inverse, weights=todos["completed"][known], minlength=len(periods)).astype(np.int64)
+        return [
+            {"period": label, "created": int(total), "completed": int(done), "completion_rate": done / total}
+            for label, total, done in zip(_period_labels(periods), totals.tolist(), completed.tolist())
+        ]
+
+    def mood_distribution(self, period: str = "week") -> List[dict]:
+        """Journal entries per mood for each period."""
+        table = self.tables["journal_entries"]
+        entries = table.view()
+        created = entries["created_at"]
+        known = ~np.isnat(created)
+        periods, inverse = np.unique(bucket(created[known], period), return_inverse=True)
+        moods = table.categories["mood"].names
+        counts = np.bincount(
+            inverse * len(moods) + entries["mood"][known], minlength=len(periods) * len(moods)
+        ).reshape(len(periods), len(moods))
+        labels = [mood or "unknown" for mood in moods]
+        return [
+            {"period": label, "moods": {labels[code]: count for code, count in enumerate(row) if count}}
+            for label, row in zip(_period_labels(periods), counts.tolist())
+        ]
+
+    def goal_velocity(self, now: Optional[datetime] = None) -> List[dict]:
+        """Progress per day for active goals and whether they are on pace for their target date."""
+        table = self.tables["goals"]
+        goals = table.view()
+        status = table.categories["status"]
+        active = goals["status"] == status.code("active")
+        now = np.datetime64(now or datetime.utcnow(), "s")
+        elapsed_days = (now - goals["created_at"][active]).astype(np.float64) / 86400
+        progress = goals["progress"][active].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            velocity = np.where(elapsed_days > 0, progress / elapsed_days, 0.0)
+            days_left = np.where(velocity > 0, (100.0 - progress) / velocity, np.inf)
+        target = goals["target_date"][active]
+        remaining_days = (target - now).astype(np.float64) / 86400
+        on_track = np.where(np.isnat(target), True, days_left <= remaining_days)
+        return [
+            {
+                "id": goal_id, "progress": round(p, 2), "velocity_per_day": round(v, 4),
+                "projected_days_left": None if np.isinf(d) else round(d, 1), "on_track": bool(t),
+            }
+            for goal_id, p, v, d, t in zip(
+                goals["id"][active].tolist(), progress.tolist(), velocity.tolist(), days_left.tolist(), on_track.tolist()
+            )
+        ]
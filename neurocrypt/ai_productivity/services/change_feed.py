@@ -0,0 +1,172 @@
+"""
+Change feed: pushes create/update/delete events from ``DatabaseService`` to
+WebSocket and SSE clients so dashboards don't have to poll.
+
+- ``publish()`` is an O(1) ``put_nowait`` onto the feed's inbox; a dispatcher
+  task does the JSON encoding (once per event) and the fan-out, so writes never
+  wait on subscribers.
+- Every client has a bounded buffer. A client that falls ``CHANGE_FEED_BUFFER``
+  events behind is disconnected instead of growing memory without limit.
+- Local events are forwarded over the worker bus, and events from other worker
+  processes are fanned out to this process's clients. Creates and updates go
+  over the bus as row references, which a worker with subscribers for them
+  loads with ``row_loader``, so big rows never travel between processes.
+- A client only gets the events of the tenant it subscribed as.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+from fastapi.encoders import jsonable_encoder
+from ..config import settings
+from .shards import DEFAULT_TENANT, current_tenant
+from .worker_bus import worker_bus
+
+logger = logging.getLogger(__name__)
+
+ENTITIES = ("todos", "journal_entries", "goals")
+# Ops whose event carries the whole row
+ROW_OPS = ("create", "update")
+
+# Yield to the event loop every this many deliveries during a large fan-out
+FAN_OUT_BATCH = 500
+
+class Subscription:
+    """One connected client: its tenant, the entities it follows and its bounded buffer."""
+
+    def __init__(self, entities: Set[str], max_buffer: int, tenant: str = DEFAULT_TENANT):
+        self.entities = entities
+        self.tenant = tenant
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=max_buffer)
+        self.closed = False
+
+    async def get(self) -> Optional[str]:
+        """Next encoded event, or ``None`` once the client has been cut off as too slow."""
+        return await self.queue.get()
+
+    def _deliver(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _cut_off(self) -> None:
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class ChangeFeed:
+    def __init__(self, max_buffer: int = 256, inbox_size: int = 10000):
+        self.max_buffer = max_buffer
+        self.inbox_size = inbox_size
+        self.dropped = 0
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._inbox: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        # (entity, tenant, id) -> the row as stored, or None once it is gone; set by the database service
+        self.row_loader: Optional[Callable[[str, str, str], Awaitable[Optional[dict]]]] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(set().union(*self._subscribers.values())) if self._subscribers else 0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue(maxsize=self.inbox_size)
+        self._task = self._loop.create_task(self._dispatch())
+        worker_bus.subscribe("changes", self._publish_remote)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for subscription in set().union(*self._subscribers.values()) if self._subscribers else ():
+            subscription._cut_off()
+        self._subscribers.clear()
+
+    def subscribe(self, entities: Optional[Iterable[str]] = None) -> Subscription:
+        wanted = set(entities or ENTITIES)
+        unknown = wanted - set(ENTITIES)
+        if unknown:
+            raise ValueError(f"Unknown entities: {', '.join(sorted(unknown))}")
+        subscription = Subscription(wanted, self.max_buffer, current_tenant.get())
+        for entity in wanted:
+            self._subscribers[entity].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for entity in subscription.entities:
+            self._subscribers[entity].discard(subscription)
+
+    def publish(self, entity: str, op: str, row: dict) -> None:
+        """Queue a change made in this process. Never blocks."""
+        self._enqueue(({"entity": entity, "op": op, "data": row}, True))
+
+    def _publish_remote(self, event: dict) -> None:
+        # Runs on the worker bus listener thread
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._enqueue, (event, False))
+
+    def _enqueue(self, item) -> None:
+        if self._inbox is None:
+            return
+        try:
+            self._inbox.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Change feed inbox full; dropped %d events so far", self.dropped)
+
+    async def _dispatch(self) -> None:
+        while True:
+            event, local = await self._inbox.get()
+            try:
+                if local:
+                    event = jsonable_encoder(event)
+                    worker_bus.publish("changes", self._reference(event))
+                tenant = event["data"].get("tenant_id", DEFAULT_TENANT)
+                if event.get("ref"):
+                    event = await self._resolve(event, tenant)
+                    if event is None:
+                        continue
+                await self._fan_out(event["entity"], tenant, json.dumps(event))
+            except Exception:
+                logger.exception("Change feed dispatch failed")
+
+    def _reference(self, event: dict) -> dict:
+        if event["op"] not in ROW_OPS or self.row_loader is None:
+            return event
+        data = event["data"]
+        return {
+            "entity": event["entity"], "op": event["op"], "ref": True,
+            "data": {"id": data["id"], "tenant_id": data.get("tenant_id", DEFAULT_TENANT)},
+        }
+
+    async def _resolve(self, event: dict, tenant: str) -> Optional[dict]:
+        """A referenced row's event with the row loaded, or None when nobody here wants it."""
+        entity = event["entity"]
+        wanted = any(s.tenant == tenant and not s.closed for s in self._subscribers.get(entity, ()))
+        if not wanted or self.row_loader is None:
+            return None
+        row = await self.row_loader(entity, tenant, event["data"]["id"])
+        if row is None:
+            return None  # deleted since; its delete event follows
+        return jsonable_encoder({"entity": entity, "op": event["op"], "data": row})
+
+    async def _fan_out(self, entity: str, tenant: str, message: str) -> None:
+        for count, subscription in enumerate(list(self._subscribers.get(entity, ()))):
+            if subscription.closed or subscription.tenant != tenant:
+                continue
+            if not subscription._deliver(message):
+                logger.info("Disconnecting slow change feed consumer (%d events behind)", self.max_buffer)
+                self.unsubscribe(subscription)
+                subscription._cut_off()
+            if count % FAN_OUT_BATCH == FAN_OUT_BATCH - 1:
+                await asyncio.sleep(0)
+
+change_feed = ChangeFeed(settings.CHANGE_FEED_BUFFER)
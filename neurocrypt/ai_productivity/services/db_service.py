@@ -1,188 +1,1116 @@
-from typing import List, Optional
-from sqlalchemy import create_engine, Column, String, Integer, Float, Boolean, DateTime, JSON
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import functools
+import logging
+from sqlalchemy import (
+    BigInteger, Column, String, Integer, Float, Boolean, DateTime, JSON, ForeignKey, Index, bindparam, case, delete,
+    func, inspect, literal, or_, select, tuple_, update,
+)
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from ..config import settings
+from ..telemetry import db_span, instrument_engine
+from . import ranking
+from .change_feed import change_feed
+from .reminders import reminders
+from .shards import DEFAULT_TENANT, ShardRouter, TenantMoved, current_tenant, parse_shards
+from .worker_bus import worker_bus
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./neurocrypt.db")
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=os.getenv("SQL_ECHO", "true").lower() == "true")
+instrument_engine(engine.sync_engine)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
+# Tenant data is spread over shards (see services/shards.py); DATABASE_URL is the default shard
+router = ShardRouter(
+    engine, parse_shards(settings.DATABASE_SHARDS), echo=engine.echo,
+    pool_size=settings.DATABASE_POOL_SIZE, max_overflow=settings.DATABASE_MAX_OVERFLOW,
+)
+
 # Models
 class Todo(Base):
     __tablename__ = "todos"
 
     id = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=False, default=DEFAULT_TENANT)
     title = Column(String, nullable=False)
     description = Column(String)
     priority = Column(Integer, default=1)
-    due_date = Column(DateTime)
+    due_date = Column(DateTime, index=True)
     completed = Column(Boolean, default=False)
+    goal_id = Column(String, ForeignKey("goals.id"), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False)
+    seq = Column(Integer)
+    # Smart-order score, see services/ranking.py; (rank_score, id) is the keyset
+    rank_score = Column(Float)
+
+    __table_args__ = (
+        Index("ix_todos_tenant_rank_score_id", "tenant_id", "rank_score", "id"),
+        Index("ix_todos_tenant_seq", "tenant_id", "seq"),
+        Index("ix_todos_tenant_created_at", "tenant_id", "created_at", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 class JournalEntry(Base):
     __tablename__ = "journal_entries"
 
     id = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=False, default=DEFAULT_TENANT)
     content = Column(String, nullable=False)
     mood = Column(String)
     tags = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False)
+    seq = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_journal_entries_tenant_seq", "tenant_id", "seq"),
+        Index("ix_journal_entries_tenant_created_at", "tenant_id", "created_at", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 class Goal(Base):
     __tablename__ = "goals"
 
     id = Column(String, primary_key=True)
+    tenant_id = Column(String, nullable=False, default=DEFAULT_TENANT)
     title = Column(String, nullable=False)
     description = Column(String)
-    target_date = Column(DateTime)
+    target_date = Column(DateTime, index=True)
+    # Percent of linked todos completed, kept current by DatabaseService on
+    # every todo write; left as set by the client while no todos are linked
     progress = Column(Float, default=0.0)
+    todo_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
     status = Column(String, default="active")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False)
+    seq = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_goals_tenant_seq", "tenant_id", "seq"),
+        Index("ix_goals_tenant_created_at", "tenant_id", "created_at", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+class SyncCounter(Base):
+    """Named counters for delta sync: each tenant's change sequence and tombstone compaction floor.
+
+    A negative value fences the tenant off this shard after a move: see ``next_seq``.
+    """
+    __tablename__ = "sync_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class Tombstone(Base):
+    """Record of a hard delete, kept so sync clients can drop their local copy."""
+    __tablename__ = "tombstones"
+
+    tenant_id = Column(String, primary_key=True, default=DEFAULT_TENANT)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    entity = Column(String, nullable=False)
+    entity_id = Column(String, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class TenantShard(Base):
+    """Where a moved tenant lives; tenants without a row are on the default shard. Kept on the default shard."""
+    __tablename__ = "tenant_shards"
+
+    tenant_id = Column(String, primary_key=True)
+    shard = Column(String, nullable=False)
+    moved_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Tick(Base):
+    """One market trade, appended in arrival order; see services/markets.py."""
+    __tablename__ = "ticks"
+
+    # An integer rowid on SQLite, so appends land at the end of the table
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    symbol = Column(String, nullable=False)
+    ts = Column(BigInteger, nullable=False)  # epoch milliseconds
+    price = Column(Float, nullable=False)
+    size = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_ticks_symbol_ts", "symbol", "ts"),)
+
+class Candle(Base):
+    """OHLCV rollup of the ticks in one ``resolution``-second bucket starting at ``start`` (epoch ms)."""
+    __tablename__ = "candles"
+
+    symbol = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    start = Column(BigInteger, primary_key=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume = Column(Float, nullable=False)
+    trades = Column(Integer, nullable=False)
+    # Times of the ticks behind open and close, so partial candles merge in any order
+    first_ts = Column(BigInteger, nullable=False)
+    last_ts = Column(BigInteger, nullable=False)
+
+MODELS = {model.__tablename__: model for model in (Todo, JournalEntry, Goal)}
+
+# Tables that can be exported in bulk, with the column each one is filtered and ordered on
+EXPORT_TABLES = {
+    **{name: (model, model.updated_at, model.created_at) for name, model in MODELS.items()},
+    "tombstones": (Tombstone, Tombstone.deleted_at, Tombstone.deleted_at),
+}
+
+# Maintained by DatabaseService itself, never taken from caller data
+PROTECTED_FIELDS = ("id", "version", "seq", "todo_count", "completed_count", "rank_score", "tenant_id")
+
+SEQUENCE = "changes"
+TOMBSTONE_FLOOR = "tombstone_floor"
+# Per shard, bumped by rescoring, which reorders todos without a change sequence number
+RANK_SCORES = "rank_scores"
+
+def counter_name(name: str, tenant: Optional[str]) -> str:
+    """The ``SyncCounter`` row holding a tenant's ``name`` counter (the default tenant's keep their plain names)."""
+    return name if tenant in (None, DEFAULT_TENANT) else f"{name}:{tenant}"
+
+def counter_value(value: Optional[int]) -> int:
+    """A counter's value with any move fence undone."""
+    return 0 if value is None else value if value >= 0 else -value - 1
+
+# Values for NOT NULL columns added to existing rows by _upgrade_schema (besides the column defaults)
+UPGRADE_DEFAULTS = {"version": 1}
+
+def _upgrade_schema(conn) -> None:
+    """Bring tables created by an older release up to the models; create_all only adds missing tables.
+
+    Missing columns are added (existing rows get the column default) and missing
+    indexes created. The tombstones table, whose key gained ``tenant_id``, is
+    rebuilt with its rows kept. Goal rollups and rank scores of old rows are
+    filled in by their sweeps, change sequence numbers by ``_backfill_seq``.
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    preparer = conn.dialect.identifier_preparer
+    if "tombstones" in tables and "tenant_id" not in {c["name"] for c in inspector.get_columns("tombstones")}:
+        # Kept short by compaction, so copying through memory is fine
+        columns = (Tombstone.__table__.c[name] for name in ("seq", "entity", "entity_id", "deleted_at"))
+        rows = conn.execute(select(*columns)).mappings().all()
+        Tombstone.__table__.drop(conn)
+        Tombstone.__table__.create(conn)
+        if rows:
+            conn.execute(Tombstone.__table__.insert(), [{**row, "tenant_id": DEFAULT_TENANT} for row in rows])
+        logger.info("Rebuilt the tombstones table with tenant keys (%d rows)", len(rows))
+        inspector = inspect(conn)  # the first one cached the old columns
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+                  f"{column.type.compile(conn.dialect)}"
+            default = UPGRADE_DEFAULTS.get(column.name, getattr(column.default, "arg", None))
+            if default is not None and not callable(default):
+                ddl += " DEFAULT " + str(literal(default).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            if not column.nullable:
+                ddl += " NOT NULL"
+            conn.exec_driver_sql(ddl)
+            logger.info("Added column %s.%s", table.name, column.name)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def _backfill_seq(batch_size: int = 1000) -> None:
+    """Give rows from before delta sync (no ``seq``) change sequence numbers, so sync clients receive them."""
+    for shard in router.shards():
+        for model in MODELS.values():
+            while True:
+                async with shard.session(DEFAULT_TENANT) as session:
+                    result = await session.execute(
+                        select(model.tenant_id, model.id).where(model.seq.is_(None)).limit(batch_size)
+                    )
+                    rows = result.all()
+                    if not rows:
+                        break
+                    tenant = rows[0][0]
+                    ids = [obj_id for row_tenant, obj_id in rows if row_tenant == tenant]
+                    try:
+                        last = await next_seq(session, len(ids), tenant)
+                    except TenantMoved:
+                        break  # an old copy, deleted once the move's grace period ends
+                    await session.execute(
+                        model.__table__.update().where(model.__table__.c.id == bindparam("_id"))
+                        .values(seq=bindparam("_seq")),
+                        [{"_id": obj_id, "_seq": last - len(ids) + 1 + i} for i, obj_id in enumerate(ids)],
+                    )
+                    await session.commit()
 
 # Create tables
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for shard in router.shards():
+        try:
+            async with shard.engine.begin() as conn:
+                await conn.run_sync(_upgrade_schema)
+                await conn.run_sync(Base.metadata.create_all)
+        except OperationalError:
+            # Another worker process created or upgraded the schema concurrently;
+            # on the second pass the existing tables and columns are skipped
+            async with shard.engine.begin() as conn:
+                await conn.run_sync(_upgrade_schema)
+                await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as session:
+        for name in (SEQUENCE, TOMBSTONE_FLOOR):
+            if await session.get(SyncCounter, name) is None:
+                session.add(SyncCounter(name=name, value=0))
+        try:
+            await session.commit()
+        except IntegrityError:
+            pass  # seeded by another worker
+    await _backfill_seq()
+    await load_tenant_placements()
+
+async def load_tenant_placements(tenant: Optional[str] = None) -> None:
+    """Refresh the router's cached placements (one tenant's, or all) from the catalog."""
+    query = select(TenantShard.tenant_id, TenantShard.shard)
+    if tenant is not None:
+        query = query.where(TenantShard.tenant_id == tenant)
+    async with async_session() as session:
+        rows = (await session.execute(query)).all()
+    if tenant is None:
+        router.placements = {}
+    for tenant_id, shard in rows:
+        try:
+            router.place(tenant_id, shard)
+        except KeyError:
+            logger.error("Tenant %s is placed on shard %s, which isn't in DATABASE_SHARDS", tenant_id, shard)
+
+async def _bump_counter(session: AsyncSession, name: str) -> None:
+    result = await session.execute(
+        update(SyncCounter).where(SyncCounter.name == name).values(value=SyncCounter.value + 1)
+    )
+    if result.rowcount == 0:
+        session.add(SyncCounter(name=name, value=1))
+
+async def next_seq(session: AsyncSession, count: int = 1, tenant: Optional[str] = None) -> int:
+    """Allocate the tenant's next ``count`` change sequence numbers inside the caller's transaction.
+
+    Returns the last number of the block. The counter row stays write-locked
+    until the transaction commits, so sequence numbers become visible in commit
+    order and a reader that has seen the counter at N has also seen every
+    change numbered up to N. The tenant defaults to the one the session was
+    opened for.
+
+    Every write goes through here, so a tenant move fences the tenant off its
+    old shard by negating this counter: from then on writes there raise
+    ``TenantMoved`` instead of committing.
+    """
+    name = counter_name(SEQUENCE, tenant or session.info.get("tenant"))
+    result = await session.execute(
+        update(SyncCounter).where(SyncCounter.name == name, SyncCounter.value >= 0)
+        .values(value=SyncCounter.value + count)
+    )
+    if result.rowcount == 0:
+        if (await session.execute(select(SyncCounter.value).where(SyncCounter.name == name))).scalar() is not None:
+            raise TenantMoved(tenant or session.info.get("tenant"))
+        # The tenant's first write on this shard, or a schema created without init_db()
+        session.add(SyncCounter(name=name, value=count))
+        return count
+    result = await session.execute(select(SyncCounter.value).where(SyncCounter.name == name))
+    return result.scalar_one()
+
+def _upsert_statement(table, dialect: str = engine.dialect.name, verbatim: bool = False):
+    """INSERT ... ON CONFLICT (id) DO UPDATE where the dialect supports it, else a plain INSERT.
+
+    A row is only replaced by one for the same tenant. The replaced row's
+    version is bumped unless ``verbatim``.
+    """
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return table.insert()
+    statement = insert(table)
+    updates = {column.name: statement.excluded[column.name] for column in table.columns if column.name != "id"}
+    if not verbatim:
+        updates["version"] = table.c.version + 1
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.id], set_=updates, where=table.c.tenant_id == statement.excluded.tenant_id,
+    )
+
+def _candle_merge_statement():
+    """Upsert of partial candles that folds each one into the stored candle for its bucket."""
+    table = Candle.__table__
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return table.insert()
+    statement = insert(table)
+    new = statement.excluded
+    earlier, later = new.first_ts < table.c.first_ts, new.last_ts >= table.c.last_ts
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.symbol, table.c.resolution, table.c.start],
+        set_={
+            "open": case((earlier, new.open), else_=table.c.open),
+            "first_ts": case((earlier, new.first_ts), else_=table.c.first_ts),
+            "close": case((later, new.close), else_=table.c.close),
+            "last_ts": case((later, new.last_ts), else_=table.c.last_ts),
+            "high": case((new.high > table.c.high, new.high), else_=table.c.high),
+            "low": case((new.low < table.c.low, new.low), else_=table.c.low),
+            "volume": table.c.volume + new.volume,
+            "trades": table.c.trades + new.trades,
+        },
+    )
+
+# Tenant moves cut over in the mover's process (see tenants.py)
+worker_bus.subscribe("tenant_moved", lambda data: router.place(data["tenant"], data["shard"]))
+
+def _row(obj) -> dict:
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+async def _load_change_row(collection: str, tenant: str, obj_id: str) -> Optional[dict]:
+    """A row another worker's change event refers to, as it is stored now."""
+    async with router.session(tenant) as session:
+        obj = await session.get(MODELS[collection], obj_id)
+        return None if obj is None or obj.tenant_id != tenant else _row(obj)
+
+change_feed.row_loader = _load_change_row
+
+def follow_moves(method):
+    """Rerun a tenant write that hit a move fence once the tenant's new shard is known.
+
+    Between the fence and the cutover the write waits, for up to
+    ``settings.TENANT_MOVE_WAIT`` seconds, polling the placement catalog.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        waited = 0.0
+        while True:
+            try:
+                return await method(self, *args, **kwargs)
+            except TenantMoved as e:
+                before = router.shard_for(e.tenant).name
+                await load_tenant_placements(e.tenant)
+                if router.shard_for(e.tenant).name != before:
+                    continue
+                if waited >= settings.TENANT_MOVE_WAIT:
+                    raise
+                await asyncio.sleep(0.05)
+                waited += 0.05
+    return wrapper
 
 class DatabaseService:
+    """Reads and writes for the current tenant (``shards.current_tenant``), on the shard it lives on.
+
+    Maintenance sweeps (rescoring, rollup checks, compaction, deadlines) cover
+    every tenant on every shard.
+    """
+
     async def get_db(self):
-        async with async_session() as session:
+        async with router.session() as session:
             yield session
 
+    async def get_collection_version(self, collection: str) -> str:
+        """The tenant's change sequence number, plus the shard's rescore count for todos.
+
+        Every write moves the sequence number in the database itself, so all
+        worker processes derive the same version for the same data.
+        """
+        tenant = current_tenant.get()
+        names = [counter_name(SEQUENCE, tenant)] + ([RANK_SCORES] if collection == "todos" else [])
+        with db_span("get_version", collection):
+            async with router.session(tenant) as session:
+                result = await session.execute(
+                    select(SyncCounter.name, SyncCounter.value).where(SyncCounter.name.in_(names))
+                )
+                values = dict(result.all())
+        return "-".join(str(counter_value(values.get(name))) for name in names)
+
+    async def get_row_version(self, collection: str, obj_id: str) -> Optional[int]:
+        """Return only the version column of a row, or None if it doesn't exist."""
+        model = MODELS[collection]
+        tenant = current_tenant.get()
+        with db_span("get_version", collection):
+            async with router.session(tenant) as session:
+                result = await session.execute(
+                    select(model.version).where(model.id == obj_id, model.tenant_id == tenant)
+                )
+                return result.scalar()
+
+    @staticmethod
+    async def _get_owned(session: AsyncSession, model, obj_id: str):
+        """``session.get`` for a row of the session's tenant."""
+        obj = await session.get(model, obj_id)
+        return obj if obj is not None and obj.tenant_id == session.info["tenant"] else None
+
+    def _record_write(self, collection: str, op: str, obj) -> None:
+        if op == "delete":
+            row = {"id": obj.id, "version": obj.version, "seq": obj.seq, "tenant_id": obj.tenant_id}
+        else:
+            row = _row(obj)
+        change_feed.publish(collection, op, row)
+        reminders.observe(collection, op, row)
+
+    @staticmethod
+    def _goal_link(obj) -> Optional[Tuple[str, bool]]:
+        """The (goal, completed) pair a todo contributes to its goal's rollup."""
+        return (obj.goal_id, bool(obj.completed)) if obj.goal_id else None
+
+    async def _apply_rollups(self, session: AsyncSession, before, after) -> List[Goal]:
+        """Carry one todo's link/completion change into its goals' counters.
+
+        Runs in the caller's transaction as relative UPDATEs on at most two goal
+        rows, so concurrent todo writes never lose an increment.
+        """
+        return await self._apply_rollup_changes(session, [(before, after)])
+
+    async def _apply_rollup_changes(self, session: AsyncSession, changes) -> List[Goal]:
+        """Like ``_apply_rollups`` for many ``(before, after)`` pairs, with one UPDATE per goal touched."""
+        deltas: Dict[str, List[int]] = {}
+        for before, after in changes:
+            for link, sign in ((before, -1), (after, 1)):
+                if link is not None:
+                    goal_id, completed = link
+                    delta = deltas.setdefault(goal_id, [0, 0])
+                    delta[0] += sign
+                    delta[1] += sign * completed
+        touched = [goal_id for goal_id, delta in deltas.items() if delta != [0, 0]]
+        for goal_id in touched:
+            if not await self._set_rollup(session, goal_id, *deltas[goal_id], relative=True):
+                raise ValueError(f"Goal {goal_id} does not exist")
+        if not touched:
+            return []
+        result = await session.execute(
+            select(Goal).where(Goal.id.in_(touched)).execution_options(populate_existing=True)
+        )
+        return list(result.scalars())
+
+    async def _set_rollup(
+        self, session: AsyncSession, goal_id: str, todo_count: int, completed_count: int,
+        relative: bool = False, expected: Optional[Tuple[int, int]] = None, tenant: Optional[str] = None,
+    ) -> bool:
+        tenant = tenant or session.info["tenant"]
+        if relative:
+            todo_count = Goal.todo_count + todo_count
+            completed_count = Goal.completed_count + completed_count
+            progress = case((todo_count > 0, completed_count * 100.0 / todo_count), else_=Goal.progress)
+        else:
+            progress = completed_count * 100.0 / todo_count if todo_count else Goal.progress
+        condition = [Goal.id == goal_id, Goal.tenant_id == tenant]
+        if expected is not None:
+            condition += [Goal.todo_count == expected[0], Goal.completed_count == expected[1]]
+        result = await session.execute(
+            update(Goal).where(*condition).values(
+                todo_count=todo_count,
+                completed_count=completed_count,
+                progress=progress,
+                version=Goal.version + 1,
+                seq=await next_seq(session, tenant=tenant),
+            ).execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
+
+    def _record_writes(self, collection: str, op: str, objs) -> None:
+        for obj in objs:
+            self._record_write(collection, op, obj)
+
+    @follow_moves
+    async def _create(self, model, data: dict):
+        with db_span("create", model.__tablename__):
+            async with router.session() as session:
+                obj = model(**{key: value for key, value in data.items() if key not in PROTECTED_FIELDS[1:]})
+                obj.tenant_id = session.info["tenant"]
+                obj.seq = await next_seq(session)
+                if model is Todo:
+                    obj.rank_score = ranking.score(obj)
+                session.add(obj)
+                goals = await self._apply_rollups(session, None, self._goal_link(obj)) if model is Todo else []
+                await session.commit()
+                await session.refresh(obj)
+        self._record_write(model.__tablename__, "create", obj)
+        self._record_writes("goals", "update", goals)
+        return obj
+
+    async def _list(self, model, skip: int, limit: int) -> list:
+        tenant = current_tenant.get()
+        with db_span("list", model.__tablename__) as span:
+            async with router.session(tenant) as session:
+                result = await session.execute(
+                    select(model).where(model.tenant_id == tenant)
+                    .order_by(model.created_at, model.id).offset(skip).limit(limit)
+                )
+                rows = result.scalars().all()
+            span.set_attribute("db.row_count", len(rows))
+            return rows
+
+    async def _get(self, model, obj_id: str):
+        with db_span("get", model.__tablename__) as span:
+            async with router.session() as session:
+                obj = await self._get_owned(session, model, obj_id)
+            span.set_attribute("db.row_count", int(obj is not None))
+            return obj
+
+    @follow_moves
+    async def _update(self, model, obj_id: str, data: dict):
+        with db_span("update", model.__tablename__) as span:
+            async with router.session() as session:
+                obj = await self._get_owned(session, model, obj_id)
+                if obj is None:
+                    span.set_attribute("db.row_count", 0)
+                    return None
+                before = self._goal_link(obj) if model is Todo else None
+                for key, value in data.items():
+                    if key not in PROTECTED_FIELDS:
+                        setattr(obj, key, value)
+                obj.seq = await next_seq(session)
+                if model is Todo:
+                    obj.rank_score = ranking.score(obj)
+                goals = await self._apply_rollups(session, before, self._goal_link(obj)) if model is Todo else []
+                await session.commit()
+            span.set_attribute("db.row_count", 1)
+        self._record_write(model.__tablename__, "update", obj)
+        self._record_writes("goals", "update", goals)
+        return obj
+
+    @follow_moves
+    async def _delete(self, model, obj_id: str) -> bool:
+        with db_span("delete", model.__tablename__) as span:
+            async with router.session() as session:
+                obj = await self._get_owned(session, model, obj_id)
+                if obj is None:
+                    span.set_attribute("db.row_count", 0)
+                    return False
+                goals = await self._apply_rollups(session, self._goal_link(obj), None) if model is Todo else []
+                todos = await self._unlink_todos(session, obj.id) if model is Goal else []
+                obj.seq = await next_seq(session)
+                session.add(Tombstone(
+                    tenant_id=obj.tenant_id, seq=obj.seq, entity=model.__tablename__, entity_id=obj.id,
+                ))
+                await session.delete(obj)
+                await session.commit()
+            span.set_attribute("db.row_count", 1)
+        self._record_write(model.__tablename__, "delete", obj)
+        self._record_writes("goals", "update", goals)
+        self._record_writes("todos", "update", todos)
+        return True
+
+    async def _unlink_todos(self, session: AsyncSession, goal_id: str) -> List[Todo]:
+        result = await session.execute(
+            select(Todo).where(Todo.goal_id == goal_id, Todo.tenant_id == session.info["tenant"])
+        )
+        todos = list(result.scalars())
+        for todo in todos:
+            todo.goal_id = None
+            todo.seq = await next_seq(session)
+            todo.rank_score = ranking.score(todo)
+        return todos
+
+    # Delta sync
+    async def get_changes_since(self, since: int, limit: int) -> dict:
+        """One page of rows and tombstones with a sequence number above ``since``, oldest first."""
+        tenant = current_tenant.get()
+        with db_span("sync", "all") as span:
+            async with router.session(tenant) as session:
+                # Only hand out changes up to the counter as it was when the read
+                # began: everything up to that point has committed, so a later
+                # page can never turn up a lower sequence number
+                high_water = counter_value((await session.execute(
+                    select(SyncCounter.value).where(SyncCounter.name == counter_name(SEQUENCE, tenant))
+                )).scalar())
+                changes = []
+                for collection, model in MODELS.items():
+                    result = await session.execute(
+                        select(model).where(model.tenant_id == tenant, model.seq > since, model.seq <= high_water)
+                        .order_by(model.seq).limit(limit + 1)
+                    )
+                    for obj in result.scalars():
+                        row = _row(obj)
+                        changes.append({"entity": collection, "op": "upsert", "seq": obj.seq, "data": row})
+                result = await session.execute(
+                    select(Tombstone)
+                    .where(Tombstone.tenant_id == tenant, Tombstone.seq > since, Tombstone.seq <= high_water)
+                    .order_by(Tombstone.seq).limit(limit + 1)
+                )
+                for tombstone in result.scalars():
+                    changes.append({
+                        "entity": tombstone.entity, "op": "delete", "seq": tombstone.seq,
+                        "data": {"id": tombstone.entity_id},
+                    })
+            changes.sort(key=lambda change: change["seq"])
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            span.set_attribute("db.row_count", len(changes))
+        return {
+            "changes": changes,
+            "next_since": changes[-1]["seq"] if has_more else max(high_water, since),
+            "has_more": has_more,
+        }
+
+    async def get_sync_position(self) -> int:
+        """Current change sequence number; every change up to it has committed."""
+        tenant = current_tenant.get()
+        async with router.session(tenant) as session:
+            return counter_value((await session.execute(
+                select(SyncCounter.value).where(SyncCounter.name == counter_name(SEQUENCE, tenant))
+            )).scalar())
+
+    async def iter_columns(
+        self, collection: str, columns: List[str], max_seq: int, batch_size: int = 10000,
+    ) -> AsyncIterator[list]:
+        """Stream ``(id, *columns)`` tuples in batches for rows last written at or before ``max_seq``."""
+        model = MODELS[collection]
+        tenant = current_tenant.get()
+        query = select(model.id, *(getattr(model, name) for name in columns)).where(
+            model.tenant_id == tenant, model.seq <= max_seq,
+        )
+        with db_span("scan", collection):
+            async with router.session(tenant) as session:
+                result = await session.stream(query.execution_options(yield_per=batch_size))
+                async for partition in result.partitions(batch_size):
+                    yield partition
+
+    # Bulk export/import
+    async def iter_rows(
+        self, table: str, changed_since: Optional[datetime] = None, batch_size: int = 10000,
+        after_seq: Optional[int] = None, max_seq: Optional[int] = None,
+    ) -> AsyncIterator[list]:
+        """Stream whole rows of ``table`` as batches of mappings, oldest first.
+
+        With ``changed_since``, only rows whose change timestamp (``updated_at``,
+        or ``deleted_at`` for tombstones) is at or after it; ties are included
+        so an incremental consumer may see a row twice but never misses one.
+        With ``after_seq`` and ``max_seq``, only rows last written with a change
+        sequence number in ``(after_seq, max_seq]``; read ``max_seq`` from
+        ``get_sync_position`` first and every such row has committed.
+        """
+        model, changed, order = EXPORT_TABLES[table]
+        tenant = current_tenant.get()
+        query = select(model.__table__).where(model.tenant_id == tenant)
+        if changed_since is not None:
+            query = query.where(changed >= changed_since)
+        if after_seq is not None:
+            query = query.where(model.seq > after_seq)
+        if max_seq is not None:
+            query = query.where(model.seq <= max_seq)
+        query = query.order_by(order, *model.__table__.primary_key.columns)
+        with db_span("scan", table):
+            async with router.session(tenant) as session:
+                result = await session.stream(query.execution_options(yield_per=batch_size))
+                async for partition in result.mappings().partitions(batch_size):
+                    yield partition
+
+    @follow_moves
+    async def bulk_upsert(self, collection: str, rows: List[dict]) -> int:
+        """Insert or replace ``rows`` with one executemany in a single transaction.
+
+        Bypasses the ORM: each row still gets a change sequence number and a
+        replaced row's version is bumped, but no change feed events are sent and
+        goal rollups are left for ``verify_goal_rollups`` and todo rank scores
+        for ``refresh_rank_scores``. Rows are always the current tenant's,
+        whatever their ``tenant_id`` says, and never replace another tenant's.
+        """
+        if not rows:
+            return 0
+        table = MODELS[collection].__table__
+        with db_span("bulk_upsert", collection) as span:
+            async with router.session() as session:
+                first = await next_seq(session, len(rows)) - len(rows) + 1
+                for offset, row in enumerate(rows):
+                    row["seq"] = first + offset
+                    row["version"] = row.get("version") or 1
+                    row["tenant_id"] = session.info["tenant"]
+                await session.execute(_upsert_statement(table, session.bind.dialect.name), rows)
+                await session.commit()
+            span.set_attribute("db.row_count", len(rows))
+        return len(rows)
+
+    @follow_moves
+    async def insert_new(self, rows: Dict[str, List[dict]], batch_size: int = 500) -> Dict[str, list]:
+        """Create the rows whose id doesn't exist yet, for several collections in one transaction.
+
+        Rows whose id is already taken (or repeated within ``rows``) are skipped,
+        which makes replaying the same rows harmless. Created rows get sequence
+        numbers, rank scores, goal rollups and change feed events as in
+        ``_create``. Returns the created rows per collection.
+        """
+        created: Dict[str, list] = {}
+        with db_span("insert_new", ",".join(rows)) as span:
+            async with router.session() as session:
+                links = []
+                for collection, items in rows.items():
+                    model = MODELS[collection]
+                    unique = {row["id"]: row for row in items}
+                    ids = list(unique)
+                    for start in range(0, len(ids), batch_size):
+                        result = await session.execute(
+                            select(model.id).where(model.id.in_(ids[start:start + batch_size]))
+                        )
+                        for existing in result.scalars():
+                            del unique[existing]
+                    objs = [
+                        model(**{key: value for key, value in row.items() if key not in PROTECTED_FIELDS[1:]})
+                        for row in unique.values()
+                    ]
+                    first = await next_seq(session, len(objs)) - len(objs) + 1 if objs else 0
+                    for offset, obj in enumerate(objs):
+                        obj.tenant_id = session.info["tenant"]
+                        obj.seq = first + offset
+                        if model is Todo:
+                            obj.rank_score = ranking.score(obj)
+                            links.append((None, self._goal_link(obj)))
+                    session.add_all(objs)
+                    created[collection] = objs
+                goals = await self._apply_rollup_changes(session, links) if links else []
+                await session.commit()
+            span.set_attribute("db.row_count", sum(len(objs) for objs in created.values()))
+        for collection, objs in created.items():
+            self._record_writes(collection, "create", objs)
+        self._record_writes("goals", "update", goals)
+        return created
+
+    @follow_moves
+    async def bulk_update(
+        self, collection: str, changes: Dict[str, dict], versions: Optional[Dict[str, int]] = None,
+        batch_size: int = 500,
+    ) -> Tuple[list, List[str]]:
+        """Apply field changes to many rows in one transaction.
+
+        ``changes`` maps row id to the fields to set. With ``versions``, a row
+        whose version no longer matches is skipped instead of overwritten, as
+        is a row that no longer exists. Unlike ``bulk_upsert`` this goes through
+        the ORM: every row gets a sequence number, a version bump, a rank score
+        and a change feed event, and goal rollups are updated once per goal.
+        Returns the updated rows and the ids that were skipped.
+        """
+        if not changes:
+            return [], []
+        model = MODELS[collection]
+        ids = list(changes)
+        with db_span("bulk_update", collection) as span:
+            async with router.session() as session:
+                found = {}
+                for start in range(0, len(ids), batch_size):
+                    result = await session.execute(select(model).where(
+                        model.id.in_(ids[start:start + batch_size]), model.tenant_id == session.info["tenant"],
+                    ))
+                    found.update((obj.id, obj) for obj in result.scalars())
+                objs, skipped = [], []
+                for obj_id in ids:
+                    obj = found.get(obj_id)
+                    if obj is None or (versions is not None and obj.version != versions.get(obj_id)):
+                        skipped.append(obj_id)
+                    else:
+                        objs.append(obj)
+                links = []
+                first = await next_seq(session, len(objs)) - len(objs) + 1 if objs else 0
+                for offset, obj in enumerate(objs):
+                    before = self._goal_link(obj) if model is Todo else None
+                    for key, value in changes[obj.id].items():
+                        if key not in PROTECTED_FIELDS:
+                            setattr(obj, key, value)
+                    obj.seq = first + offset
+                    if model is Todo:
+                        obj.rank_score = ranking.score(obj)
+                        links.append((before, self._goal_link(obj)))
+                goals = await self._apply_rollup_changes(session, links) if links else []
+                await session.commit()
+            span.set_attribute("db.row_count", len(objs))
+        self._record_writes(collection, "update", objs)
+        self._record_writes("goals", "update", goals)
+        return objs, skipped
+
+    async def get_tombstone_floor(self) -> int:
+        """Highest sequence number whose tombstones may already have been compacted away."""
+        tenant = current_tenant.get()
+        async with router.session(tenant) as session:
+            return (await session.execute(
+                select(SyncCounter.value).where(SyncCounter.name == counter_name(TOMBSTONE_FLOOR, tenant))
+            )).scalar() or 0
+
+    async def compact_tombstones(self, retention: timedelta) -> int:
+        """Prune tombstones older than ``retention`` and raise each tenant's compaction floor."""
+        cutoff = datetime.utcnow() - retention
+        removed = 0
+        with db_span("compact", Tombstone.__tablename__) as span:
+            for shard in router.shards():
+                async with shard.session() as session:
+                    floors = (await session.execute(
+                        select(Tombstone.tenant_id, func.max(Tombstone.seq))
+                        .where(Tombstone.deleted_at < cutoff).group_by(Tombstone.tenant_id)
+                    )).all()
+                    for tenant, floor in floors:
+                        result = await session.execute(
+                            delete(Tombstone).where(Tombstone.tenant_id == tenant, Tombstone.seq <= floor)
+                        )
+                        removed += result.rowcount
+                        name = counter_name(TOMBSTONE_FLOOR, tenant)
+                        result = await session.execute(
+                            update(SyncCounter).where(SyncCounter.name == name, SyncCounter.value < floor)
+                            .values(value=floor)
+                        )
+                        if result.rowcount == 0 and await session.get(SyncCounter, name) is None:
+                            session.add(SyncCounter(name=name, value=floor))
+                    await session.commit()
+            span.set_attribute("db.row_count", removed)
+        return removed
+
+    async def iter_deadlines(self, after: datetime) -> AsyncIterator[Tuple[str, str, str, datetime]]:
+        """Stream ``(tenant, collection, id, due)`` for open todos and active goals due after ``after``."""
+        queries = (
+            ("todos", select(Todo.tenant_id, Todo.id, Todo.due_date).where(
+                Todo.due_date > after, Todo.completed.isnot(True),
+            )),
+            ("goals", select(Goal.tenant_id, Goal.id, Goal.target_date).where(
+                Goal.target_date > after, Goal.status == "active",
+            )),
+        )
+        for shard in router.shards():
+            async with shard.session() as session:
+                for collection, query in queries:
+                    with db_span("deadlines", collection):
+                        result = await session.stream(query.execution_options(yield_per=10000))
+                        async for tenant, obj_id, due in result:
+                            # A moved tenant's old copy lingers until the grace period ends
+                            if router.shard_for(tenant) is shard:
+                                yield tenant, collection, obj_id, due
+
     # Todo operations
     async def create_todo(self, todo_data: dict) -> Todo:
-        async with async_session() as session:
-            todo = Todo(**todo_data)
-            session.add(todo)
-            await session.commit()
-            await session.refresh(todo)
-            return todo
+        return await self._create(Todo, todo_data)
 
     async def get_todos(self, skip: int = 0, limit: int = 100) -> List[Todo]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM todos LIMIT {limit} OFFSET {skip}"
-            )
-            return result.fetchall()
+        return await self._list(Todo, skip, limit)
+
+    async def get_todos_ranked(
+        self, limit: int = 100, after: Optional[Tuple[float, str]] = None,
+    ) -> List[Todo]:
+        """One page of todos in smart order (highest ``rank_score`` first).
+
+        Keyset pagination on ``(rank_score, id)``: pass the last row's pair as
+        ``after`` to continue, so every page is a range scan of the rank index
+        whatever its depth. Todos not yet scored are left out until the next sweep.
+        """
+        tenant = current_tenant.get()
+        query = select(Todo).where(Todo.tenant_id == tenant, Todo.rank_score.isnot(None))
+        if after is not None:
+            query = query.where(tuple_(Todo.rank_score, Todo.id) < tuple_(*after))
+        with db_span("list_ranked", "todos") as span:
+            async with router.session(tenant) as session:
+                result = await session.execute(
+                    query.order_by(Todo.rank_score.desc(), Todo.id.desc()).limit(limit)
+                )
+                rows = result.scalars().all()
+            span.set_attribute("db.row_count", len(rows))
+            return rows
+
+    async def refresh_rank_scores(
+        self, horizon: Optional[timedelta] = None, batch_size: int = 1000,
+    ) -> int:
+        """Rescore todos whose score drifts with time and return how many changed.
+
+        With ``horizon``, only open todos due before ``now + horizon`` (the ones
+        whose urgency is still moving, found through the due date index) and
+        unscored rows are visited; without it every todo is. Rows are walked in
+        id order and rewritten with one executemany per batch, skipping those
+        whose score hasn't moved, one shard after another. The score is derived
+        data, so the row's version and change sequence stay as they are.
+        """
+        now = datetime.utcnow()
+        query = select(Todo.id, Todo.rank_score, *(getattr(Todo, name) for name in ranking.SCORE_COLUMNS))
+        if horizon is not None:
+            query = query.where(or_(
+                Todo.rank_score.is_(None),
+                (Todo.due_date <= now + horizon) & Todo.completed.isnot(True),
+            ))
+        table = Todo.__table__
+        statement = update(table).where(table.c.id == bindparam("_id")).values(
+            rank_score=bindparam("_score"), updated_at=table.c.updated_at,  # not a user-visible change
+        )
+        changed = 0
+        for shard in router.shards():
+            last_id = ""
+            while True:
+                with db_span("rescore", "todos") as span:
+                    async with shard.session() as session:
+                        result = await session.execute(
+                            query.where(Todo.id > last_id).order_by(Todo.id).limit(batch_size)
+                        )
+                        rows = result.all()
+                        if not rows:
+                            break
+                        last_id = rows[-1].id
+                        updates = []
+                        for row in rows:
+                            score = ranking.score(row, now)
+                            if row.rank_score is None or abs(score - row.rank_score) > 1e-9:
+                                updates.append({"_id": row.id, "_score": score})
+                        if updates:
+                            await session.execute(statement, updates)
+                            await _bump_counter(session, RANK_SCORES)
+                            await session.commit()
+                    span.set_attribute("db.row_count", len(rows))
+                changed += len(updates)
+        return changed
 
     async def get_todo(self, todo_id: str) -> Optional[Todo]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM todos WHERE id = '{todo_id}'"
-            )
-            return result.first()
+        return await self._get(Todo, todo_id)
 
     async def update_todo(self, todo_id: str, todo_data: dict) -> Optional[Todo]:
-        async with async_session() as session:
-            todo = await self.get_todo(todo_id)
-            if todo:
-                for key, value in todo_data.items():
-                    setattr(todo, key, value)
-                await session.commit()
-                await session.refresh(todo)
-            return todo
+        return await self._update(Todo, todo_id, todo_data)
 
     async def delete_todo(self, todo_id: str) -> bool:
-        async with async_session() as session:
-            todo = await self.get_todo(todo_id)
-            if todo:
-                await session.delete(todo)
-                await session.commit()
-                return True
-            return False
+        return await self._delete(Todo, todo_id)
 
     # Journal operations
     async def create_journal_entry(self, entry_data: dict) -> JournalEntry:
-        async with async_session() as session:
-            entry = JournalEntry(**entry_data)
-            session.add(entry)
-            await session.commit()
-            await session.refresh(entry)
-            return entry
+        return await self._create(JournalEntry, entry_data)
 
     async def get_journal_entries(self, skip: int = 0, limit: int = 100) -> List[JournalEntry]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM journal_entries LIMIT {limit} OFFSET {skip}"
-            )
-            return result.fetchall()
+        return await self._list(JournalEntry, skip, limit)
 
     async def get_journal_entry(self, entry_id: str) -> Optional[JournalEntry]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM journal_entries WHERE id = '{entry_id}'"
-            )
-            return result.first()
+        return await self._get(JournalEntry, entry_id)
 
     async def update_journal_entry(self, entry_id: str, entry_data: dict) -> Optional[JournalEntry]:
-        async with async_session() as session:
-            entry = await self.get_journal_entry(entry_id)
-            if entry:
-                for key, value in entry_data.items():
-                    setattr(entry, key, value)
-                await session.commit()
-                await session.refresh(entry)
-            return entry
+        return await self._update(JournalEntry, entry_id, entry_data)
 
     async def delete_journal_entry(self, entry_id: str) -> bool:
-        async with async_session() as session:
-            entry = await self.get_journal_entry(entry_id)
-            if entry:
-                await session.delete(entry)
-                await session.commit()
-                return True
-            return False
+        return await self._delete(JournalEntry, entry_id)
 
     # Goal operations
     async def create_goal(self, goal_data: dict) -> Goal:
-        async with async_session() as session:
-            goal = Goal(**goal_data)
-            session.add(goal)
-            await session.commit()
-            await session.refresh(goal)
-            return goal
+        return await self._create(Goal, goal_data)
 
     async def get_goals(self, skip: int = 0, limit: int = 100) -> List[Goal]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM goals LIMIT {limit} OFFSET {skip}"
-            )
-            return result.fetchall()
+        return await self._list(Goal, skip, limit)
 
     async def get_goal(self, goal_id: str) -> Optional[Goal]:
-        async with async_session() as session:
-            result = await session.execute(
-                f"SELECT * FROM goals WHERE id = '{goal_id}'"
-            )
-            return result.first()
+        return await self._get(Goal, goal_id)
 
     async def update_goal(self, goal_id: str, goal_data: dict) -> Optional[Goal]:
-        async with async_session() as session:
-            goal = await self.get_goal(goal_id)
-            if goal:
-                for key, value in goal_data.items():
-                    setattr(goal, key, value)
-                await session.commit()
-                await session.refresh(goal)
-            return goal
+        return await self._update(Goal, goal_id, goal_data)
 
     async def delete_goal(self, goal_id: str) -> bool:
-        async with async_session() as session:
-            goal = await self.get_goal(goal_id)
-            if goal:
-                await session.delete(goal)
+        return await self._delete(Goal, goal_id)
+
+    async def get_goal_todos(self, goal_id: str, skip: int = 0, limit: int = 100) -> List[Todo]:
+        tenant = current_tenant.get()
+        with db_span("list", "todos") as span:
+            async with router.session(tenant) as session:
+                result = await session.execute(
+                    select(Todo).where(Todo.tenant_id == tenant, Todo.goal_id == goal_id)
+                    .order_by(Todo.created_at, Todo.id).offset(skip).limit(limit)
+                )
+                rows = result.scalars().all()
+            span.set_attribute("db.row_count", len(rows))
+            return rows
+
+    async def verify_goal_rollups(self, batch_size: int = 500) -> int:
+        """Recompute every goal's todo counters from the todos table and fix any drift.
+
+        Goals are walked in id order, one aggregate query per batch. A fix only
+        applies if the stored counters are unchanged since they were read, so a
+        todo write racing the check is never overwritten; the next run catches
+        anything skipped, including a batch holding a tenant that is mid-move.
+        """
+        fixed = []
+        for shard in router.shards():
+            last_id = ""
+            while True:
+                with db_span("verify_rollups", "goals") as span:
+                    async with shard.session() as session:
+                        result = await session.execute(
+                            select(Goal.id, Goal.tenant_id, Goal.todo_count, Goal.completed_count)
+                            .where(Goal.id > last_id).order_by(Goal.id).limit(batch_size)
+                        )
+                        stored = {goal_id: (tenant, (total, done)) for goal_id, tenant, total, done in result}
+                        if not stored:
+                            break
+                        last_id = max(stored)
+                        # Only a goal's own tenant's todos count toward it
+                        result = await session.execute(
+                            select(
+                                Todo.tenant_id, Todo.goal_id,
+                                func.count(), func.sum(case((Todo.completed.is_(True), 1), else_=0)),
+                            )
+                            .where(Todo.goal_id.in_(stored)).group_by(Todo.tenant_id, Todo.goal_id)
+                        )
+                        actual = {(tenant, goal_id): (total, done or 0) for tenant, goal_id, total, done in result}
+                        batch_fixed = []
+                        try:
+                            for goal_id, (tenant, counts) in stored.items():
+                                expected = actual.get((tenant, goal_id), (0, 0))
+                                if counts != expected and await self._set_rollup(
+                                    session, goal_id, *expected, expected=counts, tenant=tenant,
+                                ):
+                                    batch_fixed.append(goal_id)
+                        except TenantMoved:
+                            await session.rollback()
+                            batch_fixed = []
+                        if batch_fixed:
+                            result = await session.execute(select(Goal).where(Goal.id.in_(batch_fixed)))
+                            goals = list(result.scalars())
+                        await session.commit()
+                    span.set_attribute("db.row_count", len(stored))
+                if batch_fixed:
+                    logger.warning("Fixed drifted todo rollups on %d goals", len(batch_fixed))
+                    self._record_writes("goals", "update", goals)
+                    fixed.extend(batch_fixed)
+        return len(fixed)
+
+    async def append_ticks(self, ticks: List[tuple], candles: List[dict]) -> None:
+        """Append ``(symbol, ts, price, size)`` ticks and fold their partial candles into the rollups.
+
+        Both happen in one transaction, so the rollups never count a tick that
+        isn't stored or miss one that is.
+        """
+        with db_span("append_ticks", "ticks") as span:
+            async with async_session() as session:
+                await session.execute(
+                    Tick.__table__.insert(),
+                    [{"symbol": symbol, "ts": ts, "price": price, "size": size} for symbol, ts, price, size in ticks],
+                )
+                if candles:
+                    await session.execute(_candle_merge_statement(), candles)
                 await session.commit()
-                return True
-            return False 
\ No newline at end of file
+            span.set_attribute("db.row_count", len(ticks))
+
+    async def get_tick_high_water(self) -> Dict[str, int]:
+        """Latest stored tick time (epoch ms) per symbol."""
+        with db_span("tick_high_water", "ticks"):
+            async with async_session() as session:
+                result = await session.execute(select(Tick.symbol, func.max(Tick.ts)).group_by(Tick.symbol))
+                return dict(result.all())
+
+    async def get_candles(self, symbol: str, resolution: int, start: int, end: int, limit: int) -> list:
+        """Stored candles with ``start <= bucket start < end`` (epoch ms), oldest first: one primary key range scan."""
+        with db_span("list", "candles") as span:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(
+                        Candle.start, Candle.open, Candle.high, Candle.low, Candle.close, Candle.volume, Candle.trades,
+                    )
+                    .where(
+                        Candle.symbol == symbol, Candle.resolution == resolution,
+                        Candle.start >= start, Candle.start < end,
+                    )
+                    .order_by(Candle.start).limit(limit)
+                )
+                rows = result.all()
+            span.set_attribute("db.row_count", len(rows))
+            return rows
@@ -0,0 +1,370 @@
+"""
+Device telemetry ingestion over MQTT.
+
+``MQTT_TOPICS`` maps topic filters to what their messages become: ``journal``
+events are stored as journal entries and ``todo`` alerts as todos::
+
+    MQTT_TOPICS="neurocrypt/+/events=journal,neurocrypt/+/alerts=todo"
+
+- The paho network thread parses each message and puts it in a bounded buffer.
+  When the buffer is full the callback blocks, paho stops reading the socket and
+  the broker holds back further messages once its in-flight window is full, so
+  a slow database pushes back on the broker instead of growing memory.
+- A writer task takes up to ``MQTT_BATCH_SIZE`` messages, waiting at most
+  ``MQTT_BATCH_DELAY`` seconds for a batch to fill, and writes them with one
+  ``DatabaseService.insert_new`` transaction (group commit). A failing batch is
+  retried with backoff until it commits; if it keeps failing for a reason other
+  than the database being unavailable, its messages are retried one by one and
+  the ones that still fail are dropped.
+- Row ids are derived from the topic and the message's ``id``, so a message
+  the broker delivers twice maps to the row it already created and is skipped.
+  A message without an ``id`` is deduplicated on its ``ts`` and text, which
+  only matches a redelivery of the same event. Without a ``ts`` it gets a new
+  row id every time, so a redelivery is stored again but a later identical
+  event ("door opened") is never mistaken for one.
+- Delivery is at least once: the session is persistent (``clean_session=False``)
+  at QoS 1 and a message is only acknowledged after its batch commits, so the
+  broker redelivers anything a crash lost from the buffer. This relies on
+  paho-mqtt 2's manual acknowledgements. paho-mqtt 1.x acknowledges a message
+  as soon as the callback returns, so there the callback waits until the
+  message is committed, which gives up group commit.
+- With several worker processes only the holder of a lock file in the worker
+  bus directory ingests; another worker takes over if it exits.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from sqlalchemy.exc import OperationalError
+from ..config import settings
+from ..telemetry import meter
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker ingests
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+mqtt_messages = meter.create_counter("mqtt.messages", description="MQTT messages by outcome")
+
+KINDS = {"journal": "journal_entries", "todo": "todos"}
+# Alert severities to todo priorities; unknown ones are 3
+SEVERITY = {
+    "debug": 1, "info": 1, "low": 2, "notice": 2, "warning": 3, "medium": 3,
+    "high": 4, "error": 4, "critical": 5, "alert": 5, "emergency": 5,
+}
+# Row ids are uuid5 names in this namespace
+ID_NAMESPACE = uuid.UUID("958b9f5c-466c-4b5b-a771-6bde0ae46ce1")
+
+# Attempts before a batch that fails for a reason other than an unavailable
+# database is split up
+SPLIT_AFTER = 3
+
+Item = Tuple[str, dict, object]  # (collection, row, paho message)
+
+def parse_routes(spec: str) -> List[Tuple[str, str]]:
+    """``"filter=kind,..."`` to ``[(topic filter, collection)]``."""
+    routes = []
+    for route in filter(None, (part.strip() for part in spec.split(","))):
+        topic_filter, _, kind = route.rpartition("=")
+        if not topic_filter or kind.strip() not in KINDS:
+            raise ValueError(f"Invalid MQTT route {route!r}: expected 'topic/filter=journal' or '...=todo'")
+        routes.append((topic_filter.strip(), KINDS[kind.strip()]))
+    return routes
+
+def _timestamp(value) -> Optional[datetime]:
+    """Epoch seconds or ISO 8601 to a naive UTC datetime, as the models store them."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.utcfromtimestamp(value)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f"Timestamp out of range: {value!r}") from e
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+def parse_message(collection: str, topic: str, payload: bytes) -> dict:
+    """The row a device message becomes; raises ValueError for payloads that can't be used.
+
+    A JSON object is read field by field (``message``, ``id``, ``ts``, ``tags``,
+    ``mood``, ``severity``/``priority``, ``due``, ``description``, ``device``);
+    any other payload is taken as the text of the entry or the title of the todo.
+    """
+    try:
+        text = payload.decode()
+    except UnicodeDecodeError:
+        raise ValueError("Payload is not UTF-8")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {"message": text.strip()}
+    message = data.get("message") or data.get("content") or data.get("title")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("Payload has no message")
+    key = data.get("id", data.get("message_id"))
+    ts = data.get("ts", data.get("timestamp"))
+    if key is not None:
+        row = {"id": str(uuid.uuid5(ID_NAMESPACE, f"{topic}\0{key}"))}
+    elif ts is not None:
+        row = {"id": str(uuid.uuid5(ID_NAMESPACE, f"{topic}\0\0{ts}\0{text}"))}
+    else:
+        row = {"id": str(uuid.uuid4())}
+    created_at = _timestamp(ts)
+    if created_at is not None:
+        row["created_at"] = row["updated_at"] = created_at
+    if collection == "journal_entries":
+        tags = [str(tag) for tag in data.get("tags") or []]
+        if data.get("device"):
+            tags.append(f"device:{data['device']}")
+        row.update(content=message, mood=data.get("mood"), tags=tags + ["iot"])
+    else:
+        priority = data.get("priority")
+        if priority is None:
+            priority = SEVERITY.get(str(data.get("severity", "")).lower(), 3)
+        row.update(
+            title=message.strip().splitlines()[0][:200],
+            description=data.get("description") or f"Alert from {topic}",
+            priority=int(min(max(float(priority), 1), 5)),  # clamped first, so 1e400 can't overflow
+            due_date=_timestamp(data.get("due")),
+        )
+    return row
+
+class Ingestor:
+    def __init__(
+        self, routes: List[Tuple[str, str]], broker_url: Optional[str] = None,
+        client_id: str = "neurocrypt-ingest", qos: int = 1, buffer_size: int = 10000,
+        batch_size: int = 500, batch_delay: float = 0.05, lock_dir: Optional[str] = None,
+        retry_interval: float = 5.0,
+    ):
+        self.routes = routes
+        self.broker_url = broker_url
+        self.client_id = client_id
+        self.qos = qos
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.lock_dir = lock_dir
+        self.retry_interval = retry_interval
+        self.buffer: "queue.Queue[Item]" = queue.Queue(buffer_size)
+        self.stats: Dict[str, int] = defaultdict(int)
+        self.subscribed = asyncio.Event()
+        self._db_service = None
+        self._client = None
+        self._manual_ack = False
+        # paho-mqtt 1.x: id(message) -> set once the message is committed
+        self._committed: Dict[int, threading.Event] = {}
+        self._draining = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock_fd: Optional[int] = None
+
+    def start(self, db_service) -> None:
+        """Connect and ingest in the background; does nothing without a broker URL."""
+        if self._task is not None or not self.broker_url:
+            return
+        self._db_service = db_service
+        self._loop = asyncio.get_running_loop()
+        self.subscribed = asyncio.Event()
+        self._draining = False
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Disconnect, then commit whatever is still buffered."""
+        if self._task is None:
+            return
+        if self._client is None:
+            self._task.cancel()  # still waiting for the lock
+        else:
+            self._client.disconnect()
+            await self._loop.run_in_executor(None, self._client.loop_stop)
+            self._client = None
+            self._draining = True
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _try_lead(self) -> bool:
+        if self.lock_dir is None or fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.lock_dir, "ingest.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self) -> None:
+        while not self._try_lead():
+            await asyncio.sleep(self.retry_interval)
+        self._client = self._connect()
+        while True:
+            batch = await self._loop.run_in_executor(None, self._take_batch)
+            if batch:
+                await self._commit(batch)
+            elif self._draining:
+                return
+
+    def _connect(self):
+        import paho.mqtt.client as mqtt
+
+        url = urlsplit(self.broker_url)
+        options = {"client_id": self.client_id, "clean_session": False}
+        if hasattr(mqtt, "CallbackAPIVersion"):  # paho-mqtt 2
+            options["callback_api_version"] = mqtt.CallbackAPIVersion.VERSION2
+        client = mqtt.Client(**options)
+        self._manual_ack = hasattr(client, "manual_ack_set")
+        if self._manual_ack:
+            client.manual_ack_set(True)
+        else:
+            logger.warning("paho-mqtt < 2 can't acknowledge manually; committing MQTT messages one at a time")
+        if url.username:
+            client.username_pw_set(url.username, url.password)
+        tls = url.scheme in ("mqtts", "ssl")
+        if tls:
+            client.tls_set()
+        client.on_connect = self._on_connect
+        client.on_subscribe = lambda *args: self._loop.call_soon_threadsafe(self.subscribed.set)
+        for topic_filter, collection in self.routes:
+            client.message_callback_add(topic_filter, functools.partial(self._on_message, collection))
+        client.reconnect_delay_set(1, 30)
+        client.connect_async(url.hostname or "localhost", url.port or (8883 if tls else 1883), keepalive=30)
+        client.loop_start()
+        return client
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None) -> None:
+        # rc is an int on paho-mqtt 1.x and a ReasonCode, which compares equal to its value, on 2
+        if rc != 0:
+            logger.warning("MQTT connection refused (rc=%s)", rc)
+            return
+        logger.info("Connected to MQTT broker, subscribing to %d topic filters", len(self.routes))
+        client.subscribe([(topic_filter, self.qos) for topic_filter, _ in self.routes])
+
+    def _on_message(self, collection: str, client, userdata, message) -> None:
+        # Runs on the paho network thread
+        self.stats["received"] += 1
+        try:
+            row = parse_message(collection, message.topic, message.payload)
+        except (ValueError, TypeError) as e:
+            self.stats["rejected"] += 1
+            mqtt_messages.add(1, {"outcome": "rejected"})
+            logger.warning("Dropping MQTT message on %s: %s", message.topic, e)
+            self._ack(message)
+            return
+        item = (collection, row, message)
+        committed = None
+        if not self._manual_ack:
+            committed = self._committed[id(message)] = threading.Event()
+        try:
+            self.buffer.put_nowait(item)
+        except queue.Full:
+            self.stats["stalls"] += 1
+            # Blocking here is the backpressure: paho stops reading until there is room
+            while not self._wait(functools.partial(self.buffer.put, item, timeout=1.0), queue.Full):
+                pass
+        if committed is not None:
+            # paho acknowledges on return, so only return once the message is stored
+            while not self._wait(functools.partial(committed.wait, 1.0)):
+                pass
+
+    def _wait(self, attempt, retry_on=()) -> bool:
+        """Run one bounded wait; True when it succeeded or the writer is gone."""
+        try:
+            if attempt() is not False:
+                return True
+        except retry_on:
+            pass
+        return self._task is None or self._task.done()
+
+    def _take_batch(self) -> List[Item]:
+        """Up to ``batch_size`` items: whatever is buffered, plus what arrives within ``batch_delay``."""
+        try:
+            batch = [self.buffer.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.buffer.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.buffer.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    async def _commit(self, batch: List[Item]) -> None:
+        rows: Dict[str, List[dict]] = defaultdict(list)
+        for collection, row, _ in batch:
+            rows[collection].append(row)
+        attempt, delay = 0, 0.5
+        while True:
+            attempt += 1
+            try:
+                created = await self._db_service.insert_new(rows)
+                break
+            except OperationalError:
+                logger.exception("Database unavailable for %d MQTT messages; retrying in %.1fs", len(batch), delay)
+            except Exception:
+                if attempt >= SPLIT_AFTER:
+                    if len(batch) > 1:
+                        for item in batch:
+                            await self._commit([item])
+                        return
+                    self.stats["rejected"] += 1
+                    mqtt_messages.add(1, {"outcome": "rejected"})
+                    logger.exception("Dropping MQTT message on %s after %d attempts", batch[0][2].topic, attempt)
+                    self._ack(batch[0][2])
+                    return
+                logger.exception("Committing %d MQTT messages failed; retrying in %.1fs", len(batch), delay)
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+        inserted = sum(len(objs) for objs in created.values())
+        self.stats["batches"] += 1
+        self.stats["inserted"] += inserted
+        self.stats["duplicates"] += len(batch) - inserted
+        mqtt_messages.add(inserted, {"outcome": "inserted"})
+        mqtt_messages.add(len(batch) - inserted, {"outcome": "duplicate"})
+        for _, _, message in batch:
+            self._ack(message)
+
+    def _ack(self, message) -> None:
+        if self._manual_ack:
+            if self._client is not None:
+                self._client.ack(message.mid, message.qos)
+            return
+        committed = self._committed.pop(id(message), None)
+        if committed is not None:
+            committed.set()
+
+ingestor = Ingestor(
+    parse_routes(settings.MQTT_TOPICS),
+    settings.MQTT_BROKER_URL,
+    settings.MQTT_CLIENT_ID,
+    settings.MQTT_QOS,
+    settings.MQTT_BUFFER_SIZE,
+    settings.MQTT_BATCH_SIZE,
+    settings.MQTT_BATCH_DELAY,
+    lock_dir=settings.WORKER_BUS_DIR,
+)
@@ -0,0 +1,41 @@
+"""
+Periodic background jobs run on the app's event loop.
+
+Every worker process runs its own copy of each job, so jobs must be safe to run
+concurrently and repeatedly (pruning, sweeps, consistency checks).
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJobs:
+    def __init__(self):
+        self._jobs: List[Tuple[str, float, Callable[[], Awaitable]]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, func: Callable[[], Awaitable]) -> None:
+        """Run ``func`` every ``interval`` seconds once started; a non-positive interval disables it."""
+        if interval > 0:
+            self._jobs.append((name, interval, func))
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run(*job)) for job in self._jobs]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, name: str, interval: float, func: Callable[[], Awaitable]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except Exception:
+                logger.exception("Periodic job %s failed", name)
+
+jobs = PeriodicJobs()
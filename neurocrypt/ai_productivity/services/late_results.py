@@ -0,0 +1,55 @@
+"""
+LLM results that arrived after their latency budget ran out.
+
+When ``AIService`` answers from the local analyzer it lets the LLM call keep
+running. The late result is stored here under the row it belongs to, with a
+size bound and a TTL. It is also forwarded to the other worker processes over
+the worker bus and pushed to live clients as a change feed event with op
+``"ai_result"``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from ..config import settings
+from .change_feed import change_feed
+from .worker_bus import worker_bus
+
+Key = Tuple[str, str]
+
+class LateResults:
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._results: "OrderedDict[Key, dict]" = OrderedDict()
+        # Also written from the worker bus listener thread
+        self._lock = threading.Lock()
+
+    def record(self, entity: str, entity_id: str, operation: str, result: Any) -> None:
+        item = {"operation": operation, "result": result, "recorded_at": time.time()}
+        self._store((entity, entity_id), item)
+        worker_bus.publish("ai_results", {"entity": entity, "id": entity_id, **item})
+        change_feed.publish(entity, "ai_result", {"id": entity_id, "operation": operation, "result": result})
+
+    def get(self, entity: str, entity_id: str) -> Optional[dict]:
+        with self._lock:
+            item = self._results.get((entity, entity_id))
+            if item is not None and time.time() - item["recorded_at"] > self.ttl:
+                del self._results[(entity, entity_id)]
+                item = None
+            return item
+
+    def _store(self, key: Key, item: dict) -> None:
+        with self._lock:
+            self._results[key] = item
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def _store_remote(self, data: dict) -> None:
+        key = (data.pop("entity"), data.pop("id"))
+        self._store(key, data)
+
+late_results = LateResults(settings.AI_LATE_RESULT_MAX, settings.AI_LATE_RESULT_TTL)
+
+worker_bus.subscribe("ai_results", late_results._store_remote)
@@ -0,0 +1,184 @@
+"""
+Fast local stand-in for the LLM analyses, used when the latency budget runs out.
+
+- mood: lexicon scoring with simple negation, vectorized over a batch of
+  entries as one scatter-add into a ``(entries, moods)`` matrix
+- themes: RAKE keyword phrases (stopword-delimited phrases scored by word
+  degree over frequency)
+- action items: sentences with intent cues ("need to", "should", ...)
+- todo suggestions: rule-based subtask hints
+
+Results have the same shape as the LLM ones plus ``"source": "local"``. A
+typical entry takes a couple of hundred microseconds.
+"""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+MOOD_LEXICON: Dict[str, Iterable[str]] = {
+    "happy": (
+        "happy", "glad", "great", "good", "joy", "joyful", "excited", "fun", "love", "loved", "proud",
+        "grateful", "thankful", "wonderful", "amazing", "awesome", "celebrate", "celebrated", "smile", "laughed",
+    ),
+    "calm": ("calm", "relaxed", "peaceful", "rested", "content", "quiet", "balanced", "easy", "serene", "chill"),
+    "focused": (
+        "focused", "productive", "progress", "finished", "completed", "shipped", "accomplished", "done",
+        "learned", "flow", "efficient", "organized", "motivated", "determined",
+    ),
+    "anxious": (
+        "anxious", "worried", "worry", "nervous", "stress", "stressed", "overwhelmed", "panic", "afraid",
+        "scared", "uneasy", "deadline", "pressure", "tense", "fear",
+    ),
+    "sad": ("sad", "down", "lonely", "cried", "upset", "hurt", "miss", "missed", "disappointed", "lost", "grief"),
+    "angry": ("angry", "mad", "furious", "annoyed", "frustrated", "irritated", "hate", "unfair", "resent"),
+    "tired": ("tired", "exhausted", "sleepy", "drained", "fatigue", "burnout", "burned", "sick", "slept"),
+}
+MOODS = tuple(MOOD_LEXICON)
+
+NEGATIONS = frozenset({"not", "no", "never", "don't", "didn't", "isn't", "wasn't", "barely", "hardly"})
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further get got had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most my myself
+no nor not now of off on once only or other our ours ourselves out over own really same she should so some
+still such than that the their theirs them themselves then there these they this those through to today too
+under until up very was we were what when where which while who whom why will with would you your yours
+yourself yourselves feel felt lot lots much many thing things day bit though although however yet even
+""".split())
+
+ACTION_CUES = re.compile(
+    r"\b(?:(?:needs?|ha(?:ve|s)|remember|going|plan|want) to|must|should|don't forget|to-?do)\b", re.IGNORECASE,
+)
+
+_WORD = re.compile(r"[a-z][a-z']*")
+# Words, plus the punctuation that ends a RAKE phrase; one pass feeds both mood and themes
+_TOKEN = re.compile(r"[a-z][a-z']*|[.,;:!?()\[\]\"\n\t]| - ")
+_SENTENCE_END = ".!?\n"
+
+# Token -> row of a (vocabulary, moods) weight matrix
+_VOCAB = {word: index for index, word in enumerate(sorted({w for words in MOOD_LEXICON.values() for w in words}))}
+_WEIGHTS = np.zeros((len(_VOCAB), len(MOODS)), dtype=np.float32)
+for _column, _mood in enumerate(MOODS):
+    for _word in MOOD_LEXICON[_mood]:
+        _WEIGHTS[_VOCAB[_word], _column] = 1.0
+
+SUBTASK_RULES = (
+    (("call", "phone", "ring"), "Look up the number and block a time to call"),
+    (("email", "reply", "write", "message", "respond"), "Draft the key points before writing"),
+    (("meet", "meeting", "schedule", "sync", "interview"), "Propose two time slots and send the invite"),
+    (("buy", "order", "purchase", "shop"), "List exactly what's needed and set a budget"),
+    (("doc", "docs", "document", "documentation", "report", "write-up", "presentation"),
+     "Outline the sections first, then fill them in one at a time"),
+    (("fix", "bug", "debug", "broken", "error"), "Reproduce the problem and note the exact steps"),
+    (("research", "plan", "explore", "investigate", "learn"), "Timebox the research and write down open questions"),
+    (("review", "check", "audit"), "Make a checklist of what the review has to cover"),
+    (("pay", "invoice", "bill", "tax", "taxes"), "Gather the account details and due date"),
+)
+URGENT_WORDS = frozenset({"urgent", "asap", "today", "tonight", "immediately", "now", "overdue"})
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+def mood_scores(texts: List[str]) -> np.ndarray:
+    """Lexicon hits per mood for each text, as a ``(len(texts), len(MOODS))`` array.
+
+    A cue right after a negation ("not happy") doesn't count.
+    """
+    return _mood_matrix([tokenize(text) for text in texts])
+
+def _mood_matrix(token_lists: List[List[str]]) -> np.ndarray:
+    docs, rows = [], []
+    for doc, tokens in enumerate(token_lists):
+        previous = ""
+        for token in tokens:
+            row = _VOCAB.get(token)
+            if row is not None and previous not in NEGATIONS:
+                docs.append(doc)
+                rows.append(row)
+            previous = token
+    scores = np.zeros((len(token_lists), len(MOODS)), dtype=np.float32)
+    if rows:
+        np.add.at(scores, np.asarray(docs), _WEIGHTS[np.asarray(rows)])
+    return scores
+
+def rake_keywords(text: str, limit: int = 3, max_words: int = 3) -> List[str]:
+    """Top RAKE phrases: runs of content words between stopwords and punctuation."""
+    return _rake(_TOKEN.findall(text.lower()), limit, max_words)
+
+def _rake(tokens: List[str], limit: int, max_words: int) -> List[str]:
+    phrases, phrase = [], []
+    for token in tokens:
+        if len(token) < 3 or token in STOPWORDS:
+            if 0 < len(phrase) <= max_words:
+                phrases.append(phrase)
+            phrase = []
+        else:
+            phrase.append(token)
+    if 0 < len(phrase) <= max_words:
+        phrases.append(phrase)
+    frequency: Dict[str, int] = defaultdict(int)
+    degree: Dict[str, int] = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+    scored: Dict[str, float] = {}
+    for phrase in phrases:
+        key = " ".join(phrase)
+        scored[key] = sum(degree[word] / frequency[word] for word in phrase)
+    # Ties resolved by first appearance
+    ranked = sorted(scored, key=lambda key: -scored[key])
+    return ranked[:limit]
+
+def action_items(text: str, limit: int = 5) -> List[str]:
+    """Sentences containing an intent cue, found from the cues outwards rather than by splitting every sentence."""
+    items, covered = [], 0
+    for match in ACTION_CUES.finditer(text):
+        if match.start() < covered:
+            continue  # another cue in a sentence already taken
+        start = max(text.rfind(mark, 0, match.start()) for mark in _SENTENCE_END) + 1
+        ends = [i for i in (text.find(mark, match.end()) for mark in _SENTENCE_END) if i >= 0]
+        covered = min(ends) + 1 if ends else len(text)
+        items.append(text[start:covered].strip()[:200])
+        if len(items) == limit:
+            break
+    return items
+
+def analyze_journal_batch(texts: List[str]) -> List[dict]:
+    """Local analysis of many journal entries; mood scoring runs once over the whole batch."""
+    token_lists = [_TOKEN.findall(text.lower()) for text in texts]
+    scores = _mood_matrix(token_lists)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    results = []
+    for text, tokens, row, columns in zip(texts, token_lists, scores, order):
+        ranked = [MOODS[column] for column in columns if row[column] > 0]
+        results.append({
+            "mood": ranked[0] if ranked else "neutral",
+            "themes": _rake(tokens, 3, 3),
+            "action_items": action_items(text),
+            "emotional_patterns": ranked[1:],
+            "source": "local",
+        })
+    return results
+
+def analyze_journal_entry(text: str) -> dict:
+    return analyze_journal_batch([text])[0]
+
+def suggest_subtasks(title: str, description: Optional[str] = None, limit: int = 3) -> List[str]:
+    """Rule-based hints for a todo: split compound tasks, then match task-type keywords."""
+    text = f"{title}. {description or ''}"
+    words = set(tokenize(text))
+    suggestions = []
+    if words & URGENT_WORDS:
+        suggestions.append("Do this first: it's marked as urgent")
+    parts = [part.strip() for part in re.split(r",|;| and | then ", title) if part.strip()]
+    if len(parts) > 1:
+        suggestions.extend(f"Subtask: {part}" for part in parts)
+    for keywords, hint in SUBTASK_RULES:
+        if words.intersection(keywords):
+            suggestions.append(hint)
+    if len(suggestions) < limit:
+        suggestions.append("Break it into steps of 30 minutes or less")
+    return suggestions[:limit]
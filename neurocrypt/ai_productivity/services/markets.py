@@ -0,0 +1,288 @@
+"""
+Market tick ingestion and OHLCV rollups.
+
+Ticks come from a pluggable source: a callable taking the latest stored tick
+time per symbol and returning an async iterator of tick batches, each a list of
+``(symbol, epoch ms, price, size)`` tuples. ``MARKET_SOURCE`` is either a
+recorded file, replayed by ``replay``, or ``"package.module:function"``.
+
+Each batch is appended to the ``ticks`` table and, in the same transaction,
+folded into 1m, 1h and 1d candles: ``downsample`` reduces the batch to one
+partial candle per symbol and bucket with a single sort, and the database
+merges each partial into the stored candle (open from the earliest tick, close
+from the latest, high/low/volume/trades combined). Rollups therefore cost per
+bucket touched, not per tick, and never need a rescan of the ticks.
+
+``ohlcv`` serves a range from the finest resolution that fits it in the
+requested number of points, as a primary key range scan over exactly the
+points returned.
+"""
+import asyncio
+import csv
+import gzip
+import importlib
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.exc import OperationalError
+from ..config import settings
+from ..telemetry import meter
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker ingests
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+market_ticks = meter.create_counter("market.ticks", description="Market ticks appended")
+
+RESOLUTIONS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+# Wall-clock seconds per batch when replaying in real time
+PACED_BATCH_SECONDS = 0.1
+
+Tick = Tuple[str, int, float, float]  # (symbol, epoch ms, price, size)
+Source = Callable[[Dict[str, int]], AsyncIterator[List[Tick]]]
+
+def to_ms(value) -> int:
+    """Epoch milliseconds from epoch seconds or milliseconds (told apart by size), or an ISO 8601 string."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    try:
+        number = float(value)
+    except ValueError:
+        return to_ms(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+    return int(number * 1000) if abs(number) < 1e11 else int(number)
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path), newline="")
+    return open(path, newline="")
+
+def read_ticks(path: str) -> Iterator[Tick]:
+    """Ticks from a recorded file, in file order.
+
+    CSV files need a header with ``symbol``, ``price``, a time column (``ts``,
+    ``time`` or ``timestamp``) and optionally ``size`` (or ``qty``/``quantity``).
+    JSON lines files take the same keys or Binance trade stream fields
+    (``s``, ``p``, ``q``, ``T``). Either may be gzipped. Lines that don't parse
+    are skipped with a warning.
+    """
+    skipped = 0
+    with _open(path) as f:
+        if ".csv" in os.path.basename(path):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            try:
+                symbol = record.get("symbol") or record["s"]
+                ts = next(record[key] for key in ("ts", "time", "timestamp", "T", "E") if record.get(key) is not None)
+                size = next((record[key] for key in ("size", "qty", "quantity", "q") if record.get(key)), 0)
+                yield symbol.upper(), to_ms(ts), float(record.get("price") or record["p"]), float(size)
+            except (KeyError, StopIteration, TypeError, ValueError):
+                skipped += 1
+    if skipped:
+        logger.warning("Skipped %d unreadable ticks in %s", skipped, path)
+
+def _next_batch(
+    ticks: Iterator[Tick], since: Dict[str, int], batch_size: int, span_ms: Optional[float],
+) -> List[Tick]:
+    batch: List[Tick] = []
+    for tick in ticks:
+        if tick[1] <= since.get(tick[0], -1):
+            continue
+        batch.append(tick)
+        if len(batch) >= batch_size or (span_ms is not None and tick[1] - batch[0][1] >= span_ms):
+            break
+    return batch
+
+async def replay(
+    path: str, since: Dict[str, int], speed: float = 0.0, batch_size: int = 5000,
+) -> AsyncIterator[List[Tick]]:
+    """Batches of ticks from a recorded file, skipping those at or before ``since`` for their symbol.
+
+    Restarting a replay therefore picks up after the last stored batch (ticks
+    sharing that batch's last millisecond included, as they are taken as stored).
+
+    With ``speed`` > 0 batches are released on the file's own clock, ``speed``
+    times faster than recorded; 0 replays as fast as the database takes them.
+    """
+    loop = asyncio.get_running_loop()
+    ticks = read_ticks(path)
+    span_ms = PACED_BATCH_SECONDS * 1000 * speed if speed > 0 else None
+    clock: Optional[Tuple[float, int]] = None  # (wall time, tick time) of the first batch
+    while True:
+        batch = await loop.run_in_executor(None, _next_batch, ticks, since, batch_size, span_ms)
+        if not batch:
+            return
+        if span_ms is not None:
+            if clock is None:
+                clock = (time.monotonic(), batch[0][1])
+            delay = clock[0] + (batch[0][1] - clock[1]) / 1000 / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield batch
+
+def load_source(spec: str, speed: float = 0.0, batch_size: int = 5000) -> Source:
+    if os.path.exists(spec) or ":" not in spec:
+        return lambda since: replay(spec, since, speed, batch_size)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+def downsample(ticks: List[Tick], resolutions=tuple(RESOLUTIONS.values())) -> List[dict]:
+    """One partial candle per symbol and bucket of each resolution covered by ``ticks``."""
+    if not ticks:
+        return []
+    count = len(ticks)
+    symbols, times, prices, sizes = zip(*ticks)
+    names: Dict[str, int] = {}
+    codes = np.fromiter((names.setdefault(symbol, len(names)) for symbol in symbols), np.int64, count)
+    times = np.fromiter(times, np.int64, count)
+    # Stable, so ticks with the same time keep their arrival order
+    order = np.lexsort((times, codes))
+    codes, times = codes[order], times[order]
+    prices = np.fromiter(prices, np.float64, count)[order]
+    sizes = np.fromiter(sizes, np.float64, count)[order]
+    by_code = list(names)
+    candles = []
+    for resolution in resolutions:
+        buckets = times - times % (resolution * 1000)
+        starts = np.flatnonzero(
+            np.concatenate(([True], (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])))
+        )
+        ends = np.append(starts[1:], count) - 1
+        for code, start, first_ts, last_ts, open_, close, high, low, volume, trades in zip(
+            codes[starts].tolist(), buckets[starts].tolist(), times[starts].tolist(), times[ends].tolist(),
+            prices[starts].tolist(), prices[ends].tolist(), np.maximum.reduceat(prices, starts).tolist(),
+            np.minimum.reduceat(prices, starts).tolist(), np.add.reduceat(sizes, starts).tolist(),
+            (ends - starts + 1).tolist(),
+        ):
+            candles.append({
+                "symbol": by_code[code], "resolution": resolution, "start": start, "open": open_, "high": high,
+                "low": low, "close": close, "volume": volume, "trades": trades, "first_ts": first_ts,
+                "last_ts": last_ts,
+            })
+    return candles
+
+def choose_resolution(start: int, end: int, limit: int) -> int:
+    """The finest resolution that covers ``start``..``end`` (epoch ms) in at most ``limit`` candles."""
+    for resolution in sorted(RESOLUTIONS.values()):
+        if (end - start) / (resolution * 1000) <= limit:
+            return resolution
+    return max(RESOLUTIONS.values())
+
+async def ohlcv(
+    db_service, symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+    resolution: str = "auto", limit: int = 500,
+) -> dict:
+    """Candles for ``symbol`` from the bucket holding ``start`` up to ``end`` (default now).
+
+    Without ``start``, the ``limit`` buckets up to ``end``.
+    """
+    end_ms = to_ms(end) if end is not None else int(time.time() * 1000)
+    if resolution != "auto":
+        seconds = RESOLUTIONS[resolution]
+    elif start is not None:
+        seconds = choose_resolution(to_ms(start), end_ms, limit)
+    else:
+        seconds = min(RESOLUTIONS.values())
+    bucket_ms = seconds * 1000
+    start_ms = to_ms(start) if start is not None else end_ms - bucket_ms * (limit - 1)
+    start_ms -= start_ms % bucket_ms  # include the bucket ``start`` falls in
+    rows = await db_service.get_candles(symbol.upper(), seconds, start_ms, end_ms, limit)
+    name = next(name for name, value in RESOLUTIONS.items() if value == seconds)
+    return {
+        "symbol": symbol.upper(),
+        "resolution": name,
+        "candles": [
+            {
+                "time": datetime.utcfromtimestamp(row.start / 1000), "open": row.open, "high": row.high,
+                "low": row.low, "close": row.close, "volume": row.volume, "trades": row.trades,
+            }
+            for row in rows
+        ],
+    }
+
+class MarketFeed:
+    def __init__(self, source: Optional[Source] = None, lock_dir: Optional[str] = None, retry_interval: float = 5.0):
+        self.source = source
+        self.lock_dir = lock_dir
+        self.retry_interval = retry_interval
+        self.ticks = 0
+        self.batches = 0
+        self.done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._lock_fd: Optional[int] = None
+
+    def start(self, db_service) -> None:
+        """Ingest from the source in the background; does nothing without one."""
+        if self._task is not None or self.source is None:
+            return
+        self.done = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(db_service))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _try_lead(self) -> bool:
+        if self.lock_dir is None or fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.lock_dir, "markets.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self, db_service) -> None:
+        while not self._try_lead():
+            await asyncio.sleep(self.retry_interval)
+        try:
+            async for batch in self.source(await db_service.get_tick_high_water()):
+                await self._append(db_service, batch)
+            logger.info("Market source finished after %d ticks", self.ticks)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Market source failed after %d ticks", self.ticks)
+        finally:
+            self.done.set()
+
+    async def _append(self, db_service, batch: List[Tick]) -> None:
+        candles = downsample(batch)
+        delay = 0.5
+        while True:
+            try:
+                await db_service.append_ticks(batch, candles)
+                break
+            except OperationalError:
+                logger.exception("Database unavailable for %d ticks; retrying in %.1fs", len(batch), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        self.ticks += len(batch)
+        self.batches += 1
+        market_ticks.add(len(batch))
+
+market_feed = MarketFeed(
+    load_source(settings.MARKET_SOURCE, settings.MARKET_REPLAY_SPEED, settings.MARKET_BATCH_SIZE)
+    if settings.MARKET_SOURCE else None,
+    lock_dir=settings.WORKER_BUS_DIR,
+)
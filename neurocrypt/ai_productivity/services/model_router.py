@@ -0,0 +1,151 @@
+"""
+Model routing and prompt-size control for LLM calls.
+
+Each call is an operation (``todo_suggestions``, ``journal_analysis``, ...)
+routed to a model tier:
+
+- ``AI_TASK_ROUTES`` gives each operation a tier (``fast`` is
+  ``AI_FAST_MODEL``, ``default`` is ``DEFAULT_AI_MODEL``) and an output cap,
+  e.g. ``todo_suggestions=fast:300``. Caps never exceed ``MAX_TOKENS``; an
+  operation not listed gets ``default`` and ``MAX_TOKENS``.
+- A prompt longer than ``AI_FAST_MAX_PROMPT_TOKENS`` is promoted from
+  ``fast`` to ``default``.
+- The router keeps a moving average of each model's observed latency. When the
+  chosen model's average is over ``AI_ROUTE_LATENCY_SLO`` and the fast model is
+  quicker, a prompt short enough for it is demoted to it. Every
+  ``PROBE_EVERY``-th such call still goes to the chosen model, so its average
+  keeps up with its recovery.
+
+Prompts are fitted to ``AI_PROMPT_TOKEN_BUDGET`` before they are sent: the
+longest template values are truncated first. Tokens are counted with tiktoken
+when it is installed, otherwise estimated at ``CHARS_PER_TOKEN`` characters
+each.
+"""
+import functools
+import math
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from ..config import settings
+from ..telemetry import meter
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a length estimate
+    tiktoken = None
+
+TIERS = ("fast", "default")
+
+# Token estimate without tiktoken; about right for English text with OpenAI's tokenizers
+CHARS_PER_TOKEN = 4
+
+# Weight of the newest sample in each model's latency average
+LATENCY_SMOOTHING = 0.2
+
+# While a model is over the latency SLO, one call in this many still goes to it
+PROBE_EVERY = 20
+
+llm_routes = meter.create_counter("llm.routes", description="LLM calls by operation, tier and routing reason")
+llm_truncations = meter.create_counter("llm.prompt.truncations", description="Prompts cut to the token budget")
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = settings.DEFAULT_AI_MODEL) -> int:
+    if tiktoken is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, limit: int, model: str = settings.DEFAULT_AI_MODEL) -> str:
+    """``text`` cut to at most ``limit`` tokens."""
+    if tiktoken is None:
+        return text[:max(0, limit) * CHARS_PER_TOKEN]
+    tokens = _encoding(model).encode(text, disallowed_special=())
+    return text if len(tokens) <= limit else _encoding(model).decode(tokens[:max(0, limit)])
+
+def count_message_tokens(messages: List[dict], model: str = settings.DEFAULT_AI_MODEL) -> int:
+    """Prompt tokens of a chat request, including the per-message framing OpenAI adds."""
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 2
+
+def fit_values(values: Dict[str, str], available: int, model: str = settings.DEFAULT_AI_MODEL) -> Dict[str, str]:
+    """Truncate ``values`` so their tokens add up to at most ``available``.
+
+    Values are visited shortest first and each gets at most an even share of
+    what is left, so short values stay whole and the longest give way.
+    """
+    sizes = {name: count_tokens(value, model) for name, value in values.items()}
+    if sum(sizes.values()) <= available:
+        return values
+    fitted, left = dict(values), max(0, available)
+    for position, name in enumerate(sorted(sizes, key=sizes.get)):
+        share = left // (len(sizes) - position)
+        if sizes[name] > share:
+            fitted[name] = truncate_tokens(values[name], share, model)
+            sizes[name] = share
+        left -= sizes[name]
+    llm_truncations.add(1)
+    return fitted
+
+def parse_routes(spec: str) -> Dict[str, Tuple[str, Optional[int]]]:
+    """``"operation=tier[:max_tokens],..."`` to ``{operation: (tier, max_tokens)}``."""
+    routes = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        operation, _, target = item.partition("=")
+        tier, _, max_tokens = target.strip().partition(":")
+        if not operation.strip() or tier not in TIERS:
+            raise ValueError(f"Invalid AI route {item!r}: expected 'operation=fast|default[:max_tokens]'")
+        routes[operation.strip()] = (tier, int(max_tokens) if max_tokens else None)
+    return routes
+
+class Route(NamedTuple):
+    operation: str
+    tier: str
+    model: str
+    max_tokens: int
+    reason: str  # task, prompt_size, latency_slo or probe
+
+class ModelRouter:
+    def __init__(
+        self, models: Dict[str, str], routes: Dict[str, Tuple[str, Optional[int]]], max_tokens: int,
+        fast_max_prompt_tokens: int, latency_slo: float = 0.0,
+    ):
+        self.models = models
+        self.routes = routes
+        self.max_tokens = max_tokens
+        self.fast_max_prompt_tokens = fast_max_prompt_tokens
+        self.latency_slo = latency_slo
+        self.latency: Dict[str, float] = {}  # model -> moving average, seconds
+        self._demoted = 0
+
+    def route(self, operation: str, prompt_tokens: int) -> Route:
+        tier, cap = self.routes.get(operation, ("default", None))
+        reason = "task"
+        fits_fast = prompt_tokens <= self.fast_max_prompt_tokens
+        if tier == "fast" and not fits_fast:
+            tier, reason = "default", "prompt_size"
+        elif tier == "default" and fits_fast and self._over_slo(self.models["default"], self.models["fast"]):
+            self._demoted += 1
+            tier, reason = ("default", "probe") if self._demoted % PROBE_EVERY == 0 else ("fast", "latency_slo")
+        route = Route(operation, tier, self.models[tier], min(cap or self.max_tokens, self.max_tokens), reason)
+        llm_routes.add(1, {"operation": operation, "tier": tier, "reason": reason})
+        return route
+
+    def _over_slo(self, model: str, alternative: str) -> bool:
+        observed = self.latency.get(model)
+        if not self.latency_slo or observed is None or observed <= self.latency_slo:
+            return False
+        return self.latency.get(alternative, 0.0) < observed
+
+    def observe(self, model: str, seconds: float) -> None:
+        previous = self.latency.get(model)
+        self.latency[model] = seconds if previous is None else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+model_router = ModelRouter(
+    {"fast": settings.AI_FAST_MODEL, "default": settings.DEFAULT_AI_MODEL},
+    parse_routes(settings.AI_TASK_ROUTES),
+    settings.MAX_TOKENS,
+    settings.AI_FAST_MAX_PROMPT_TOKENS,
+    settings.AI_ROUTE_LATENCY_SLO,
+)
@@ -0,0 +1,71 @@
+"""
+Ranking score behind ``GET /todos/?sort=smart``.
+
+The score is persisted on ``Todo.rank_score`` (indexed together with ``id``)
+so the smart order is an index scan with keyset pagination. ``DatabaseService``
+rescores a todo on every write, and a periodic sweep rescores open todos whose
+due date is close enough for the urgency term to be moving.
+
+The scoring function is pluggable: set ``RANK_SCORER`` to ``"package.module:function"``.
+It receives an object with ``due_date``, ``priority``, ``created_at``,
+``goal_id`` and ``completed`` attributes (an ORM row or a column tuple) plus
+the current UTC time, and returns a float where higher ranks first.
+"""
+import base64
+import importlib
+import json
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+from ..config import settings
+
+Scorer = Callable[[object, datetime], float]
+
+# Columns a scorer may read; the sweep selects only these
+SCORE_COLUMNS = ("due_date", "priority", "created_at", "goal_id", "completed")
+
+URGENCY_WEIGHT = 3.0
+PRIORITY_WEIGHT = 2.0
+AGE_WEIGHT = 0.5
+GOAL_WEIGHT = 0.5
+
+def default_score(todo, now: datetime) -> float:
+    """Due-date urgency first, then priority (1-5), then age and goal linkage. Completed todos sink."""
+    if todo.completed:
+        return -1.0
+    urgency = 0.0
+    if todo.due_date is not None:
+        days_left = (todo.due_date - now).total_seconds() / 86400
+        # 1.0 when due now, 0.5 a day out, 0.125 a week out; overdue keeps climbing for a month
+        urgency = 1.0 + min(-days_left, 30.0) / 30.0 if days_left < 0 else 1.0 / (1.0 + days_left)
+    priority = min(max(todo.priority or 1, 1), 5) / 5.0
+    age_days = (now - (todo.created_at or now)).total_seconds() / 86400
+    age = min(max(age_days, 0.0) / 30.0, 1.0)
+    goal = 1.0 if todo.goal_id else 0.0
+    return URGENCY_WEIGHT * urgency + PRIORITY_WEIGHT * priority + AGE_WEIGHT * age + GOAL_WEIGHT * goal
+
+def load_scorer(path: Optional[str]) -> Scorer:
+    if not path:
+        return default_score
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+scorer: Scorer = load_scorer(settings.RANK_SCORER)
+
+def set_scorer(func: Scorer) -> None:
+    """Swap the scoring function at runtime; existing scores converge on the next sweep."""
+    global scorer
+    scorer = func
+
+def score(todo, now: Optional[datetime] = None) -> float:
+    return float(scorer(todo, now or datetime.utcnow()))
+
+def encode_cursor(rank_score: float, todo_id: str) -> str:
+    """Opaque keyset cursor for the page after the todo with this score and id."""
+    return base64.urlsafe_b64encode(json.dumps([rank_score, todo_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        rank_score, todo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank_score), str(todo_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
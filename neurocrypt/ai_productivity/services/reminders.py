@@ -0,0 +1,273 @@
+"""
+Reminder engine for ``Todo.due_date`` and ``Goal.target_date``.
+
+Upcoming deadlines live in an in-memory min-heap keyed on fire time. The heap
+is loaded once at startup from the indexed date columns and then kept current
+from ``DatabaseService`` writes, so nothing rescans the tables on a timer:
+
+- Scheduling, rescheduling and cancelling are O(log n). A superseded entry is
+  left in the heap and skipped when it reaches the top (lazy deletion); the heap
+  is rebuilt when stale entries outnumber live ones.
+- One task sleeps until the earliest fire time and is only woken early when a
+  write changes the head of the heap.
+- Due reminders are delivered in batches to the configured sinks: ``log``,
+  ``change_feed`` (op ``"reminder"``, to the owning tenant's subscribers) and
+  ``webhook``; every reminder names its tenant.
+- With several worker processes only the holder of a lock file in the worker
+  bus directory runs the engine; the other workers forward their writes to it
+  over the worker bus and take over (reloading from the database) if it exits.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from ..config import settings
+from .change_feed import change_feed
+from .shards import DEFAULT_TENANT
+from .worker_bus import worker_bus
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker is a leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]  # (tenant, collection, id)
+
+# Deliver at most this many reminders per sink call
+FIRE_BATCH = 1000
+
+def to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    """Seconds since the epoch; naive datetimes are UTC, as stored by the models."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class ReminderHeap:
+    """Min-heap of fire times with lazy deletion."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, Key]] = []
+        self._live: Dict[Key, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._live
+
+    def push(self, key: Key, fire_at: float) -> None:
+        if self._live.get(key) == fire_at:
+            return
+        self._live[key] = fire_at
+        heapq.heappush(self._heap, (fire_at, key))
+        self._maybe_compact()
+
+    def discard(self, key: Key) -> None:
+        if self._live.pop(key, None) is not None:
+            self._maybe_compact()
+
+    def load(self, entries: Iterable[Tuple[Key, float]]) -> None:
+        """Bulk insert in O(n) with a single heapify."""
+        self._live.update(entries)
+        self._heap = [(fire_at, key) for key, fire_at in self._live.items()]
+        heapq.heapify(self._heap)
+
+    def next_time(self) -> Optional[float]:
+        self._drop_stale_head()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: int = FIRE_BATCH) -> List[Tuple[Key, float]]:
+        due = []
+        while len(due) < limit:
+            self._drop_stale_head()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            fire_at, key = heapq.heappop(self._heap)
+            del self._live[key]
+            due.append((key, fire_at))
+        return due
+
+    def _drop_stale_head(self) -> None:
+        while self._heap and self._live.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _maybe_compact(self) -> None:
+        if len(self._heap) > 2 * len(self._live) + 1024:
+            self.load(())
+
+class ReminderEngine:
+    def __init__(
+        self, sinks: Iterable[str] = ("log",), lead_seconds: float = 0.0,
+        webhook_url: Optional[str] = None, lock_dir: Optional[str] = None, retry_interval: float = 5.0,
+    ):
+        self.sinks = [sink.strip() for sink in sinks if sink.strip()]
+        self.lead_seconds = lead_seconds
+        self.webhook_url = webhook_url
+        self.lock_dir = lock_dir
+        self.retry_interval = retry_interval
+        self.heap = ReminderHeap()
+        self.fired = 0
+        self.is_leader = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._pending: Optional[List[Tuple[Key, Optional[float]]]] = None
+        self._lock_fd: Optional[int] = None
+        self._http = None
+
+    def start(self, loader: Callable[[datetime], AsyncIterator[Tuple[str, str, str, datetime]]]) -> None:
+        """Start the engine; ``loader(after)`` yields ``(tenant, collection, id, due)`` for deadlines after ``after``."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        worker_bus.subscribe("reminders", self._observe_remote)
+        self._task = self._loop.create_task(self._run(loader))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_leader = False
+
+    def fire_time(self, collection: str, row: dict) -> Optional[float]:
+        """When the reminder for ``row`` should fire, or None if it needs none."""
+        if collection == "todos":
+            due = None if row.get("completed") else row.get("due_date")
+        elif collection == "goals":
+            due = row.get("target_date") if row.get("status", "active") == "active" else None
+        else:
+            return None
+        due = to_timestamp(due)
+        return None if due is None else due - self.lead_seconds
+
+    def observe(self, collection: str, op: str, row: dict) -> None:
+        """Called by ``DatabaseService`` after every committed write. Never blocks."""
+        if collection not in ("todos", "goals"):
+            return
+        fire_at = None if op == "delete" else self.fire_time(collection, row)
+        tenant = row.get("tenant_id") or DEFAULT_TENANT
+        worker_bus.publish("reminders", {
+            "tenant": tenant, "collection": collection, "id": row["id"], "fire_at": fire_at,
+        })
+        self._apply((tenant, collection, row["id"]), fire_at)
+
+    def _observe_remote(self, data: dict) -> None:
+        # Runs on the worker bus listener thread
+        if self._loop is not None:
+            key = (data.get("tenant", DEFAULT_TENANT), data["collection"], data["id"])
+            self._loop.call_soon_threadsafe(self._apply, key, data["fire_at"])
+
+    def _apply(self, key: Key, fire_at: Optional[float]) -> None:
+        if not self.is_leader:
+            return
+        if self._pending is not None:
+            # Loading from the database; replayed on top of the snapshot afterwards
+            self._pending.append((key, fire_at))
+            return
+        head = self.heap.next_time()
+        # A reminder is only kept while its fire time is in the future, so
+        # editing a todo whose reminder already went off doesn't repeat it
+        if fire_at is None or fire_at <= time.time():
+            self.heap.discard(key)
+        else:
+            self.heap.push(key, fire_at)
+        if self.heap.next_time() != head:
+            self._wake.set()
+
+    def _try_lead(self) -> bool:
+        if self.lock_dir is None or fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.lock_dir, "reminders.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _load(self, loader) -> None:
+        self._pending = []
+        self.is_leader = True
+        started = time.perf_counter()
+        try:
+            now = time.time()
+            entries = []
+            async for tenant, collection, obj_id, due in loader(datetime.utcfromtimestamp(now + self.lead_seconds)):
+                entries.append(((tenant, collection, obj_id), to_timestamp(due) - self.lead_seconds))
+            self.heap.load(entries)
+        finally:
+            pending, self._pending = self._pending, None
+        for key, fire_at in pending:
+            self._apply(key, fire_at)
+        logger.info("Loaded %d reminders in %.2fs", len(self.heap), time.perf_counter() - started)
+
+    async def _run(self, loader) -> None:
+        while not self._try_lead():
+            await asyncio.sleep(self.retry_interval)
+        await self._load(loader)
+        while True:
+            next_time = self.heap.next_time()
+            timeout = None if next_time is None else max(0.0, next_time - time.time())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            due = self.heap.pop_due(time.time())
+            while due:
+                try:
+                    await self._fire(due)
+                except Exception:
+                    logger.exception("Delivering %d reminders failed", len(due))
+                due = self.heap.pop_due(time.time())
+
+    async def _fire(self, due: List[Tuple[Key, float]]) -> None:
+        self.fired += len(due)
+        reminders = [
+            {
+                "entity": collection, "id": obj_id, "tenant_id": tenant,
+                "due_at": datetime.utcfromtimestamp(fire_at + self.lead_seconds).isoformat(),
+            }
+            for (tenant, collection, obj_id), fire_at in due
+        ]
+        if "log" in self.sinks:
+            for reminder in reminders:
+                logger.info(
+                    "Reminder: %s %s of tenant %s is due at %s",
+                    reminder["entity"], reminder["id"], reminder["tenant_id"], reminder["due_at"],
+                )
+        if "change_feed" in self.sinks:
+            for reminder in reminders:
+                change_feed.publish(reminder["entity"], "reminder", reminder)
+        if "webhook" in self.sinks and self.webhook_url:
+            if self._http is None:
+                import httpx
+                self._http = httpx.AsyncClient(timeout=5.0)
+            response = await self._http.post(self.webhook_url, json={"reminders": reminders})
+            response.raise_for_status()
+
+reminders = ReminderEngine(
+    settings.REMINDER_SINKS.split(","),
+    lead_seconds=settings.REMINDER_LEAD_SECONDS,
+    webhook_url=settings.REMINDER_WEBHOOK_URL,
+    lock_dir=settings.WORKER_BUS_DIR,
+)
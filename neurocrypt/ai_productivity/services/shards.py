@@ -0,0 +1,102 @@
+"""
+Tenant-to-shard routing.
+
+Every row belongs to a tenant (``tenant_id``), and every tenant lives on one
+shard: a database with its own engine and connection pool. ``DATABASE_SHARDS``
+names the shards besides ``default`` (which is ``DATABASE_URL``)::
+
+    DATABASE_SHARDS="big1=sqlite+aiosqlite:///./shard-big1.db,big2=postgresql+asyncpg://db2/neurocrypt"
+
+A tenant stays on the default shard until it is moved (see ``tenants.py``);
+where each moved tenant lives is recorded in the ``tenant_shards`` table on the
+default shard and cached here. The tenant of the code running now is the
+``current_tenant`` context variable, set per request from the tenant header.
+"""
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from ..telemetry import instrument_engine
+
+DEFAULT_TENANT = "default"
+DEFAULT_SHARD = "default"
+
+current_tenant: ContextVar[str] = ContextVar("tenant", default=DEFAULT_TENANT)
+
+class TenantMoved(Exception):
+    """A write reached a shard the tenant has been (or is being) moved off."""
+
+    def __init__(self, tenant: str):
+        super().__init__(f"Tenant {tenant!r} is being moved to another shard")
+        self.tenant = tenant
+
+def parse_shards(spec: Optional[str]) -> Dict[str, str]:
+    """``"name=url,..."`` to ``{name: url}``."""
+    shards = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, url = item.partition("=")
+        if not name.strip() or not url.strip():
+            raise ValueError(f"Invalid shard {item!r}: expected 'name=database-url'")
+        shards[name.strip()] = url.strip()
+    return shards
+
+class Shard:
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.sessionmaker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    def session(self, tenant: Optional[str] = None) -> AsyncSession:
+        """A session on this shard; ``tenant`` is kept in ``session.info`` for ``next_seq``."""
+        return self.sessionmaker(info={"tenant": tenant})
+
+class ShardRouter:
+    def __init__(self, default_engine, urls: Optional[Dict[str, str]] = None, echo: bool = False,
+                 pool_size: int = 5, max_overflow: int = 10):
+        self.urls = dict(urls or {})
+        self.echo = echo
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.placements: Dict[str, str] = {}
+        self._shards: Dict[str, Shard] = {DEFAULT_SHARD: Shard(DEFAULT_SHARD, default_engine)}
+
+    @property
+    def names(self):
+        return [DEFAULT_SHARD, *(name for name in self.urls if name != DEFAULT_SHARD)]
+
+    def shard(self, name: str) -> Shard:
+        shard = self._shards.get(name)
+        if shard is None:
+            if name not in self.urls:
+                raise KeyError(f"Unknown shard {name!r}")
+            options = {"echo": self.echo}
+            if not self.urls[name].startswith("sqlite"):
+                options.update(pool_size=self.pool_size, max_overflow=self.max_overflow, pool_pre_ping=True)
+            engine = create_async_engine(self.urls[name], **options)
+            instrument_engine(engine.sync_engine)
+            shard = self._shards[name] = Shard(name, engine)
+        return shard
+
+    def shards(self):
+        return [self.shard(name) for name in self.names]
+
+    def shard_for(self, tenant: Optional[str] = None) -> Shard:
+        tenant = tenant or current_tenant.get()
+        return self.shard(self.placements.get(tenant, DEFAULT_SHARD))
+
+    def session(self, tenant: Optional[str] = None) -> AsyncSession:
+        tenant = tenant or current_tenant.get()
+        return self.shard_for(tenant).session(tenant)
+
+    def place(self, tenant: str, shard: str) -> None:
+        if shard == DEFAULT_SHARD:
+            self.placements.pop(tenant, None)
+        else:
+            self.shard(shard)  # fail early on unknown shards
+            self.placements[tenant] = shard
+
+    async def dispose(self) -> None:
+        for name, shard in list(self._shards.items()):
+            if name != DEFAULT_SHARD:
+                await shard.engine.dispose()
+                del self._shards[name]
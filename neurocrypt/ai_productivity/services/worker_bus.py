@@ -0,0 +1,277 @@
+"""
+Cross-worker message bus.
+
+Each worker process keeps in-process state (tenant placements, late AI
+results, change feed subscribers) that must follow what another worker does.
+The bus broadcasts small JSON messages to every other process:
+
+- ``redis``: a Redis pub/sub channel, for multi-host deployments.
+- ``local``: Unix datagram sockets in a shared directory, one per process, as a
+  stand-in when Redis is absent. The launcher in ``server.py`` creates the
+  directory and hands it to its workers through ``WORKER_BUS_DIR``.
+
+Publishing only enqueues; a sender thread does the I/O so writes never wait on
+the network. Handlers run on the listener thread.
+
+Delivery is best effort: a local peer that isn't draining its socket is
+retried for up to ``SEND_TIMEOUT`` seconds, and Redis pub/sub loses what is
+published while a subscriber reconnects. Every message carries its sender's
+sequence number, so a receiver that sees a gap calls its gap handlers (see
+``on_gap``) to drop whatever state the lost message might have invalidated.
+
+A payload larger than ``MAX_MESSAGE_BYTES`` is sent in parts and put back
+together by the receivers; one over ``MAX_PAYLOAD_BYTES`` is dropped. Large
+state is better sent as ids the receivers look up (as the change feed does).
+"""
+import base64
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, List, Optional
+import redis
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = "neurocrypt:worker-bus"
+
+# How long a send waits for a local peer whose socket buffer is full
+SEND_TIMEOUT = 1.0
+
+# Largest message put on the wire, below the 64 KB a local listener reads per datagram
+MAX_MESSAGE_BYTES = 60 * 1024
+RECV_BYTES = 64 * 1024
+# Payloads are split into parts up to this size and dropped beyond it
+MAX_PAYLOAD_BYTES = 8 * 1024 * 1024
+# Split payloads being put back together at once; the oldest incomplete one gives way
+PARTS_IN_FLIGHT = 64
+# Base64 text of one part, leaving room for the envelope
+PART_CHUNK = (MAX_MESSAGE_BYTES - 1024) // 4 * 3
+
+class RedisTransport:
+    def __init__(self, url: str):
+        self.client = redis.from_url(url, socket_connect_timeout=0.5)
+        self.client.ping()
+        self._pubsub = None
+        self._thread = None
+
+    def send(self, message: bytes) -> None:
+        self.client.publish(REDIS_CHANNEL, message)
+
+    def listen(self, callback: Callable[[bytes], None]) -> None:
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{REDIS_CHANNEL: lambda message: callback(message["data"])})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+class LocalSocketTransport:
+    """One Unix datagram socket per process; a send goes to every peer in the directory."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self._closed = False
+
+    def send(self, message: bytes) -> None:
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for name in os.listdir(self.directory):
+                peer = os.path.join(self.directory, name)
+                if not name.endswith(".sock") or peer == self.path:
+                    continue
+                try:
+                    sender.sendto(message, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The peer exited without cleaning up
+                    try:
+                        os.unlink(peer)
+                    except FileNotFoundError:
+                        pass
+                except BlockingIOError:
+                    self._send_blocking(message, peer)
+        finally:
+            sender.close()
+
+    @staticmethod
+    def _send_blocking(message: bytes, peer: str) -> None:
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.settimeout(SEND_TIMEOUT)
+        try:
+            sender.sendto(message, peer)
+        except OSError:
+            # The peer notices the gap in sequence numbers and resets its state
+            logger.warning("Worker bus peer %s is not draining its socket; dropping message", peer)
+        finally:
+            sender.close()
+
+    def listen(self, callback: Callable[[bytes], None]) -> None:
+        def loop():
+            while not self._closed:
+                try:
+                    raw = self.sock.recv(RECV_BYTES)
+                except OSError:
+                    return
+                try:
+                    callback(raw)
+                except Exception:
+                    # One bad message must not stop the listener
+                    logger.exception("Worker bus message handling failed")
+        threading.Thread(target=loop, name="worker-bus-listener", daemon=True).start()
+
+    def close(self) -> None:
+        self._closed = True
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+class WorkerBus:
+    """Broadcast ``(channel, data)`` messages to the other worker processes."""
+
+    def __init__(self, backend: str = "auto", redis_url: Optional[str] = None, socket_dir: Optional[str] = None):
+        self.backend = backend
+        self.redis_url = redis_url
+        self.socket_dir = socket_dir
+        self.origin = uuid.uuid4().hex
+        self.transport = None
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._gap_handlers: List[Callable[[], None]] = []
+        self._outbox: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._seq = itertools.count(1)
+        self._seq_lock = threading.Lock()
+        self._last_seq: Dict[str, int] = {}  # origin -> last sequence number received
+        self._parts: "OrderedDict[tuple, Dict[int, bytes]]" = OrderedDict()  # (origin, id) -> parts so far
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]) -> None:
+        self._handlers[channel].append(handler)
+
+    def on_gap(self, handler: Callable[[], None]) -> None:
+        """Call ``handler`` (on the listener thread) whenever messages from another worker went missing."""
+        self._gap_handlers.append(handler)
+
+    def publish(self, channel: str, data: dict) -> None:
+        if self.transport is None:
+            return
+        body = json.dumps({"channel": channel, "data": data}).encode()
+        if len(body) > MAX_PAYLOAD_BYTES:
+            logger.warning("Dropping %d-byte worker bus message on %s: over MAX_PAYLOAD_BYTES", len(body), channel)
+            return
+        if len(body) <= MAX_MESSAGE_BYTES - 256:
+            messages = [{"origin": self.origin, "channel": channel, "data": data}]
+        else:
+            part_id = uuid.uuid4().hex
+            chunks = [body[start:start + PART_CHUNK] for start in range(0, len(body), PART_CHUNK)]
+            messages = [
+                {"origin": self.origin, "part": {
+                    "id": part_id, "index": index, "count": len(chunks), "chunk": base64.b64encode(chunk).decode(),
+                }}
+                for index, chunk in enumerate(chunks)
+            ]
+        # Numbered and queued under one lock so the sequence goes out in order
+        with self._seq_lock:
+            for message in messages:
+                message["seq"] = next(self._seq)
+                self._outbox.put(json.dumps(message).encode())
+
+    def _connect(self):
+        if self.backend in ("auto", "redis") and self.redis_url:
+            try:
+                return RedisTransport(self.redis_url)
+            except redis.RedisError as e:
+                if self.backend == "redis":
+                    raise
+                logger.info("Redis unavailable for the worker bus (%s); falling back", e)
+        if self.backend in ("auto", "local") and self.socket_dir:
+            return LocalSocketTransport(self.socket_dir)
+        return None
+
+    def start(self) -> None:
+        if self.backend == "none" or self.transport is not None:
+            return
+        self.transport = self._connect()
+        if self.transport is None:
+            logger.info("Worker bus disabled: single-process mode")
+            return
+        self.transport.listen(self._dispatch)
+        threading.Thread(target=self._drain_outbox, name="worker-bus-sender", daemon=True).start()
+        logger.info("Worker bus started with %s", type(self.transport).__name__)
+
+    def stop(self) -> None:
+        if self.transport is not None:
+            self._outbox.put(None)
+            self.transport.close()
+            self.transport = None
+
+    def _drain_outbox(self) -> None:
+        transport = self.transport
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            try:
+                transport.send(message)
+            except Exception:
+                logger.exception("Worker bus publish failed")
+
+    def _dispatch(self, raw: bytes) -> None:
+        try:
+            message = json.loads(raw)
+            origin = message["origin"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed %d-byte worker bus message", len(raw))
+            return
+        if origin == self.origin:
+            return
+        seq, last = message.get("seq"), self._last_seq.get(origin)
+        if seq is not None:
+            self._last_seq[origin] = seq if last is None else max(last, seq)
+            if last is not None and seq > last + 1:
+                logger.warning("Lost %d worker bus messages from %s", seq - last - 1, origin)
+                for handler in self._gap_handlers:
+                    try:
+                        handler()
+                    except Exception:
+                        logger.exception("Worker bus gap handler failed")
+        if "part" in message:
+            try:
+                message = self._reassemble(origin, message["part"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Ignoring a malformed part of a worker bus message from %s", origin)
+                return
+            if message is None:
+                return
+        for handler in self._handlers.get(message.get("channel"), ()):
+            try:
+                handler(message["data"])
+            except Exception:
+                logger.exception("Worker bus handler for %s failed", message["channel"])
+
+    def _reassemble(self, origin: str, part: dict) -> Optional[dict]:
+        """Collect one part of a split payload; the whole ``{"channel", "data"}`` once every part is in."""
+        key = (origin, part["id"])
+        parts = self._parts.setdefault(key, {})
+        parts[part["index"]] = base64.b64decode(part["chunk"])
+        if len(parts) < part["count"]:
+            while len(self._parts) > PARTS_IN_FLIGHT:
+                self._parts.popitem(last=False)
+            return None
+        del self._parts[key]
+        return json.loads(b"".join(parts[index] for index in range(part["count"])))
+
+worker_bus = WorkerBus(settings.WORKER_BUS, settings.REDIS_URL, settings.WORKER_BUS_DIR)
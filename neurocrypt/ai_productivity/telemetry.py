@@ -0,0 +1,208 @@
+"""
+Tracing and metrics for the hot paths: HTTP routes, database calls and LLM calls.
+
+Spans are exported to a JSON-lines file (``TRACES_EXPORT_FILE``) or to a local
+OTLP collector (``OTLP_ENDPOINT``) so everything works offline. Metrics are kept
+in memory and rendered in the Prometheus text format by ``/metrics``.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from opentelemetry import metrics, trace
+from opentelemetry.sdk.metrics import Histogram as HistogramInstrument, MeterProvider
+from opentelemetry.sdk.metrics.export import Histogram, InMemoryMetricReader, Sum
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from sqlalchemy import event
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+resource = Resource.create({"service.name": "neurocrypt-ai-productivity"})
+
+tracer_provider = TracerProvider(resource=resource)
+if settings.OTLP_ENDPOINT:
+    # Optional dependency: opentelemetry-exporter-otlp-proto-http
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.OTLP_ENDPOINT)))
+if settings.TRACES_EXPORT_FILE:
+    _traces_file = open(settings.TRACES_EXPORT_FILE, "a", buffering=1)
+    tracer_provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+        out=_traces_file,
+        formatter=lambda span: span.to_json(indent=None) + "\n",
+    )))
+trace.set_tracer_provider(tracer_provider)
+
+metric_reader = InMemoryMetricReader()
+meter_provider = MeterProvider(
+    resource=resource,
+    metric_readers=[metric_reader],
+    views=[
+        View(instrument_type=HistogramInstrument, aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS_MS)),
+    ],
+)
+metrics.set_meter_provider(meter_provider)
+
+tracer = tracer_provider.get_tracer("neurocrypt.ai_productivity")
+meter = meter_provider.get_meter("neurocrypt.ai_productivity")
+
+http_duration = meter.create_histogram("http.server.duration", unit="ms", description="HTTP route latency")
+db_duration = meter.create_histogram("db.client.duration", unit="ms", description="DatabaseService call latency")
+llm_duration = meter.create_histogram("llm.request.duration", unit="ms", description="LLM call latency, including retries")
+llm_tokens = meter.create_counter("llm.tokens", description="LLM tokens by model and kind")
+llm_retries = meter.create_counter("llm.retries", description="LLM call retries by model")
+llm_fallbacks = meter.create_counter("llm.fallbacks", description="AI results served locally, by operation and reason")
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+# HTTP
+class TelemetryMiddleware:
+    """ASGI middleware recording one span and one latency sample per request.
+
+    Routes are labelled by their path template (``/todos/{todo_id}``), looked
+    up from the endpoint the router stored in the scope, to keep cardinality low.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._route_paths:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._route_paths[endpoint] = route.path
+                    break
+            else:
+                self._route_paths[endpoint] = endpoint.__name__
+        return self._route_paths[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with tracer.start_as_current_span(scope["method"], kind=trace.SpanKind.SERVER) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = self._route_path(scope)
+                span.update_name(f"{scope['method']} {route}")
+                span.set_attribute("http.method", scope["method"])
+                span.set_attribute("http.route", route)
+                span.set_attribute("http.target", scope["path"])
+                span.set_attribute("http.status_code", status["code"])
+                http_duration.record(_elapsed_ms(start), {
+                    "method": scope["method"], "route": route, "status": status["code"],
+                })
+
+# Database
+@contextmanager
+def db_span(operation: str, table: str) -> Iterator[trace.Span]:
+    """Span and latency sample around one DatabaseService call."""
+    start = time.perf_counter()
+    with tracer.start_as_current_span(f"db.{operation} {table}") as span:
+        span.set_attribute("db.operation", operation)
+        span.set_attribute("db.sql.table", table)
+        try:
+            yield span
+        finally:
+            db_duration.record(_elapsed_ms(start), {"operation": operation, "table": table})
+
+def instrument_engine(sync_engine) -> None:
+    """Record every statement as a span and log those above ``SLOW_QUERY_MS``."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start_ns = time.time_ns()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_ns = context._query_start_ns
+        elapsed_ms = (time.time_ns() - start_ns) / 1e6
+        span = tracer.start_span("db.query", start_time=start_ns, kind=trace.SpanKind.CLIENT)
+        span.set_attribute("db.system", conn.dialect.name)
+        span.set_attribute("db.statement", statement)
+        span.set_attribute("db.rowcount", cursor.rowcount)
+        span.end()
+        if elapsed_ms >= settings.SLOW_QUERY_MS:
+            logger.warning("Slow query (%.1f ms, %d rows): %s", elapsed_ms, cursor.rowcount, statement)
+
+# LLM
+def record_llm_call(
+    span: trace.Span, model: str, start: float, retries: int, usage=None, route: Optional[str] = None,
+) -> None:
+    """Attach model, retry and token usage details to an LLM span and metrics, labelled by route if given."""
+    labels = {"model": model} if route is None else {"model": model, "route": route}
+    span.set_attribute("llm.model", model)
+    span.set_attribute("llm.retries", retries)
+    if retries:
+        llm_retries.add(retries, labels)
+    if usage is not None:
+        span.set_attribute("llm.prompt_tokens", usage.get("prompt_tokens", 0))
+        span.set_attribute("llm.completion_tokens", usage.get("completion_tokens", 0))
+        llm_tokens.add(usage.get("prompt_tokens", 0), {**labels, "kind": "prompt"})
+        llm_tokens.add(usage.get("completion_tokens", 0), {**labels, "kind": "completion"})
+    llm_duration.record(_elapsed_ms(start), labels)
+
+# Prometheus exposition
+def _prometheus_name(name: str, unit: str = "") -> str:
+    name = name.replace(".", "_").replace("-", "_")
+    if unit and unit != "1":
+        name = f"{name}_{unit}"
+    return name
+
+def _labels(attributes, **extra) -> str:
+    items = {**dict(attributes or {}), **extra}
+    if not items:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in items.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def render_prometheus() -> str:
+    """Render the current metric values in the Prometheus text format."""
+    lines = []
+    data = metric_reader.get_metrics_data()
+    for resource_metrics in (data.resource_metrics if data else []):
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                name = _prometheus_name(metric.name, metric.unit)
+                if isinstance(metric.data, Histogram):
+                    lines.append(f"# HELP {name} {metric.description}")
+                    lines.append(f"# TYPE {name} histogram")
+                    for point in metric.data.data_points:
+                        cumulative = 0
+                        for bound, count in zip(point.explicit_bounds, point.bucket_counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_labels(point.attributes, le=bound)} {cumulative}")
+                        lines.append(f"{name}_bucket{_labels(point.attributes, le='+Inf')} {point.count}")
+                        lines.append(f"{name}_sum{_labels(point.attributes)} {point.sum}")
+                        lines.append(f"{name}_count{_labels(point.attributes)} {point.count}")
+                elif isinstance(metric.data, Sum):
+                    kind = "counter" if metric.data.is_monotonic else "gauge"
+                    suffix = "_total" if metric.data.is_monotonic else ""
+                    lines.append(f"# HELP {name}{suffix} {metric.description}")
+                    lines.append(f"# TYPE {name}{suffix} {kind}")
+                    for point in metric.data.data_points:
+                        lines.append(f"{name}{suffix}{_labels(point.attributes)} {point.value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,299 @@
+"""Tenant scoping for requests, and moving tenants between database shards.
+
+Every request runs as the tenant named in the ``TENANT_HEADER`` header
+(``X-Tenant-ID``), or as ``default`` without one; ``DatabaseService`` reads and
+writes that tenant's rows on the shard it lives on (see ``services/shards.py``).
+
+``move_tenant`` moves a tenant to another shard while it keeps serving:
+
+1. Rows and tombstones are copied in change-sequence order, in batches, pass
+   after pass, each pass picking up what was written during the previous one,
+   until a pass finds little left.
+2. The tenant's change counter on the old shard is fenced. From then on every
+   write there fails with ``TenantMoved`` and is retried by ``DatabaseService``
+   once the tenant's new shard is known. Reads keep being served from the old
+   shard.
+3. A last pass copies what was written before the fence, the tenant's counters
+   follow it (so delta sync positions stay valid), and the new placement is
+   recorded in the catalog and announced on the worker bus. Writes waiting on
+   the fence then go to the new shard.
+4. After a grace period for stragglers, the tenant's rows are deleted from the
+   old shard (``--keep-source`` leaves them).
+
+Writes stall for the length of the last pass only. If the move fails after the
+fence, the fence is lifted and the tenant stays where it was.
+
+    python -m neurocrypt.ai_productivity.tenants move big-customer shard2
+    python -m neurocrypt.ai_productivity.tenants list
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from typing import List, Tuple
+from sqlalchemy import delete, func, select, update
+from .config import settings
+from .services.db_service import (
+    MODELS, SEQUENCE, TOMBSTONE_FLOOR, Goal, JournalEntry, SyncCounter, TenantShard, Todo, Tombstone,
+    _upsert_statement, async_session, counter_name, counter_value, init_db, router,
+)
+from .services.shards import DEFAULT_TENANT, Shard, current_tenant
+from .services.worker_bus import worker_bus
+
+logger = logging.getLogger(__name__)
+
+TENANT_ID = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+# Goals first: todos reference them
+COPY_ORDER = ("goals", "todos", "journal_entries")
+
+class TenantMiddleware:
+    """ASGI middleware running each request as the tenant named in its tenant header."""
+
+    def __init__(self, app, header: str = settings.TENANT_HEADER):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        tenant = DEFAULT_TENANT
+        for name, value in scope["headers"]:
+            if name == self.header:
+                tenant = value.decode("latin-1").strip()
+                break
+        if not TENANT_ID.fullmatch(tenant):
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1008})
+                return
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"application/json")],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Invalid tenant id"}'})
+            return
+        token = current_tenant.set(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)
+
+async def _sequence(shard: Shard, tenant: str) -> int:
+    async with shard.session() as session:
+        return counter_value((await session.execute(
+            select(SyncCounter.value).where(SyncCounter.name == counter_name(SEQUENCE, tenant))
+        )).scalar())
+
+async def _link_goals(source: Shard, session, tenant: str, todos: List[dict]) -> None:
+    """Copy the goals ``todos`` link to that aren't on the target yet.
+
+    A goal deleted on the source since the todo was read is unlinked here; the
+    todo's own unlinked version follows in a later pass.
+    """
+    wanted = {row["goal_id"] for row in todos if row["goal_id"]}
+    if not wanted:
+        return
+    present = set((await session.execute(select(Goal.id).where(Goal.id.in_(wanted)))).scalars())
+    missing = wanted - present
+    if missing:
+        async with source.session() as source_session:
+            goals = [dict(row) for row in (await source_session.execute(
+                select(Goal.__table__).where(Goal.tenant_id == tenant, Goal.id.in_(missing))
+            )).mappings()]
+        if goals:
+            await session.execute(_upsert_statement(Goal.__table__, session.bind.dialect.name, verbatim=True), goals)
+        missing -= {goal["id"] for goal in goals}
+    for row in todos:
+        if row["goal_id"] in missing:
+            row["goal_id"] = None
+
+async def _copy_pass(source: Shard, target: Shard, tenant: str, since: int, batch_size: int) -> Tuple[int, int]:
+    """Copy the tenant's rows and tombstones written after ``since``; returns ``(high water, rows copied)``."""
+    high_water = await _sequence(source, tenant)
+    copied = 0
+    for collection in COPY_ORDER:
+        model, last = MODELS[collection], since
+        while True:
+            async with source.session() as session:
+                rows = [dict(row) for row in (await session.execute(
+                    select(model.__table__)
+                    .where(model.tenant_id == tenant, model.seq > last, model.seq <= high_water)
+                    .order_by(model.seq).limit(batch_size)
+                )).mappings()]
+            if not rows:
+                break
+            last = rows[-1]["seq"]
+            async with target.session() as session:
+                if model is Todo:
+                    await _link_goals(source, session, tenant, rows)
+                statement = _upsert_statement(model.__table__, session.bind.dialect.name, verbatim=True)
+                await session.execute(statement, rows)
+                await session.commit()
+            copied += len(rows)
+    last = since
+    while True:
+        async with source.session() as session:
+            tombstones = [dict(row) for row in (await session.execute(
+                select(Tombstone.__table__)
+                .where(Tombstone.tenant_id == tenant, Tombstone.seq > last, Tombstone.seq <= high_water)
+                .order_by(Tombstone.seq).limit(batch_size)
+            )).mappings()]
+        if not tombstones:
+            break
+        last = tombstones[-1]["seq"]
+        async with target.session() as session:
+            for tombstone in tombstones:
+                model = MODELS[tombstone["entity"]]
+                await session.execute(delete(model).where(
+                    model.id == tombstone["entity_id"], model.tenant_id == tenant, model.seq < tombstone["seq"],
+                ))
+            await session.execute(Tombstone.__table__.insert(), tombstones)
+            await session.commit()
+        copied += len(tombstones)
+    return high_water, copied
+
+async def _fence(shard: Shard, tenant: str, fenced: bool) -> None:
+    """Fence the tenant's change counter on ``shard`` (``value -> -value - 1``), or lift the fence."""
+    name = counter_name(SEQUENCE, tenant)
+    async with shard.session() as session:
+        condition = SyncCounter.value >= 0 if fenced else SyncCounter.value < 0
+        result = await session.execute(
+            update(SyncCounter).where(SyncCounter.name == name, condition).values(value=-SyncCounter.value - 1)
+        )
+        if fenced and result.rowcount == 0 and await session.get(SyncCounter, name) is None:
+            session.add(SyncCounter(name=name, value=-1))
+        await session.commit()
+
+async def _copy_counters(source: Shard, target: Shard, tenant: str) -> None:
+    names = [counter_name(SEQUENCE, tenant), counter_name(TOMBSTONE_FLOOR, tenant)]
+    async with source.session() as session:
+        values = dict((await session.execute(
+            select(SyncCounter.name, SyncCounter.value).where(SyncCounter.name.in_(names))
+        )).all())
+    async with target.session() as session:
+        await session.execute(delete(SyncCounter).where(SyncCounter.name.in_(names)))
+        session.add_all(SyncCounter(name=name, value=counter_value(values.get(name))) for name in names)
+        await session.commit()
+
+async def purge_tenant(shard: Shard, tenant: str, batch_size: int = 1000, counters: bool = True) -> int:
+    """Delete the tenant's rows from ``shard`` in batches; with ``counters``, its counters too."""
+    removed = 0
+    # Todos before the goals they reference
+    for model, key in ((Todo, Todo.id), (JournalEntry, JournalEntry.id), (Goal, Goal.id), (Tombstone, Tombstone.seq)):
+        while True:
+            async with shard.session() as session:
+                keys = list((await session.execute(
+                    select(key).where(model.tenant_id == tenant).limit(batch_size)
+                )).scalars())
+                if not keys:
+                    break
+                await session.execute(delete(model).where(model.tenant_id == tenant, key.in_(keys)))
+                await session.commit()
+            removed += len(keys)
+    if counters:
+        async with shard.session() as session:
+            await session.execute(delete(SyncCounter).where(
+                SyncCounter.name.in_([counter_name(SEQUENCE, tenant), counter_name(TOMBSTONE_FLOOR, tenant)])
+            ))
+            await session.commit()
+    return removed
+
+async def move_tenant(
+    tenant: str, target: str, batch_size: int = 1000, settle_rows: int = 100, max_passes: int = 10,
+    grace: float = settings.TENANT_MOVE_GRACE, keep_source: bool = False,
+) -> dict:
+    """Move ``tenant`` to the ``target`` shard while it keeps serving; see the module docstring."""
+    await init_db()
+    source, destination = router.shard_for(tenant), router.shard(target)
+    if source is destination:
+        raise ValueError(f"Tenant {tenant!r} is already on shard {target!r}")
+    started = time.perf_counter()
+    stats = {"tenant": tenant, "source": source.name, "target": target, "passes": 0, "copied": 0}
+    # Leftovers of an earlier, abandoned move would otherwise survive the copy
+    await purge_tenant(destination, tenant, batch_size)
+    since = 0
+    while True:
+        since, copied = await _copy_pass(source, destination, tenant, since, batch_size)
+        stats["passes"] += 1
+        stats["copied"] += copied
+        logger.info("Copy pass %d for tenant %s: %d rows up to seq %d", stats["passes"], tenant, copied, since)
+        if copied <= settle_rows or stats["passes"] >= max_passes:
+            break
+
+    await _fence(source, tenant, True)
+    fenced = time.perf_counter()
+    try:
+        since, copied = await _copy_pass(source, destination, tenant, since, batch_size)
+        stats["passes"] += 1
+        stats["copied"] += copied
+        await _copy_counters(source, destination, tenant)
+        async with async_session() as session:
+            await session.merge(TenantShard(tenant_id=tenant, shard=target, moved_at=datetime.utcnow()))
+            await session.commit()
+    except BaseException:
+        await _fence(source, tenant, False)
+        raise
+    router.place(tenant, target)
+    worker_bus.publish("tenant_moved", {"tenant": tenant, "shard": target})
+    stats["write_pause_ms"] = (time.perf_counter() - fenced) * 1000
+    stats["seq"] = since
+
+    if not keep_source:
+        await asyncio.sleep(grace)
+        stats["removed"] = await purge_tenant(source, tenant, batch_size, counters=False)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+async def list_tenants() -> dict:
+    """Row counts per tenant on every shard, and the catalog's placements."""
+    shards = {}
+    for shard in router.shards():
+        async with shard.session() as session:
+            counts = {}
+            for collection, model in MODELS.items():
+                for tenant, count in await session.execute(
+                    select(model.tenant_id, func.count()).group_by(model.tenant_id)
+                ):
+                    counts.setdefault(tenant, {})[collection] = count
+        shards[shard.name] = counts
+    async with async_session() as session:
+        placements = dict((await session.execute(select(TenantShard.tenant_id, TenantShard.shard))).all())
+    return {"shards": shards, "placements": placements}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("move", help="Move a tenant to another shard online")
+    move.add_argument("tenant")
+    move.add_argument("shard", help="Target shard name from DATABASE_SHARDS, or 'default'")
+    move.add_argument("--batch-size", type=int, default=1000)
+    move.add_argument("--settle-rows", type=int, default=100, help="Fence once a copy pass finds this few rows")
+    move.add_argument("--grace", type=float, default=settings.TENANT_MOVE_GRACE,
+                      help="Seconds to wait before deleting the tenant from its old shard")
+    move.add_argument("--keep-source", action="store_true", help="Leave the tenant's rows on its old shard")
+    commands.add_parser("list", help="Show row counts per tenant and shard")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        if args.command == "list":
+            await init_db()
+            return await list_tenants()
+        worker_bus.start()
+        try:
+            return await move_tenant(
+                args.tenant, args.shard, args.batch_size, args.settle_rows, grace=args.grace,
+                keep_source=args.keep_source,
+            )
+        finally:
+            worker_bus.stop()
+
+    print(json.dumps(asyncio.run(run()), indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import shutil
+import tempfile
+
+# The services create their engines at import time, so the throwaway database
+# has to be in place before any test module imports them
+_database_dir = tempfile.mkdtemp(prefix="neurocrypt-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_database_dir}/test.db"
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_database_dir, ignore_errors=True)
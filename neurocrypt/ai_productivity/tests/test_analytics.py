@@ -0,0 +1,91 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from ..services.analytics import AnalyticsSnapshot, ColumnTable, bucket
+
+class FakeSync:
+    def __init__(self):
+        self.changes = []
+
+    def write(self, entity, op, data):
+        self.changes.append({"entity": entity, "op": op, "seq": len(self.changes) + 1, "data": data})
+
+    async def get_tombstone_floor(self):
+        return 0
+
+    async def get_sync_position(self):
+        return 0
+
+    async def iter_columns(self, collection, columns, max_seq):
+        return
+        yield
+
+    async def get_changes_since(self, since, limit):
+        page = [change for change in self.changes if change["seq"] > since][:limit]
+        has_more = len([change for change in self.changes if change["seq"] > since]) > limit
+        return {"changes": page, "next_since": page[-1]["seq"] if page else since, "has_more": has_more}
+
+def test_week_buckets_start_on_monday():
+    dates = np.array(["2024-01-01T09:00", "2024-01-07T23:00", "2024-01-08T00:00"], dtype="datetime64[s]")
+    assert np.datetime_as_string(bucket(dates, "week")).tolist() == ["2024-01-01", "2024-01-01", "2024-01-08"]
+
+def test_column_table_reclaims_deleted_rows():
+    table = ColumnTable({"priority": "int8"}, capacity=4)
+    for i in range(3000):
+        table.upsert(f"t{i}", {"priority": i % 5})
+    for i in range(2000):
+        table.delete(f"t{i}")
+    table.upsert("t2999", {"priority": 4})
+    assert len(table) == 1000
+    assert table.size < 3000
+    assert table.view()["id"].tolist() == [f"t{i}" for i in range(2000, 3000)]
+
+def test_category_codes_widen_with_the_category_count():
+    table = ColumnTable({"mood": "int8"}, categories=("mood",), capacity=4)
+    for i in range(200):
+        table.upsert(f"j{i}", {"mood": f"mood-{i}"})
+    table.extend([(f"k{i}", f"mood-{i}") for i in range(200, 40000)])
+    assert table.columns["mood"].dtype == np.int32
+    names = table.categories["mood"].names
+    assert [names[code] for code in table.view()["mood"][[0, 199, -1]].tolist()] == ["mood-0", "mood-199", "mood-39999"]
+
+@pytest.mark.asyncio
+async def test_snapshot_refreshes_incrementally():
+    sync = FakeSync()
+    snapshot = AnalyticsSnapshot(sync, refresh_interval=0)
+    monday, tuesday, next_week = datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 9)
+    sync.write("todos", "upsert", {"id": "a", "created_at": monday, "completed": True})
+    sync.write("todos", "upsert", {"id": "b", "created_at": tuesday, "completed": False})
+    sync.write("journal_entries", "upsert", {"id": "j1", "created_at": monday, "mood": "happy"})
+    sync.write("journal_entries", "upsert", {"id": "j2", "created_at": next_week, "mood": None})
+    await snapshot.refresh()
+
+    assert snapshot.todo_completion("week") == [
+        {"period": "2024-01-01", "created": 2, "completed": 1, "completion_rate": 0.5},
+    ]
+    assert snapshot.mood_distribution("week") == [
+        {"period": "2024-01-01", "moods": {"happy": 1}},
+        {"period": "2024-01-08", "moods": {"unknown": 1}},
+    ]
+
+    sync.write("todos", "upsert", {"id": "b", "created_at": tuesday, "completed": True})
+    sync.write("todos", "delete", {"id": "a"})
+    await snapshot.refresh()
+    assert snapshot.todo_completion("week")[0]["completion_rate"] == 1.0
+    with pytest.raises(ValueError):
+        snapshot.todo_completion("fortnight")
+
+def test_goal_velocity_projects_completion():
+    snapshot = AnalyticsSnapshot(FakeSync())
+    goals = snapshot.tables["goals"]
+    goals.upsert("g1", {"created_at": datetime(2024, 1, 1), "target_date": datetime(2024, 1, 21),
+                        "progress": 50.0, "status": "active"})
+    goals.upsert("g2", {"created_at": datetime(2024, 1, 1), "progress": 0.0, "status": "active"})
+    goals.upsert("g3", {"created_at": datetime(2024, 1, 1), "progress": 100.0, "status": "done"})
+
+    velocity = {goal["id"]: goal for goal in snapshot.goal_velocity(now=datetime(2024, 1, 11))}
+    assert set(velocity) == {"g1", "g2"}
+    assert velocity["g1"]["velocity_per_day"] == 5.0
+    assert velocity["g1"]["projected_days_left"] == 10.0
+    assert velocity["g1"]["on_track"] is True
+    assert velocity["g2"]["projected_days_left"] is None
@@ -0,0 +1,85 @@
+import pytest
+from ..batch_edit import batch_edit, diff_document, parse_block, render_document
+from ..services.db_service import DatabaseService, init_db
+from ..utils import generate_uuid
+
+def _row(obj):
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+def test_unchanged_document_has_no_changes():
+    rows = [
+        {"id": f"todo-{i}", "version": 1, "title": f"Task {i}", "priority": 1, "due_date": None,
+         "completed": False, "goal_id": None, "description": "line one\n  indented\n\nlast" if i % 2 else None}
+        for i in range(2000)
+    ]
+    document, originals = render_document("todos", rows)
+    assert diff_document("todos", document, originals) == ({}, [])
+    # Editors that trim trailing whitespace or add a final newline don't count as edits
+    assert diff_document("todos", document.replace("goal_id:\n", "goal_id:   \n") + "\n\n", originals) == ({}, [])
+
+    edited = document.replace("title: Task 7\n", "title: Task seven\n").replace("    last", "    last!", 1)
+    changes, errors = diff_document("todos", edited, originals)
+    assert errors == []
+    assert changes == {"todo-1": {"description": "line one\n  indented\n\nlast!"}, "todo-7": {"title": "Task seven"}}
+
+def test_parse_errors_name_the_entry():
+    document, originals = render_document("journal_entries", [
+        {"id": "entry", "version": 2, "mood": None, "tags": ["a"], "content": "Hello"},
+    ])
+    _, errors = diff_document("journal_entries", document.replace("    Hello", ""), originals)
+    assert errors == ["entry: content can't be empty"]
+    _, errors = diff_document("journal_entries", document.replace("v2", "v1"), originals)
+    assert errors == ["entry: the version on the '@@' line was changed"]
+    assert parse_block("journal_entries", "tags: x, y ,\ncontent: inline\n    more\n") == {
+        "tags": ["x", "y"], "content": "inline\nmore",
+    }
+    with pytest.raises(ValueError):
+        parse_block("todos", "completed: maybe\n")
+
+@pytest.mark.asyncio
+async def test_batch_edit_writes_only_changed_entries():
+    await init_db()
+    db = DatabaseService()
+    goal = await db.create_goal({"id": generate_uuid(), "title": "Batch"})
+    todos = [await db.create_todo({"id": generate_uuid(), "title": f"Batch {i}"}) for i in range(5)]
+    target = todos[2]
+    sessions = []
+
+    def edit(document):
+        sessions.append(document)
+        if len(sessions) == 1:
+            block = f"@@ {target.id} v1\ntitle: Batch 2\npriority: "
+            return document.replace(block + "1", block + "high")
+        if len(sessions) == 2:
+            return document.replace("priority: high", "priority: 4").replace(
+                "title: Batch 2\npriority: 4\ndue_date:\ncompleted: no\ngoal_id:",
+                "title: Batch 2\npriority: 4\ndue_date:\ncompleted: yes\ngoal_id: nope",
+            )
+        return document.replace("goal_id: nope", f"goal_id: {goal.id}")
+
+    stats = await batch_edit(db, "todos", [_row(todo) for todo in todos], edit)
+    assert "# ERROR" in sessions[1] and "priority must be a whole number" in sessions[1]
+    assert f"# ERROR {target.id}: goal nope does not exist" in sessions[2]
+    assert (stats["changed"], stats["updated"], stats["conflicts"]) == (1, 1, [])
+    updated = await db.get_todo(target.id)
+    assert (updated.priority, updated.completed, updated.goal_id, updated.version) == (4, True, goal.id, 2)
+    assert (await db.get_todo(todos[0].id)).version == 1
+    goal = await db.get_goal(goal.id)
+    assert (goal.todo_count, goal.completed_count, goal.progress) == (1, 1, 100.0)
+
+    assert (await batch_edit(db, "todos", [_row(todos[0])], lambda document: ""))["cancelled"]
+
+@pytest.mark.asyncio
+async def test_bulk_update_skips_rows_changed_since_the_edit_began():
+    await init_db()
+    db = DatabaseService()
+    first = await db.create_journal_entry({"id": generate_uuid(), "content": "One"})
+    second = await db.create_journal_entry({"id": generate_uuid(), "content": "Two"})
+    await db.update_journal_entry(second.id, {"content": "Two, elsewhere"})
+
+    changes = {first.id: {"mood": "calm"}, second.id: {"mood": "calm"}, "missing": {"mood": "calm"}}
+    updated, skipped = await db.bulk_update("journal_entries", changes, {first.id: 1, second.id: 1, "missing": 1})
+    assert [entry.id for entry in updated] == [first.id]
+    assert skipped == [second.id, "missing"]
+    assert (await db.get_journal_entry(first.id)).mood == "calm"
+    assert (await db.get_journal_entry(second.id)).mood is None
@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+from ..benchmarks.common import percentile, summarize
+from ..benchmarks.compare import find_regressions
+from ..benchmarks.fake_openai import create_app
+
+def test_percentiles():
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    summary = summarize(samples, elapsed_s=2.0)
+    assert summary["count"] == 100
+    assert summary["throughput_rps"] == 50.0
+
+def test_fake_openai_completion_and_error_injection():
+    client = TestClient(create_app())
+    response = client.post("/v1/chat/completions", json={
+        "model": "gpt-4", "messages": [{"role": "user", "content": "Format the response as a JSON object."}],
+    })
+    assert response.status_code == 200
+    assert "mood" in response.json()["choices"][0]["message"]["content"]
+    assert response.json()["usage"]["total_tokens"] > 0
+
+    failing = TestClient(create_app(error_rate=1.0))
+    response = failing.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "hi"}]})
+    assert response.status_code in (429, 500)
+
+def test_find_regressions():
+    base = {"results": {"GET /todos/": {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "throughput_rps": 100, "errors": 0}}}
+    same = {"results": {"GET /todos/": {"p50_ms": 11, "p95_ms": 21, "p99_ms": 31, "throughput_rps": 95, "errors": 0}}}
+    slow = {"results": {"GET /todos/": {"p50_ms": 10, "p95_ms": 20, "p99_ms": 60, "throughput_rps": 100, "errors": 0}}}
+    assert find_regressions(base, same, 0.2) == []
+    assert find_regressions(base, slow, 0.2) == ["GET /todos/: p99_ms 30.000 -> 60.000"]
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import pytest
+from ..services.change_feed import ChangeFeed
+
+@pytest.mark.asyncio
+async def test_events_reach_only_matching_subscribers():
+    feed = ChangeFeed(max_buffer=10)
+    feed.start()
+    todos = feed.subscribe(["todos"])
+    goals = feed.subscribe(["goals"])
+
+    feed.publish("todos", "create", {"id": "t1", "title": "Write docs"})
+    event = json.loads(await asyncio.wait_for(todos.get(), 1))
+    assert event == {"entity": "todos", "op": "create", "data": {"id": "t1", "title": "Write docs"}}
+    assert goals.queue.empty()
+    await feed.stop()
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_disconnected():
+    feed = ChangeFeed(max_buffer=2)
+    feed.start()
+    slow = feed.subscribe(["todos"])
+    for i in range(3):
+        feed.publish("todos", "update", {"id": "t1", "version": i})
+    await asyncio.sleep(0.05)
+
+    assert await slow.get() is None
+    assert feed.subscriber_count == 0
+    await feed.stop()
+
+def test_unknown_entity_is_rejected():
+    with pytest.raises(ValueError):
+        ChangeFeed().subscribe(["invoices"])
+
+def test_websocket_unsubscribes_when_a_quiet_client_leaves():
+    from fastapi.testclient import TestClient
+    from ..app import app, change_feed
+
+    before = change_feed.subscriber_count
+    with TestClient(app).websocket_connect("/changes/ws?entities=goals"):
+        assert change_feed.subscriber_count == before + 1
+    # No goal event arrived, yet the subscription is gone
+    assert change_feed.subscriber_count == before
@@ -0,0 +1,72 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from ..etag import NotModified, not_modified_handler, collection_etag, etag_matches
+from ..services.db_service import DatabaseService, Todo, init_db, router
+from ..tenants import TenantMiddleware
+from ..utils import generate_uuid
+
+class FakeDatabase:
+    def __init__(self):
+        self.version = 1
+
+    async def get_collection_version(self, collection):
+        return str(self.version)
+
+database = FakeDatabase()
+
+app = FastAPI()
+app.add_exception_handler(NotModified, not_modified_handler)
+
+@app.get("/items/", dependencies=[Depends(collection_etag(database, "items"))])
+async def get_items():
+    return [{"id": "1"}]
+
+client = TestClient(TenantMiddleware(app, header="X-Tenant-ID"))
+
+def test_etag_matches():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('"b", W/"a"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+def test_collection_etag_not_modified_until_write():
+    response = client.get("/items/")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get("/items/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+    assert response.headers["vary"] == "X-Tenant-ID"
+
+    # Nor may tenants
+    response = client.get("/items/", headers={"If-None-Match": etag, "X-Tenant-ID": "acme"})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+    # Different query strings must not share an ETag
+    assert client.get("/items/?limit=1").headers["etag"] != etag
+
+    database.version += 1
+    response = client.get("/items/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+@pytest.mark.asyncio
+async def test_collection_version_is_shared_by_every_worker():
+    await init_db()
+    # Each worker process has its own DatabaseService; the version lives in the database
+    first, second = DatabaseService(), DatabaseService()
+    before = await first.get_collection_version("todos")
+    assert await second.get_collection_version("todos") == before
+    await first.create_todo({"id": generate_uuid(), "title": "Seen by every worker"})
+    after = await second.get_collection_version("todos")
+    assert after != before and await first.get_collection_version("todos") == after
+    # Rescoring reorders todos without a change sequence number
+    async with router.shard_for().engine.begin() as conn:
+        await conn.execute(update(Todo.__table__).values(rank_score=None))
+    assert await second.refresh_rank_scores() > 0
+    assert await first.get_collection_version("todos") != after
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import update
+from ..services.db_service import DatabaseService, Goal, Todo, async_session, init_db
+from ..utils import generate_uuid
+
+async def _todo(db, goal_id, completed=False):
+    return await db.create_todo({"id": generate_uuid(), "title": "Step", "goal_id": goal_id, "completed": completed})
+
+@pytest.mark.asyncio
+async def test_progress_follows_todo_writes():
+    await init_db()
+    db = DatabaseService()
+    goal = await db.create_goal({"id": generate_uuid(), "title": "Launch"})
+    other = await db.create_goal({"id": generate_uuid(), "title": "Other"})
+
+    first = await _todo(db, goal.id)
+    second = await _todo(db, goal.id, completed=True)
+    goal = await db.get_goal(goal.id)
+    assert (goal.todo_count, goal.completed_count, goal.progress) == (2, 1, 50.0)
+
+    await db.update_todo(first.id, {"completed": True})
+    assert (await db.get_goal(goal.id)).progress == 100.0
+    await db.update_todo(first.id, {"completed": False})
+    await db.update_todo(second.id, {"goal_id": other.id})
+    goal, other = await db.get_goal(goal.id), await db.get_goal(other.id)
+    assert (goal.todo_count, goal.completed_count, goal.progress) == (1, 0, 0.0)
+    assert (other.todo_count, other.completed_count, other.progress) == (1, 1, 100.0)
+
+    await db.delete_todo(second.id)
+    assert (await db.get_goal(other.id)).todo_count == 0
+    assert [todo.id for todo in await db.get_goal_todos(goal.id)] == [first.id]
+
+    with pytest.raises(ValueError):
+        await _todo(db, "missing-goal")
+
+    await db.delete_goal(goal.id)
+    assert (await db.get_todo(first.id)).goal_id is None
+
+@pytest.mark.asyncio
+async def test_verification_fixes_drift():
+    await init_db()
+    db = DatabaseService()
+    goal = await db.create_goal({"id": generate_uuid(), "title": "Drifted"})
+    await _todo(db, goal.id, completed=True)
+    async with async_session() as session:
+        await session.execute(update(Goal).where(Goal.id == goal.id).values(todo_count=5, completed_count=0))
+        # Another tenant's todo naming the same goal id doesn't count toward it
+        await session.execute(Todo.__table__.insert().values(
+            id=generate_uuid(), title="Elsewhere", goal_id=goal.id, tenant_id="other", version=1,
+        ))
+        await session.commit()
+
+    assert await db.verify_goal_rollups(batch_size=2) >= 1
+    goal = await db.get_goal(goal.id)
+    assert (goal.todo_count, goal.completed_count, goal.progress) == (1, 1, 100.0)
+    assert await db.verify_goal_rollups() == 0
@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from ..idempotency import IdempotencyKeys, IdempotencyMiddleware, MemoryIdempotencyStore
+from ..tenants import TenantMiddleware
+
+keys = IdempotencyKeys("/items/,/flaky/", store="memory", wait_timeout=5.0)
+app = FastAPI()
+app.add_middleware(IdempotencyMiddleware, keys=keys, client_key=lambda scope: "client")
+app.add_middleware(TenantMiddleware, header="X-Tenant-ID")
+calls = {"items": 0, "flaky": 0}
+
+@app.post("/items/")
+async def create_item(item: dict):
+    calls["items"] += 1
+    await asyncio.sleep(0.05)
+    return {"number": calls["items"], **item}
+
+@app.post("/flaky/")
+async def flaky():
+    calls["flaky"] += 1
+    if calls["flaky"] == 1:
+        raise HTTPException(status_code=503, detail="try again")
+    return {"ok": True}
+
+def client():
+    return httpx.AsyncClient(app=app, base_url="http://test")
+
+@pytest.mark.asyncio
+async def test_replays_the_first_response():
+    async with client() as c:
+        first = await c.post("/items/", json={"title": "a"}, headers={"Idempotency-Key": "k1"})
+        again = await c.post("/items/", json={"title": "a"}, headers={"Idempotency-Key": "k1"})
+        other = await c.post("/items/", json={"title": "a"}, headers={"Idempotency-Key": "k2"})
+        plain = await c.post("/items/", json={"title": "a"})
+        tenant = await c.post("/items/", json={"title": "a"}, headers={"Idempotency-Key": "k1", "X-Tenant-ID": "acme"})
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert other.json()["number"] != first.json()["number"]
+    assert plain.json()["number"] != other.json()["number"]
+    assert "idempotent-replayed" not in tenant.headers
+
+@pytest.mark.asyncio
+async def test_reused_key_with_a_different_body_is_rejected():
+    async with client() as c:
+        await c.post("/items/", json={"title": "a"}, headers={"Idempotency-Key": "k3"})
+        response = await c.post("/items/", json={"title": "b"}, headers={"Idempotency-Key": "k3"})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_wait_for_the_first_request():
+    before = calls["items"]
+    async with client() as c:
+        responses = await asyncio.gather(*(
+            c.post("/items/", json={"title": "same"}, headers={"Idempotency-Key": "k4"}) for _ in range(5)
+        ))
+    assert calls["items"] == before + 1
+    assert len({response.text for response in responses}) == 1
+    assert sum(response.headers.get("idempotent-replayed") == "true" for response in responses) == 4
+
+@pytest.mark.asyncio
+async def test_server_errors_are_not_stored():
+    async with client() as c:
+        failed = await c.post("/flaky/", headers={"Idempotency-Key": "k5"})
+        retried = await c.post("/flaky/", headers={"Idempotency-Key": "k5"})
+    assert failed.status_code == 503
+    assert retried.status_code == 200
+    assert calls["flaky"] == 2
+
+@pytest.mark.asyncio
+async def test_expired_claims_can_be_taken_over():
+    store = MemoryIdempotencyStore()
+    first, second = {"state": "pending"}, {"state": "pending"}
+    assert await store.begin("k", first, lock_ttl=0.01) is None
+    assert await store.begin("k", second, lock_ttl=10) is first
+    await asyncio.sleep(0.02)
+    assert await store.begin("k", second, lock_ttl=10) is None
+    await store.complete("k", first, {"state": "done"}, ttl=10)  # stale owner: ignored
+    assert await store.begin("k", {}, lock_ttl=10) is second
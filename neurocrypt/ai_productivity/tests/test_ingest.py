@@ -0,0 +1,130 @@
+import asyncio
+import json
+import pytest
+from ..benchmarks.fake_mqtt import FakeBroker, topic_matches
+from ..services.db_service import DatabaseService, init_db
+from ..services.ingest import Ingestor, parse_message, parse_routes
+from ..utils import generate_uuid
+
+ROUTES = "test/+/events=journal, test/+/alerts=todo"
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+def _manual_ack() -> bool:
+    import paho.mqtt.client as mqtt
+    return hasattr(mqtt.Client, "manual_ack_set")
+
+def test_routes_and_topic_filters():
+    assert parse_routes(ROUTES) == [("test/+/events", "journal_entries"), ("test/+/alerts", "todos")]
+    with pytest.raises(ValueError):
+        parse_routes("test/#=goal")
+    assert topic_matches("test/+/events", "test/kitchen/events")
+    assert topic_matches("test/#", "test/kitchen/events")
+    assert not topic_matches("test/+/events", "test/kitchen/events/raw")
+
+def test_parse_message():
+    event = parse_message("journal_entries", "home/kitchen/events", json.dumps({
+        "id": 7, "message": "Door opened", "ts": 1700000000, "device": "door-1", "tags": ["home"],
+    }).encode())
+    assert event["content"] == "Door opened"
+    assert event["tags"] == ["home", "device:door-1", "iot"]
+    assert event["created_at"].isoformat() == "2023-11-14T22:13:20"
+    # The same message id on the same topic is the same row; on another topic it isn't
+    assert parse_message("journal_entries", "home/kitchen/events", b'{"id": 7, "message": "again"}')["id"] == event["id"]
+    assert parse_message("journal_entries", "home/garage/events", b'{"id": 7, "message": "again"}')["id"] != event["id"]
+    # Without an id only a redelivery of the same timestamped event is a duplicate
+    stamped = b'{"message": "Door opened", "ts": 1700000000}'
+    assert parse_message("journal_entries", "t", stamped)["id"] == parse_message("journal_entries", "t", stamped)["id"]
+    assert parse_message("journal_entries", "t", stamped)["id"] != parse_message(
+        "journal_entries", "t", b'{"message": "Door opened", "ts": 1700000060}')["id"]
+    assert parse_message("journal_entries", "t", b"Door opened")["id"] != parse_message(
+        "journal_entries", "t", b"Door opened")["id"]
+
+    alert = parse_message("todos", "home/boiler/alerts", b'{"message": "Pressure low\\nbar=0.4", "severity": "critical"}')
+    assert (alert["title"], alert["priority"], alert["description"]) == ("Pressure low", 5, "Alert from home/boiler/alerts")
+    assert parse_message("todos", "t", b"Check filter")["title"] == "Check filter"
+    assert parse_message("todos", "t", b'{"message": "x", "priority": 1e400}')["priority"] == 5
+    for payload in (
+        b"", b'{"message": ""}', b"\xff\xfe", b'{"message": "x", "priority": "high"}',
+        b'{"message": "x", "ts": 1e300}', b'{"message": "x", "ts": -1e18}', b'{"message": "x", "due": 1e20}',
+    ):
+        with pytest.raises(ValueError):
+            parse_message("todos", "t", payload)
+
+@pytest.mark.asyncio
+async def test_ingests_messages_once_in_group_commits():
+    await init_db()
+    db = DatabaseService()
+    broker = FakeBroker()
+    port = await broker.start()
+    ingestor = Ingestor(parse_routes(ROUTES), f"mqtt://127.0.0.1:{port}", client_id=f"test-{generate_uuid()}")
+    ingestor.start(db)
+    try:
+        await asyncio.wait_for(ingestor.subscribed.wait(), 5)
+        run = generate_uuid()
+        for i in range(20):
+            broker.publish("test/sensor/events", json.dumps({"id": f"{run}-{i}", "message": f"Reading {i}"}).encode())
+        broker.publish("test/sensor/events", json.dumps({"id": f"{run}-3", "message": "Reading 3"}).encode())
+        broker.publish("test/sensor/alerts", json.dumps({"id": run, "message": "Battery low", "severity": "high"}).encode())
+        broker.publish("test/sensor/events", b"{}")
+        await _wait_for(lambda: ingestor.stats["received"] == 23 and not ingestor.buffer.qsize())
+        await _wait_for(lambda: ingestor.stats["inserted"] + ingestor.stats["duplicates"] == 22)
+    finally:
+        await ingestor.stop()
+        await broker.stop()
+
+    assert (ingestor.stats["inserted"], ingestor.stats["duplicates"], ingestor.stats["rejected"]) == (21, 1, 1)
+    if _manual_ack():
+        assert ingestor.stats["batches"] < 21
+
+    def row_id(collection, topic, key):
+        return parse_message(collection, topic, json.dumps({"id": key, "message": "x"}).encode())["id"]
+
+    for i in range(20):
+        entry = await db.get_journal_entry(row_id("journal_entries", "test/sensor/events", f"{run}-{i}"))
+        assert (entry.content, entry.tags) == (f"Reading {i}", ["iot"])
+    todo = await db.get_todo(row_id("todos", "test/sensor/alerts", run))
+    assert (todo.title, todo.priority) == ("Battery low", 4)
+
+class _SlowDatabase:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.rows = []
+
+    async def insert_new(self, rows):
+        await self.release.wait()
+        for items in rows.values():
+            self.rows.extend(items)
+        return {collection: list(items) for collection, items in rows.items()}
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not _manual_ack(), reason="paho-mqtt 1.x commits one message at a time")
+async def test_full_buffer_holds_messages_back_at_the_broker():
+    broker = FakeBroker(max_inflight=5)
+    port = await broker.start()
+    ingestor = Ingestor(
+        parse_routes(ROUTES), f"mqtt://127.0.0.1:{port}", client_id=f"test-{generate_uuid()}",
+        buffer_size=2, batch_size=2,
+    )
+    db = _SlowDatabase()
+    ingestor.start(db)
+    try:
+        await asyncio.wait_for(ingestor.subscribed.wait(), 5)
+        for i in range(50):
+            broker.publish("test/sensor/events", f"Reading {i}".encode())
+        await _wait_for(lambda: ingestor.stats["stalls"] > 0)
+        session = broker.sessions[ingestor.client_id]
+        assert len(session.queued) >= 40  # held at the broker, not in our memory
+        # Nothing is acknowledged before it is committed
+        assert len(session.inflight) == ingestor.stats["received"] > 0
+        db.release.set()
+        await _wait_for(lambda: len(db.rows) == 50)
+    finally:
+        db.release.set()
+        await ingestor.stop()
+        await broker.stop()
+    assert [row["content"] for row in db.rows] == [f"Reading {i}" for i in range(50)]
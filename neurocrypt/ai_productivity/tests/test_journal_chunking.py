@@ -0,0 +1,50 @@
+import asyncio
+import json
+import pytest
+from ..config import settings
+from ..services.ai_service import AIService, merge_journal_analyses
+
+def test_merge_weights_mood_and_dedupes_lists():
+    merged = merge_journal_analyses([
+        ({"mood": "Anxious", "themes": ["work", "sleep"], "action_items": ["Call Sam"]}, 900),
+        ({"mood": "calm", "themes": ["Work", "family"], "emotional_patterns": "rumination"}, 400),
+        ({"mood": "calm", "themes": [], "action_items": ["Call Sam", "Book trip"]}, 300),
+    ])
+    assert merged == {
+        "mood": "anxious",
+        "themes": ["work", "sleep", "family"],
+        "action_items": ["Call Sam", "Book trip"],
+        "emotional_patterns": ["rumination"],
+    }
+
+@pytest.mark.asyncio
+async def test_long_entries_are_analyzed_in_bounded_parallel_chunks(monkeypatch):
+    service = AIService()
+    calls, in_flight, peak = [], 0, 0
+
+    async def fake_chat(operation, messages, model="gpt-4"):
+        nonlocal in_flight, peak
+        calls.append(operation)
+        part = len(calls)
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if part == 2:
+            return "not json"
+        return json.dumps({"mood": "hopeful", "themes": [f"theme {part}"], "action_items": []})
+
+    monkeypatch.setattr(service, "_chat", fake_chat)
+    monkeypatch.setattr(settings, "JOURNAL_CHUNK_CONCURRENCY", 2)
+    entry = " ".join(f"Sentence number {i} about the day." for i in range(400))
+
+    result = await service.analyze_journal_entry(entry)
+    assert set(calls) == {"journal_analysis_chunk"}
+    assert len(calls) == len(service.text_splitter.split_text(entry)) > 2
+    assert peak <= 2
+    assert result["mood"] == "hopeful"
+    assert len(result["themes"]) == len(calls) - 1
+
+    calls.clear()
+    await service.analyze_journal_entry("Short entry.")
+    assert calls == ["journal_analysis"]
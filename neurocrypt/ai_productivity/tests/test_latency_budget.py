@@ -0,0 +1,64 @@
+import asyncio
+import json
+import pytest
+from ..config import settings
+from ..services import local_analyzer
+from ..services.ai_service import AIService
+from ..services.late_results import late_results
+
+ENTRY = (
+    "Today was a productive day. I finished the quarterly report and shipped the onboarding flow! "
+    "Still worried about the API migration deadline. I need to call Sam about the budget. "
+    "Not happy with how little I slept."
+)
+
+def test_local_analysis_of_a_journal_entry():
+    result = local_analyzer.analyze_journal_entry(ENTRY)
+    assert result["source"] == "local"
+    assert result["mood"] == "focused"
+    assert "happy" not in result["emotional_patterns"]  # negated
+    assert "anxious" in result["emotional_patterns"]
+    assert "quarterly report" in result["themes"]
+    assert result["action_items"] == ["I need to call Sam about the budget."]
+    assert local_analyzer.analyze_journal_batch([ENTRY, "Nothing much."]) == [
+        result, local_analyzer.analyze_journal_entry("Nothing much."),
+    ]
+    assert local_analyzer.analyze_journal_entry("")["mood"] == "neutral"
+
+def test_local_subtask_hints():
+    hints = local_analyzer.suggest_subtasks("Fix login bug and email the team ASAP")
+    assert hints[0] == "Do this first: it's marked as urgent"
+    assert hints[1:] == ["Subtask: Fix login bug", "Subtask: email the team ASAP"]
+    assert local_analyzer.suggest_subtasks("Water plants") == ["Break it into steps of 30 minutes or less"]
+
+@pytest.mark.asyncio
+async def test_slow_llm_falls_back_and_records_the_late_result(monkeypatch):
+    service = AIService()
+
+    async def slow_chat(operation, messages, model="gpt-4"):
+        await asyncio.sleep(0.2)
+        return json.dumps({"mood": "hopeful", "themes": ["llm"], "action_items": [], "emotional_patterns": []})
+
+    monkeypatch.setattr(service, "_chat", slow_chat)
+    monkeypatch.setattr(settings, "AI_LATENCY_BUDGET", 0.05)
+    result = await service.analyze_journal_entry(ENTRY, result_key=("journal_entries", "late-1"))
+    assert result["source"] == "local"
+    assert late_results.get("journal_entries", "late-1") is None
+
+    await asyncio.sleep(0.3)
+    late = late_results.get("journal_entries", "late-1")
+    assert late["operation"] == "journal_analysis"
+    assert late["result"]["mood"] == "hopeful"
+
+@pytest.mark.asyncio
+async def test_llm_errors_fall_back_to_local_results(monkeypatch):
+    service = AIService()
+
+    async def broken_chat(operation, messages, model="gpt-4"):
+        return "not json"
+
+    monkeypatch.setattr(service, "_chat", broken_chat)
+    result = await service.analyze_journal_entry(ENTRY)
+    assert result["source"] == "local"
+    suggestions = await service.generate_todo_suggestions("Call the bank")
+    assert suggestions == ["not json"]  # free text is a valid suggestion list
@@ -0,0 +1,83 @@
+import gzip
+import json
+import random
+from datetime import datetime
+import pytest
+from ..services.db_service import DatabaseService, init_db
+from ..services.markets import choose_resolution, downsample, ohlcv, read_ticks, replay, to_ms
+from ..utils import generate_uuid
+
+T0 = 1_700_000_040_000  # 2023-11-14 22:14:00 UTC, on a minute boundary
+
+def _naive_candles(ticks, resolution):
+    candles = {}
+    for symbol, ts, price, size in ticks:
+        key = (symbol, ts - ts % (resolution * 1000))
+        candle = candles.get(key)
+        if candle is None:
+            candles[key] = candle = {"open": price, "high": price, "low": price, "volume": 0.0, "trades": 0,
+                                     "first_ts": ts, "last_ts": ts, "close": price}
+        if ts < candle["first_ts"]:
+            candle["open"], candle["first_ts"] = price, ts
+        if ts >= candle["last_ts"]:
+            candle["close"], candle["last_ts"] = price, ts
+        candle["high"], candle["low"] = max(candle["high"], price), min(candle["low"], price)
+        candle["volume"] += size
+        candle["trades"] += 1
+    return candles
+
+def test_downsample_matches_a_tick_by_tick_rollup():
+    rng = random.Random(1)
+    ticks = [(rng.choice("AB"), T0 + rng.randrange(3 * 3600 * 1000), rng.uniform(90, 110), rng.random())
+             for _ in range(5000)]
+    candles = downsample(ticks)
+    for resolution in (60, 3600, 86400):
+        expected = _naive_candles(ticks, resolution)
+        actual = {(c["symbol"], c["start"]): c for c in candles if c["resolution"] == resolution}
+        assert actual.keys() == expected.keys()
+        for key, candle in expected.items():
+            assert {name: actual[key][name] for name in candle} == pytest.approx(candle)
+
+def test_read_ticks_and_times(tmp_path):
+    csv_path = tmp_path / "ticks.csv"
+    csv_path.write_text("timestamp,symbol,price,qty\n1700000040,btcusdt,100.5,2\nnot-a-time,BTCUSDT,1,1\n")
+    jsonl_path = tmp_path / "trades.jsonl.gz"
+    with gzip.open(jsonl_path, "wt") as f:
+        f.write(json.dumps({"e": "trade", "s": "ETHUSDT", "p": "2000.1", "q": "0.5", "T": T0 + 5}) + "\n")
+    assert list(read_ticks(str(csv_path))) == [("BTCUSDT", T0, 100.5, 2.0)]
+    assert list(read_ticks(str(jsonl_path))) == [("ETHUSDT", T0 + 5, 2000.1, 0.5)]
+    assert to_ms("2023-11-14T22:14:00Z") == to_ms(datetime(2023, 11, 14, 22, 14)) == T0
+    assert choose_resolution(T0, T0 + 3600 * 1000, 500) == 60
+    assert choose_resolution(T0, T0 + 20 * 86400 * 1000, 500) == 3600
+    assert choose_resolution(T0, T0 + 3 * 365 * 86400 * 1000, 500) == 86400
+
+@pytest.mark.asyncio
+async def test_replay_resumes_after_stored_ticks(tmp_path):
+    path = tmp_path / "ticks.csv"
+    path.write_text("ts,symbol,price,size\n" + "".join(f"{T0 + i},A,{i},1\n" for i in range(10)))
+    batches = [batch async for batch in replay(str(path), {"A": T0 + 4}, batch_size=3)]
+    assert [[tick[1] - T0 for tick in batch] for batch in batches] == [[5, 6, 7], [8, 9]]
+
+@pytest.mark.asyncio
+async def test_batches_merge_into_stored_candles():
+    await init_db()
+    db = DatabaseService()
+    symbol = f"TEST{generate_uuid()[:8]}".upper()
+    ticks = [(symbol, T0 + i * 1000, 100.0 + i, 1.0) for i in range(180)]  # three minutes
+    # Out of order across batches: the second batch holds the first tick of each minute
+    late, early = ticks[1::2], ticks[0::2]
+    for batch in (late, early):
+        await db.append_ticks(batch, downsample(batch))
+    assert (await db.get_tick_high_water())[symbol] == T0 + 179 * 1000
+
+    minutes = await ohlcv(db, symbol.lower(), datetime.utcfromtimestamp(T0 / 1000),
+                          datetime.utcfromtimestamp(T0 / 1000 + 3600))
+    assert minutes["resolution"] == "1m"
+    assert [(c["open"], c["high"], c["low"], c["close"], c["volume"], c["trades"]) for c in minutes["candles"]] == [
+        (100.0, 159.0, 100.0, 159.0, 60.0, 60), (160.0, 219.0, 160.0, 219.0, 60.0, 60),
+        (220.0, 279.0, 220.0, 279.0, 60.0, 60),
+    ]
+    hours = await ohlcv(db, symbol, end=datetime.utcfromtimestamp(T0 / 1000 + 3600), resolution="1h", limit=2)
+    assert [(c["open"], c["close"], c["trades"]) for c in hours["candles"]] == [(100.0, 279.0, 180)]
+    limited = await ohlcv(db, symbol, datetime.utcfromtimestamp(T0 / 1000), resolution="1m", limit=2)
+    assert len(limited["candles"]) == 2
@@ -0,0 +1,68 @@
+import openai
+import pytest
+from openai.util import convert_to_openai_object
+from ..config import settings
+from ..services import model_router as router_module
+from ..services.ai_service import PRODUCTIVITY_INSIGHTS, AIService
+from ..services.model_router import ModelRouter, count_message_tokens, count_tokens, fit_values, parse_routes
+
+def _router(**kwargs):
+    options = {"max_tokens": 1000, "fast_max_prompt_tokens": 100, "latency_slo": 2.0, **kwargs}
+    return ModelRouter(
+        {"fast": "small-model", "default": "big-model"},
+        parse_routes("suggest=fast:200, insights=default:5000"), **options,
+    )
+
+def test_parse_routes():
+    assert parse_routes("a=fast:300,b=default") == {"a": ("fast", 300), "b": ("default", None)}
+    with pytest.raises(ValueError):
+        parse_routes("a=huge")
+
+def test_routes_by_task_prompt_size_and_latency():
+    router = _router()
+    assert router.route("suggest", 50)[1:] == ("fast", "small-model", 200, "task")
+    assert router.route("suggest", 500)[1:] == ("default", "big-model", 200, "prompt_size")
+    # Output caps never exceed MAX_TOKENS; unknown operations get the default tier
+    assert router.route("insights", 50).max_tokens == 1000
+    assert router.route("other", 50)[1:] == ("default", "big-model", 1000, "task")
+
+    router.observe("big-model", 5.0)
+    router.observe("small-model", 0.5)
+    routes = [router.route("insights", 50) for _ in range(router_module.PROBE_EVERY)]
+    assert {route.reason for route in routes[:-1]} == {"latency_slo"}
+    assert routes[-1].reason == "probe" and routes[-1].model == "big-model"
+    # Too long for the fast model, so it waits for the default one
+    assert router.route("insights", 500).tier == "default"
+    for _ in range(20):
+        router.observe("big-model", 1.0)
+    assert router.route("insights", 50).reason == "task"
+
+def test_prompts_fit_the_token_budget():
+    values = {"short": "a few words", "long": "word " * 5000}
+    fitted = fit_values(values, 300)
+    assert fitted["short"] == values["short"]
+    assert count_tokens(fitted["short"]) + count_tokens(fitted["long"]) <= 300
+
+    messages = PRODUCTIVITY_INSIGHTS.messages(budget=400, todos=[{"title": "x" * 40}] * 500, journal_entries=[],
+                                              goals=[{"title": "Ship"}])
+    assert count_message_tokens(messages) <= 400
+    assert "Goals: [{'title': 'Ship'}]" in messages[1]["content"]
+    assert messages[1]["content"].endswith("Format the response as a JSON object.")
+
+@pytest.mark.asyncio
+async def test_chat_uses_the_routed_model_and_limits(monkeypatch):
+    service = AIService()
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return convert_to_openai_object(
+            {"choices": [{"message": {"content": "1. Plan\n2. Do"}}], "usage": {"prompt_tokens": 9}}
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", create)
+    monkeypatch.setattr(settings, "AI_LATENCY_BUDGET", 0)
+    assert await service.generate_todo_suggestions("Write report") == ["1. Plan", "2. Do"]
+    assert calls[0]["model"] == settings.AI_FAST_MODEL
+    assert calls[0]["max_tokens"] == 300
+    assert calls[0]["temperature"] == settings.TEMPERATURE
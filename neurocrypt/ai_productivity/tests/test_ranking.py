@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from ..services import ranking
+from ..services.db_service import DatabaseService, init_db
+from ..utils import generate_uuid
+
+def todo(**fields):
+    defaults = {"due_date": None, "priority": 1, "created_at": None, "goal_id": None, "completed": False}
+    return SimpleNamespace(**{**defaults, **fields})
+
+def test_default_score_orders_by_urgency_then_priority():
+    now = datetime(2024, 6, 1)
+    overdue = todo(due_date=now - timedelta(days=2))
+    tomorrow = todo(due_date=now + timedelta(days=1), priority=3)
+    top_priority = todo(priority=5)
+    next_month = todo(due_date=now + timedelta(days=30), priority=3)
+    linked = todo(goal_id="g")
+    scores = [ranking.default_score(t, now) for t in (overdue, tomorrow, top_priority, next_month, linked, todo())]
+    assert scores == sorted(scores, reverse=True)
+    assert ranking.default_score(todo(completed=True, priority=5, due_date=now), now) < scores[-1]
+
+def test_cursor_round_trips_and_rejects_garbage():
+    assert ranking.decode_cursor(ranking.encode_cursor(2.5, "abc")) == (2.5, "abc")
+    with pytest.raises(ValueError):
+        ranking.decode_cursor("not a cursor")
+
+@pytest.mark.asyncio
+async def test_smart_order_pages_by_keyset_without_gaps():
+    await init_db()
+    db = DatabaseService()
+    now = datetime.utcnow()
+    soon = await db.create_todo({"id": generate_uuid(), "title": "Soon", "due_date": now + timedelta(hours=2)})
+    later = await db.create_todo({"id": generate_uuid(), "title": "Later", "due_date": now + timedelta(days=20)})
+    done = await db.create_todo({"id": generate_uuid(), "title": "Done", "completed": True})
+
+    seen, after = [], None
+    while True:
+        page = await db.get_todos_ranked(limit=2, after=after)
+        seen.extend(page)
+        if len(page) < 2:
+            break
+        after = (page[-1].rank_score, page[-1].id)
+    keys = [(t.rank_score, t.id) for t in seen]
+    assert keys == sorted(keys, reverse=True)
+    assert len({t.id for t in seen}) == len(seen)
+    ids = [t.id for t in seen]
+    assert ids.index(soon.id) < ids.index(later.id) < ids.index(done.id)
+
+@pytest.mark.asyncio
+async def test_sweep_rescores_without_touching_versions(monkeypatch):
+    await init_db()
+    db = DatabaseService()
+    created = await db.create_todo({
+        "id": generate_uuid(), "title": "Due", "due_date": datetime.utcnow() + timedelta(days=1),
+    })
+    monkeypatch.setattr(ranking, "scorer", lambda t, now: 42.0)
+
+    assert await db.refresh_rank_scores(timedelta(days=2)) >= 1
+    refreshed = await db.get_todo(created.id)
+    assert refreshed.rank_score == 42.0
+    assert (refreshed.version, refreshed.seq) == (created.version, created.seq)
+    assert refreshed.updated_at == created.updated_at
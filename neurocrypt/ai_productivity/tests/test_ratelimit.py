@@ -0,0 +1,61 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..ratelimit import RateLimitMiddleware, RateLimiter, TokenBuckets
+
+limiter = RateLimiter(
+    {"crud": (1.0, 3), "ai": (0.1, 1)}, "POST /items/,/ai/*", "/health", backend="local",
+    api_keys="client-1,client-2",
+)
+app = FastAPI()
+app.add_middleware(RateLimitMiddleware, limiter=limiter)
+
+@app.get("/items/")
+@app.post("/items/")
+@app.get("/ai/insights")
+@app.get("/health")
+async def handler():
+    return {"ok": True}
+
+client = TestClient(app)
+
+def test_token_bucket_refills_at_its_rate():
+    buckets = TokenBuckets(rate=2.0, burst=2)
+    assert buckets.take("a", 0.0) == 0.0
+    assert buckets.take("a", 0.0) == 0.0
+    assert buckets.take("a", 0.0) == 0.5
+    assert buckets.take("a", 0.25) == 0.25  # half a token refilled so far
+    assert buckets.take("a", 0.5) == 0.0
+    assert buckets.take("b", 0.5) == 0.0  # separate key, separate bucket
+
+def test_prune_forgets_idle_buckets_first():
+    buckets = TokenBuckets(rate=1.0, burst=1, max_keys=2)
+    buckets.take("idle", 0.0)
+    buckets.take("busy", 10.0)
+    buckets.take("new", 10.0)
+    assert set(buckets._buckets) == {"busy", "new"}
+
+def test_classification():
+    assert limiter.classify("POST", "/items/") == "ai"
+    assert limiter.classify("GET", "/items/") == "crud"
+    assert limiter.classify("GET", "/ai/insights") == "ai"
+    assert limiter.classify("GET", "/health") is None
+    assert limiter.classify("OPTIONS", "/items/") is None
+
+def test_over_limit_requests_get_429_per_client_and_bucket():
+    key = {"X-API-Key": "client-1"}
+    assert [client.get("/items/", headers=key).status_code for _ in range(3)] == [200, 200, 200]
+    response = client.get("/items/", headers=key)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+    # The AI bucket and other clients are unaffected
+    assert client.post("/items/", headers=key).status_code == 200
+    assert client.post("/items/", headers=key).headers["retry-after"] == "10"
+    assert client.get("/items/", headers={"Authorization": "Bearer client-2"}).status_code == 200
+    assert all(client.get("/health", headers=key).status_code == 200 for _ in range(5))
+
+def test_unknown_api_keys_share_the_client_address_bucket():
+    assert [client.get("/items/", headers={"X-API-Key": f"made-up-{i}"}).status_code for i in range(4)] == [
+        200, 200, 200, 429,
+    ]
+    assert client.get("/items/", headers={"Authorization": "Bearer made-up"}).status_code == 429
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from ..services import reminders as reminders_module
+from ..services.reminders import ReminderEngine, ReminderHeap
+
+def test_heap_pops_in_order_and_skips_superseded_entries():
+    heap = ReminderHeap()
+    heap.push(("todos", "a"), 30.0)
+    heap.push(("todos", "b"), 10.0)
+    heap.push(("goals", "c"), 20.0)
+    heap.push(("todos", "b"), 40.0)  # rescheduled
+    heap.discard(("goals", "c"))
+
+    assert len(heap) == 2
+    assert heap.next_time() == 30.0
+    assert heap.pop_due(35.0) == [(("todos", "a"), 30.0)]
+    assert heap.pop_due(100.0) == [(("todos", "b"), 40.0)]
+    assert heap.next_time() is None
+
+@pytest.mark.asyncio
+async def test_engine_fires_loaded_and_observed_reminders(monkeypatch):
+    published = []
+    monkeypatch.setattr(reminders_module.change_feed, "publish", lambda *args: published.append(args))
+    soon = datetime.utcnow() + timedelta(milliseconds=100)
+
+    async def loader(after):
+        yield "acme", "goals", "g1", soon
+
+    engine = ReminderEngine(sinks=["change_feed"])
+    engine.start(loader)
+    await asyncio.sleep(0.02)
+    engine.observe("todos", "create", {"id": "t1", "due_date": soon, "completed": False})
+    engine.observe("todos", "create", {"id": "t2", "due_date": soon, "completed": False})
+    engine.observe("todos", "update", {"id": "t2", "due_date": soon, "completed": True})
+    assert len(engine.heap) == 2
+
+    await asyncio.sleep(0.3)
+    assert engine.fired == 2
+    assert len(engine.heap) == 0
+    # Each reminder goes to the tenant that owns the row
+    assert sorted((entity, row["id"], row["tenant_id"]) for entity, _, row in published) == [
+        ("goals", "g1", "acme"), ("todos", "t1", "default"),
+    ]
+    await engine.stop()
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from ..services.db_service import Base, Todo, Tombstone, _upgrade_schema, init_db, router
+from ..utils import generate_uuid
+
+# Tables as the first releases created them
+OLD_SCHEMA = (
+    "CREATE TABLE todos (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR, priority INTEGER,"
+    " due_date DATETIME, completed BOOLEAN, created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE goals (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR, target_date DATETIME,"
+    " progress FLOAT, status VARCHAR, created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE tombstones (seq INTEGER PRIMARY KEY, entity VARCHAR NOT NULL, entity_id VARCHAR NOT NULL,"
+    " deleted_at DATETIME NOT NULL)",
+    "INSERT INTO todos (id, title, priority, completed) VALUES ('t1', 'Old todo', 1, 0)",
+    "INSERT INTO tombstones VALUES (7, 'todos', 't0', '2024-01-01 00:00:00')",
+)
+
+@pytest.mark.asyncio
+async def test_old_tables_are_upgraded_in_place(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/old.db")
+    async with engine.begin() as conn:
+        for statement in OLD_SCHEMA:
+            await conn.exec_driver_sql(statement)
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade_schema)
+        await conn.run_sync(Base.metadata.create_all)
+    async with engine.begin() as conn:
+        todo = (await conn.execute(select(Todo.__table__))).mappings().one()
+        assert (todo["title"], todo["version"], todo["tenant_id"], todo["seq"]) == ("Old todo", 1, "default", None)
+        tombstone = (await conn.execute(select(Tombstone.__table__))).mappings().one()
+        assert (tombstone["tenant_id"], tombstone["seq"], tombstone["entity_id"]) == ("default", 7, "t0")
+        indexes = await conn.run_sync(lambda sync: {index["name"] for index in inspect(sync).get_indexes("todos")})
+        assert "ix_todos_tenant_seq" in indexes
+        # A second pass finds nothing to do
+        await conn.run_sync(_upgrade_schema)
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_rows_without_a_sequence_number_get_one():
+    await init_db()
+    todo_id = generate_uuid()
+    async with router.shard_for().engine.begin() as conn:
+        await conn.execute(Todo.__table__.insert().values(id=todo_id, title="From before sync", version=1))
+    await init_db()
+    async with router.shard_for().engine.begin() as conn:
+        assert (await conn.execute(select(Todo.seq).where(Todo.id == todo_id))).scalar() is not None
@@ -0,0 +1,47 @@
+from datetime import timedelta
+import pytest
+from ..services.db_service import DatabaseService, init_db
+from ..utils import generate_uuid
+
+async def _drain(db, since, limit):
+    changes = []
+    while True:
+        page = await db.get_changes_since(since, limit)
+        changes.extend(page["changes"])
+        since = page["next_since"]
+        if not page["has_more"]:
+            return changes, since
+
+@pytest.mark.asyncio
+async def test_changes_since_pages_through_writes_and_deletes():
+    await init_db()
+    db = DatabaseService()
+    since = (await db.get_changes_since(0, 1))["next_since"]
+    since = (await _drain(db, since, 100))[1]
+
+    todo = await db.create_todo({"id": generate_uuid(), "title": "Ship sync"})
+    goal = await db.create_goal({"id": generate_uuid(), "title": "Offline mode"})
+    await db.update_todo(todo.id, {"completed": True})
+    await db.delete_goal(goal.id)
+
+    changes, next_since = await _drain(db, since, 1)
+    assert [(c["entity"], c["op"], c["data"]["id"]) for c in changes] == [
+        ("todos", "upsert", todo.id),
+        ("goals", "delete", goal.id),
+    ]
+    assert changes[0]["data"]["completed"] is True
+    assert [c["seq"] for c in changes] == sorted(c["seq"] for c in changes)
+    assert (await db.get_changes_since(next_since, 10))["changes"] == []
+
+@pytest.mark.asyncio
+async def test_compaction_prunes_tombstones_and_raises_floor():
+    await init_db()
+    db = DatabaseService()
+    goal = await db.create_goal({"id": generate_uuid(), "title": "Temporary"})
+    await db.delete_goal(goal.id)
+
+    assert await db.compact_tombstones(timedelta(0)) >= 1
+    floor = await db.get_tombstone_floor()
+    assert floor >= goal.seq
+    page = await db.get_changes_since(floor, 10)
+    assert all(c["op"] != "delete" for c in page["changes"])
@@ -0,0 +1,22 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..telemetry import TelemetryMiddleware, render_prometheus
+
+app = FastAPI()
+app.add_middleware(TelemetryMiddleware)
+
+@app.get("/things/{thing_id}")
+async def get_thing(thing_id: str):
+    return {"id": thing_id}
+
+client = TestClient(app)
+
+def test_route_latency_is_exported_by_template():
+    assert client.get("/things/42").status_code == 200
+    assert client.get("/things/43").status_code == 200
+
+    text = render_prometheus()
+    assert "# TYPE http_server_duration_ms histogram" in text
+    assert 'http_server_duration_ms_count{method="GET",route="/things/{thing_id}",status="200"} 2' in text
+    assert 'le="+Inf"' in text
+    assert "/things/42" not in text
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.testclient import TestClient
+from sqlalchemy import delete
+from ..services.db_service import (
+    DatabaseService, TenantShard, async_session, init_db, load_tenant_placements, next_seq, router,
+)
+from ..services.shards import TenantMoved, current_tenant, parse_shards
+from ..tenants import TenantMiddleware, move_tenant
+from ..utils import generate_uuid
+
+def _as(tenant):
+    return current_tenant.set(tenant)
+
+def test_parse_shards_and_middleware():
+    assert parse_shards(" big=sqlite+aiosqlite:///big.db, eu=postgresql+asyncpg://db/x ") == {
+        "big": "sqlite+aiosqlite:///big.db", "eu": "postgresql+asyncpg://db/x",
+    }
+    with pytest.raises(ValueError):
+        parse_shards("no-url")
+
+    inner = Starlette()
+    inner.add_route("/", lambda request: PlainTextResponse(current_tenant.get()))
+    client = TestClient(TenantMiddleware(inner, header="X-Tenant-ID"))
+    assert client.get("/").text == "default"
+    assert client.get("/", headers={"X-Tenant-ID": "acme"}).text == "acme"
+    assert client.get("/", headers={"X-Tenant-ID": "../etc"}).status_code == 400
+
+@pytest.mark.asyncio
+async def test_tenants_only_see_their_own_rows():
+    await init_db()
+    db = DatabaseService()
+    a, b = f"a{generate_uuid()[:8]}", f"b{generate_uuid()[:8]}"
+    token = _as(a)
+    try:
+        goal = await db.create_goal({"id": generate_uuid(), "title": "A goal"})
+        todo = await db.create_todo({"id": generate_uuid(), "title": "A todo", "goal_id": goal.id, "tenant_id": b})
+        assert todo.tenant_id == a
+        assert len((await db.get_changes_since(0, 100))["changes"]) == 2
+    finally:
+        current_tenant.reset(token)
+
+    token = _as(b)
+    try:
+        assert await db.get_todo(todo.id) is None
+        assert await db.update_todo(todo.id, {"title": "Hijacked"}) is None
+        assert await db.delete_todo(todo.id) is False
+        assert await db.get_todos() == [] and await db.get_goals() == []
+        assert (await db.get_changes_since(0, 100))["changes"] == []
+        with pytest.raises(ValueError):
+            await db.create_todo({"id": generate_uuid(), "title": "Cross-tenant link", "goal_id": goal.id})
+        # An import can't take over another tenant's row either
+        await db.bulk_upsert("todos", [{"id": todo.id, "title": "Imported"}])
+    finally:
+        current_tenant.reset(token)
+
+    token = _as(a)
+    try:
+        assert (await db.get_todo(todo.id)).title == "A todo"
+    finally:
+        current_tenant.reset(token)
+
+@pytest.mark.asyncio
+async def test_move_tenant_while_it_writes(tmp_path):
+    router.urls["moved"] = f"sqlite+aiosqlite:///{tmp_path}/moved.db"
+    tenant = f"m{generate_uuid()[:8]}"
+    token = _as(tenant)
+    try:
+        await init_db()
+        db = DatabaseService()
+        goal = await db.create_goal({"id": generate_uuid(), "title": "Goal"})
+        todos = [await db.create_todo({"id": generate_uuid(), "title": f"Todo {i}", "goal_id": goal.id})
+                 for i in range(20)]
+        gone = await db.create_journal_entry({"id": generate_uuid(), "content": "Deleted before the move"})
+        await db.delete_journal_entry(gone.id)
+        position = await db.get_sync_position()
+
+        written, stop = [], asyncio.Event()
+
+        async def writer():
+            while not stop.is_set():
+                written.append((await db.create_todo({"id": generate_uuid(), "title": "During the move"})).id)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(writer())
+        stats = await move_tenant(tenant, "moved", batch_size=7, settle_rows=0, grace=0)
+        stop.set()
+        await task
+        assert router.shard_for(tenant).name == "moved" and stats["removed"] > 0
+
+        # Writes that hit the fence on the old shard landed on the new one
+        assert {todo.id for todo in await db.get_todos(limit=1000)} == {t.id for t in todos} | set(written)
+        assert (await db.get_goal(goal.id)).todo_count == 20
+        assert await db.get_sync_position() >= position + len(written) - 1
+        changes = (await db.get_changes_since(0, 1000))["changes"]
+        assert [change["op"] for change in changes if change["data"]["id"] == gone.id] == ["delete"]
+
+        # A write on the old shard is fenced off
+        router.placements.pop(tenant)
+        with pytest.raises(TenantMoved):
+            async with router.session() as session:
+                await next_seq(session)
+        await load_tenant_placements()
+        assert router.shard_for(tenant).name == "moved"
+        assert (await db.update_todo(todos[0].id, {"completed": True})).completed
+    finally:
+        current_tenant.reset(token)
+        async with async_session() as session:
+            await session.execute(delete(TenantShard).where(TenantShard.tenant_id == tenant))
+            await session.commit()
+        router.placements.pop(tenant, None)
+        await router.dispose()
+        router.urls.pop("moved")
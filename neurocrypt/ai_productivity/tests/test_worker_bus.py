@@ -0,0 +1,53 @@
+import json
+import queue
+from ..services.worker_bus import LocalSocketTransport, WorkerBus
+
+def test_local_bus_delivers_to_other_workers_only(tmp_path):
+    first = WorkerBus("local", socket_dir=str(tmp_path))
+    second = WorkerBus("local", socket_dir=str(tmp_path))
+    received_first, received_second = queue.Queue(), queue.Queue()
+    first.subscribe("invalidate", received_first.put)
+    second.subscribe("invalidate", received_second.put)
+    first.start()
+    second.start()
+    try:
+        assert isinstance(first.transport, LocalSocketTransport)
+        first.publish("invalidate", {"collection": "todos"})
+        assert received_second.get(timeout=2) == {"collection": "todos"}
+        assert received_first.empty()
+    finally:
+        first.stop()
+        second.stop()
+
+def test_bus_without_peers_is_a_no_op():
+    bus = WorkerBus("auto", redis_url=None, socket_dir=None)
+    bus.start()
+    assert bus.transport is None
+    bus.publish("invalidate", {"collection": "todos"})
+
+def test_gap_in_sequence_numbers_calls_gap_handlers():
+    bus = WorkerBus("local")
+    gaps = []
+    bus.on_gap(lambda: gaps.append(True))
+    for seq in (1, 2, 3, 5, 4):
+        bus._dispatch(json.dumps({"origin": "peer", "channel": "invalidate", "data": {}, "seq": seq}).encode())
+    assert gaps == [True]
+
+def test_oversize_messages_are_split_and_the_listener_survives(tmp_path):
+    first = WorkerBus("local", socket_dir=str(tmp_path))
+    second = WorkerBus("local", socket_dir=str(tmp_path))
+    received = queue.Queue()
+    second.subscribe("ai_results", received.put)
+    first.start()
+    second.start()
+    try:
+        big = {"text": "x" * 200_000}
+        first.publish("ai_results", big)
+        assert received.get(timeout=2) == big
+        # A datagram too long for one read is dropped without taking the listener down
+        second.transport.sock.sendto(b"{" * 100_000, second.transport.path)
+        first.publish("ai_results", {"text": "small"})
+        assert received.get(timeout=2) == {"text": "small"}
+    finally:
+        first.stop()
+        second.stop()
@@ -5,6 +5,7 @@ import json
 from fastapi import HTTPException
 import redis
 from .config import settings
+from .services.shards import TenantMoved
 
 # Redis client
 redis_client = redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
@@ -56,7 +57,9 @@ def validate_json_data(data: Dict[str, Any], required_fields: list) -> bool:
 
 def handle_error(error: Exception) -> HTTPException:
     """Handle common errors and return appropriate HTTP exceptions."""
-    if isinstance(error, ValueError):
+    if isinstance(error, TenantMoved):
+        return HTTPException(status_code=503, detail=str(error))
+    elif isinstance(error, ValueError):
         return HTTPException(status_code=400, detail=str(error))
     elif isinstance(error, KeyError):
         return HTTPException(status_code=400, detail=f"Missing required field: {str(error)}")
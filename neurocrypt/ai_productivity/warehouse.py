@@ -0,0 +1,292 @@
+"""
+Bulk Parquet export and import of todos, journal entries and goals.
+
+    python -m neurocrypt.ai_productivity.warehouse export ./warehouse --partition-by day --incremental
+    python -m neurocrypt.ai_productivity.warehouse import ./warehouse/todos
+
+- Rows are streamed from the database and written one row group at a time, so
+  memory is bounded by ``--row-group-size`` whatever the table size.
+- ``--partition-by day|month`` writes Hive-style ``created_date=YYYY-MM-DD``
+  directories. Rows are read in creation order, so only one file is open at a time.
+- ``--incremental`` exports only rows written since the previous run, plus the
+  tombstones of rows deleted since, into new files next to the earlier ones.
+  The cursor is the tenant's change sequence number (kept in
+  ``_export_state.json``), so unlike timestamps it never misses a row committed
+  late or stamped by a skewed clock, and never exports the same write twice.
+- The importer reads row groups back and writes them with one batched upsert
+  per group.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Union
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer, String
+from .services.db_service import EXPORT_TABLES, MODELS, DatabaseService, init_db
+
+ARROW_TYPES = {
+    String: pa.string(),
+    Integer: pa.int64(),
+    Float: pa.float64(),
+    Boolean: pa.bool_(),
+    DateTime: pa.timestamp("us"),
+    JSON: pa.string(),  # JSON-encoded; flagged in the field metadata
+}
+
+STATE_FILE = "_export_state.json"
+PARTITION_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+def arrow_schema(table: str) -> pa.Schema:
+    model = EXPORT_TABLES[table][0]
+    fields = []
+    for column in model.__table__.columns:
+        arrow_type = next(t for sql_type, t in ARROW_TYPES.items() if isinstance(column.type, sql_type))
+        metadata = {"json": "1"} if isinstance(column.type, JSON) else None
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable, metadata=metadata))
+    return pa.schema(fields, metadata={"neurocrypt.table": table})
+
+def _json_columns(schema: pa.Schema) -> List[str]:
+    return [field.name for field in schema if field.metadata and field.metadata.get(b"json") == b"1"]
+
+def to_record_batch(rows: List[dict], schema: pa.Schema) -> pa.RecordBatch:
+    json_columns = set(_json_columns(schema))
+    arrays = []
+    for field in schema:
+        values = [row[field.name] for row in rows]
+        if field.name in json_columns:
+            values = [None if value is None else json.dumps(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def from_record_batch(batch: pa.RecordBatch) -> List[dict]:
+    rows = batch.to_pylist()
+    for name in _json_columns(batch.schema):
+        for row in rows:
+            if row[name] is not None:
+                row[name] = json.loads(row[name])
+    return rows
+
+class _StreamSink:
+    """Write-only file object that hands its bytes out as they are produced."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return data
+
+async def stream_parquet(
+    db_service: DatabaseService, table: str, changed_since: Optional[datetime] = None,
+    row_group_size: int = 65536, compression: str = "zstd",
+) -> AsyncIterator[bytes]:
+    """One Parquet file for ``table``, yielded a row group at a time (for HTTP responses)."""
+    schema = arrow_schema(table)
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression=compression)
+    try:
+        async for rows in db_service.iter_rows(table, changed_since, row_group_size):
+            writer.write_batch(to_record_batch(rows, schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+class _PartitionedWriter:
+    """Writes row groups to ``<root>/<table>/[created_date=...]/part-<run>.parquet``, one file open at a time."""
+
+    def __init__(self, root: str, table: str, schema: pa.Schema, partition_by: Optional[str], compression: str):
+        self.directory = os.path.join(root, table)
+        self.schema = schema
+        self.partition_by = partition_by
+        self.compression = compression
+        self.run = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        self.partition_column = "deleted_at" if table == "tombstones" else "created_at"
+        self.files: List[str] = []
+        self._key = None
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write(self, rows: List[dict]) -> None:
+        if not self.partition_by:
+            self._write_partition(None, rows)
+            return
+        date_format = PARTITION_FORMATS[self.partition_by]
+        start = 0
+        keys = [row[self.partition_column].strftime(date_format) if row[self.partition_column] else "unknown"
+                for row in rows]
+        for index in range(1, len(rows) + 1):
+            if index == len(rows) or keys[index] != keys[start]:
+                self._write_partition(keys[start], rows[start:index])
+                start = index
+
+    def _write_partition(self, key: Optional[str], rows: List[dict]) -> None:
+        if self._writer is None or key != self._key:
+            self.close()
+            partition = f"{self.partition_column[:-len('_at')]}_date={key}"
+            directory = self.directory if key is None else os.path.join(self.directory, partition)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{self.run}.parquet")
+            self._writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+            self._key = key
+            self.files.append(path)
+        self._writer.write_batch(to_record_batch(rows, self.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+def _load_state(root: str) -> Dict[str, Union[int, str]]:
+    try:
+        with open(os.path.join(root, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+async def export_tables(
+    db_service: DatabaseService, root: str, tables: Iterable[str] = tuple(MODELS),
+    partition_by: Optional[str] = None, incremental: bool = False, row_group_size: int = 65536,
+    compression: str = "zstd", compare_json: bool = False,
+) -> Dict[str, dict]:
+    """Export ``tables`` under ``root`` and return per-table rows, bytes, MB/s and JSON size ratio."""
+    if partition_by is not None and partition_by not in PARTITION_FORMATS:
+        raise ValueError(f"partition_by must be one of: {', '.join(PARTITION_FORMATS)}")
+    os.makedirs(root, exist_ok=True)
+    state = _load_state(root)
+    tables = list(tables)
+    if incremental and "tombstones" not in tables:
+        tables.append("tombstones")
+    # Every change numbered up to here has committed
+    position = await db_service.get_sync_position()
+    stats = {}
+    for table in tables:
+        cursor = state.get(table) if incremental else None
+        # State written before sequence cursors holds an updated_at timestamp
+        since = datetime.fromisoformat(cursor) if isinstance(cursor, str) else None
+        after = cursor if isinstance(cursor, int) else None
+        schema = arrow_schema(table)
+        writer = _PartitionedWriter(root, table, schema, partition_by, compression)
+        rows_written, json_bytes, json_seconds = 0, 0, 0.0
+        start = time.perf_counter()
+        try:
+            async for rows in db_service.iter_rows(table, since, row_group_size, after, position):
+                rows = [dict(row) for row in rows]
+                writer.write(rows)
+                rows_written += len(rows)
+                if compare_json:
+                    json_start = time.perf_counter()
+                    json_bytes += sum(len(json.dumps(row)) + 1 for row in jsonable_encoder(rows))
+                    json_seconds += time.perf_counter() - json_start
+        finally:
+            writer.close()
+        elapsed = time.perf_counter() - start - json_seconds
+        parquet_bytes = sum(os.path.getsize(path) for path in writer.files)
+        stats[table] = {
+            "rows": rows_written,
+            "files": len(writer.files),
+            "parquet_bytes": parquet_bytes,
+            "seconds": elapsed,
+            "mb_per_s": parquet_bytes / 1e6 / elapsed if elapsed else 0.0,
+            "rows_per_s": rows_written / elapsed if elapsed else 0.0,
+        }
+        if compare_json:
+            stats[table]["json_bytes"] = json_bytes
+            stats[table]["size_ratio"] = json_bytes / parquet_bytes if parquet_bytes else 0.0
+        state[table] = position
+    with open(os.path.join(root, STATE_FILE), "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    return stats
+
+def _parquet_files(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(path) for name in names if name.endswith(".parquet")
+    )
+
+async def import_parquet(
+    db_service: DatabaseService, path: str, table: Optional[str] = None, batch_size: int = 10000,
+) -> Dict[str, dict]:
+    """Upsert every Parquet file under ``path``; the table comes from the file metadata unless given."""
+    stats: Dict[str, dict] = {}
+    for file_path in _parquet_files(path):
+        parquet = pq.ParquetFile(file_path)
+        target = table or parquet.schema_arrow.metadata[b"neurocrypt.table"].decode()
+        if target not in MODELS:
+            continue  # tombstones: the rows they describe are simply absent
+        entry = stats.setdefault(target, {"rows": 0, "parquet_bytes": 0, "seconds": 0.0})
+        columns = [column.name for column in MODELS[target].__table__.columns if column.name != "seq"]
+        start = time.perf_counter()
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+            entry["rows"] += await db_service.bulk_upsert(target, from_record_batch(batch))
+        entry["seconds"] += time.perf_counter() - start
+        entry["parquet_bytes"] += os.path.getsize(file_path)
+    for entry in stats.values():
+        entry["mb_per_s"] = entry["parquet_bytes"] / 1e6 / entry["seconds"] if entry["seconds"] else 0.0
+        entry["rows_per_s"] = entry["rows"] / entry["seconds"] if entry["seconds"] else 0.0
+    if "todos" in stats:
+        await db_service.verify_goal_rollups()
+    return stats
+
+def _print_stats(stats: Dict[str, dict]) -> None:
+    print(f"{'table':<16} {'rows':>10} {'MB':>9} {'MB/s':>8} {'rows/s':>10} {'JSON ratio':>11}")
+    for table, s in stats.items():
+        ratio = f"{s['size_ratio']:.2f}x" if "size_ratio" in s else "-"
+        print(
+            f"{table:<16} {s['rows']:>10} {s['parquet_bytes'] / 1e6:>9.2f} {s['mb_per_s']:>8.2f} "
+            f"{s['rows_per_s']:>10.0f} {ratio:>11}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export tables to Parquet")
+    export.add_argument("directory")
+    export.add_argument("--tables", default=",".join(MODELS), help="Comma-separated table names")
+    export.add_argument("--partition-by", choices=sorted(PARTITION_FORMATS))
+    export.add_argument("--incremental", action="store_true", help="Only rows changed since the last export")
+    export.add_argument("--row-group-size", type=int, default=65536)
+    export.add_argument("--compression", default="zstd")
+    export.add_argument("--compare-json", action="store_true", help="Also measure the size of the same rows as JSON")
+    importer = commands.add_parser("import", help="Upsert Parquet files into the database")
+    importer.add_argument("path", help="A Parquet file or a directory of them")
+    importer.add_argument("--table", choices=sorted(MODELS), help="Defaults to the table recorded in each file")
+    importer.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    async def run():
+        await init_db()
+        db_service = DatabaseService()
+        if args.command == "export":
+            return await export_tables(
+                db_service, args.directory, [t.strip() for t in args.tables.split(",") if t.strip()],
+                args.partition_by, args.incremental, args.row_group_size, args.compression, args.compare_json,
+            )
+        return await import_parquet(db_service, args.path, args.table, args.batch_size)
+
+    _print_stats(asyncio.run(run()))
+
+if __name__ == "__main__":
+    main()